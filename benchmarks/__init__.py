@@ -0,0 +1,3 @@
+# In benchmarks/__init__.py
+#
+# Offline performance benchmarks for the analysis pipeline. See pipeline_bench.py.
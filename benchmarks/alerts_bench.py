@@ -0,0 +1,115 @@
+# In benchmarks/alerts_bench.py
+#
+# One alert cycle over a large synthetic set of watchlists (default 10,000 watch
+# entries over 500 distinct tickers) with random-walk prices and no network: the
+# watchlists are read from a temporary SQLite database, prices are served from memory
+# in place of the yfinance download, and sends are counted instead of delivered.
+# Prints the time of each phase, and an estimate of what evaluating every watch entry
+# separately would cost, for comparison.
+#
+#   python -m benchmarks.alerts_bench --entries 10000 --tickers 500
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from typing import List, Optional
+
+DEFAULT_ENTRIES = 10_000
+DEFAULT_TICKERS = 500
+TRADING_DAYS = 250
+
+
+def synthetic_closes(tickers: List[str], seed: int):
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=TRADING_DAYS)
+    returns = rng.normal(0.0004, 0.018, size=(TRADING_DAYS, len(tickers)))
+    prices = 100 * np.exp(np.cumsum(returns, axis=0))
+    return pd.DataFrame(prices, index=dates, columns=tickers)
+
+def populate_watchlists(db_manager, tickers: List[str], entries: int, seed: int):
+    """Spreads the entries over chats of up to WATCHLIST_MAX_SIZE tickers each, popular tickers more often."""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(tickers))]   # Zipf-like: a few tickers are watched by many
+    conn = db_manager.get_db_connection()
+    rows, chat_id = set(), 1
+    while len(rows) < entries:
+        for ticker in rng.choices(tickers, weights, k=db_manager.WATCHLIST_MAX_SIZE):
+            rows.add((chat_id, ticker))
+            if len(rows) == entries:
+                break
+        chat_id += 1
+    with conn:
+        conn.executemany("INSERT INTO watchlist (chat_id, stock_ticker, added_at) VALUES (?, ?, datetime('now'))", rows)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import db_manager
+    from stock_analyzer import alerts
+
+    db_manager.setup_database()
+    tickers = [f"SYN{i:04d}.NS" for i in range(args.tickers)]
+    closes = synthetic_closes(tickers, args.seed)
+    populate_watchlists(db_manager, tickers, args.entries, args.seed)
+    # Stand-in for the batched yfinance download
+    alerts._download_closes = lambda batch: {ticker: closes[ticker] for ticker in batch if ticker in closes}
+    alerts.ALERT_SENDS_PER_SECOND = float("inf")   # Measure the engine, not Telegram's rate limit
+
+    sent = []
+
+    async def send(chat_id: int, text: str):
+        sent.append(chat_id)
+
+    timings = {}
+    started = time.perf_counter()
+    watchers = await db_manager.aload_watchers()
+    timings["load_watchlists_s"] = time.perf_counter() - started
+    phase = time.perf_counter()
+    frame = await asyncio.to_thread(alerts.load_closes, watchers)
+    timings["load_prices_s"] = time.perf_counter() - phase
+    phase = time.perf_counter()
+    fired = await asyncio.to_thread(alerts.evaluate, frame)
+    timings["evaluate_s"] = time.perf_counter() - phase
+    timings["first_cycle_s"] = time.perf_counter() - started
+
+    # A full cycle as the scheduler runs it (prices now cached, alert log empty again)
+    with db_manager.get_db_connection() as conn:
+        conn.execute("DELETE FROM alert_log")
+    phase = time.perf_counter()
+    stats = await alerts.run_alert_cycle(send)
+    timings["full_cycle_s"] = time.perf_counter() - phase
+
+    # What evaluating each watch entry on its own would cost, extrapolated from a sample
+    sample = [ticker for ticker, chats in watchers.items() for _ in chats][:args.naive_sample]
+    phase = time.perf_counter()
+    for ticker in sample:
+        alerts.evaluate(frame[[ticker]])
+    per_entry = (time.perf_counter() - phase) / max(1, len(sample))
+    return {
+        "watch_entries": stats["watch_entries"], "distinct_tickers": stats["tickers"],
+        "alerts": len(fired), "sends": len(sent),
+        **{name: round(seconds, 3) for name, seconds in timings.items()},
+        "per_entry_estimate_s": round(per_entry * stats["watch_entries"], 2),
+    }
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Time one watchlist alert cycle on synthetic data.")
+    parser.add_argument("--entries", type=int, default=DEFAULT_ENTRIES, help="Watch entries (chat, ticker) in total.")
+    parser.add_argument("--tickers", type=int, default=DEFAULT_TICKERS, help="Distinct tickers they are spread over.")
+    parser.add_argument("--naive-sample", type=int, default=200, help="Entries timed one by one for the per-entry estimate.")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    workdir = tempfile.mkdtemp(prefix="equisage-alerts-bench-")
+    os.environ["SESSIONS_DB"] = os.path.join(workdir, "sessions.db")   # Read when db_manager is imported
+    result = asyncio.run(run(args))
+    for name, value in result.items():
+        print(f"{name:>22}: {value}")
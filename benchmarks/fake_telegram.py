@@ -0,0 +1,167 @@
+# In benchmarks/fake_telegram.py
+#
+# A local stand-in for the Telegram Bot API, for load tests. The bot is pointed at it
+# with TELEGRAM_API_URL. Every send is recorded per chat (so the load generator can see
+# when a reply arrives), and Telegram's flood limits are simulated: sends beyond the
+# global or per-chat rate, or a random fraction of them, are refused with the same 429
+# "retry after" response the real API returns.
+
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# --- Defaults (roughly Telegram's documented limits) ---
+GLOBAL_RATE = 30.0          # Messages per second across all chats
+CHAT_RATE = 1.0             # Messages per second to one chat...
+CHAT_BURST = 5              # ...with short bursts tolerated
+SEND_METHODS = {"sendMessage", "sendPhoto", "sendDocument"}
+
+_MULTIPART_FIELD = re.compile(rb'; name="(?P<name>[^"]+)"\r\n(?:[^\r\n]+\r\n)*\r\n(?P<value>[^\r]*)\r\n')
+
+
+@dataclass
+class Send:
+    chat_id: int
+    method: str
+    text: str
+    at: float                         # time.monotonic() when the request arrived
+    rate_limited: bool = False
+
+
+class _Bucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Takes a token; returns 0, or the seconds until one would be available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+@dataclass
+class FakeTelegram:
+    global_rate: float = GLOBAL_RATE
+    chat_rate: float = CHAT_RATE
+    chat_burst: int = CHAT_BURST
+    error_rate: float = 0.0           # Fraction of sends refused with a 429 regardless of rate
+    latency: float = 0.03             # Seconds added to every API call
+    sends: Dict[int, List[Send]] = field(default_factory=dict)
+    rate_limited: int = 0
+    calls: int = 0
+
+    def __post_init__(self):
+        self._global = _Bucket(self.global_rate, self.global_rate)
+        self._chats: Dict[int, _Bucket] = {}
+        self._changed: Dict[int, asyncio.Event] = {}
+        self._message_ids = iter(range(1, 1 << 62))
+        self.app = self._build_app()
+
+    # --- Observing sends ---
+
+    def sent_to(self, chat_id: int) -> List[Send]:
+        return self.sends.setdefault(chat_id, [])
+
+    async def wait_for(self, chat_id: int, start: int, predicate, timeout: float) -> Optional[Send]:
+        """The first delivered send to `chat_id` at index >= `start` matching `predicate`, or None on timeout."""
+        deadline = time.monotonic() + timeout
+        index = start
+        while True:
+            sends = self.sent_to(chat_id)
+            while index < len(sends):
+                send = sends[index]
+                index += 1
+                if not send.rate_limited and predicate(send):
+                    return send
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            changed = self._changed.setdefault(chat_id, asyncio.Event())
+            changed.clear()
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+
+    def reset_counters(self):
+        self.rate_limited = 0
+        self.calls = 0
+
+    # --- API ---
+
+    def _retry_after(self, chat_id: int) -> float:
+        if self.error_rate and random.random() < self.error_rate:
+            return 1.0
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = _Bucket(self.chat_rate, self.chat_burst)
+        return max(bucket.take(), self._global.take())
+
+    def _record(self, method: str, params: Dict[str, str]) -> Dict[str, Any]:
+        chat_id = int(params.get("chat_id", 0))
+        retry_after = self._retry_after(chat_id)
+        send = Send(chat_id, method, params.get("text") or params.get("caption") or "", time.monotonic(),
+                    rate_limited=retry_after > 0)
+        self.sent_to(chat_id).append(send)
+        self._changed.setdefault(chat_id, asyncio.Event()).set()
+        if retry_after > 0:
+            self.rate_limited += 1
+            seconds = max(1, math.ceil(retry_after))
+            return {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {seconds}",
+                    "parameters": {"retry_after": seconds}}
+        message = {"message_id": next(self._message_ids), "date": int(time.time()),
+                   "chat": {"id": chat_id, "type": "private"}}
+        if method == "sendMessage":
+            message["text"] = send.text
+        elif method == "sendPhoto":
+            message["photo"] = [{"file_id": "photo", "file_unique_id": "photo", "width": 1, "height": 1}]
+        else:
+            message["document"] = {"file_id": "document", "file_unique_id": "document"}
+        return {"ok": True, "result": message}
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake Telegram Bot API")
+
+        @app.api_route("/bot{token}/{method}", methods=["GET", "POST"])
+        async def bot_api(token: str, method: str, request: Request):
+            self.calls += 1
+            params = await _read_params(request)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if method in SEND_METHODS:
+                body = self._record(method, params)
+                return JSONResponse(body, status_code=200 if body["ok"] else 429)
+            if method == "getMe":
+                return {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "EquiSage", "username": "equisage_load_test_bot"}}
+            return {"ok": True, "result": True}   # setWebhook, deleteWebhook, sendChatAction, ...
+
+        return app
+
+
+async def _read_params(request: Request) -> Dict[str, str]:
+    """Form fields of a Bot API call, whether sent url-encoded, as JSON or as multipart (file uploads)."""
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        return {key: str(value) for key, value in json.loads(body or b"{}").items()}
+    if content_type.startswith("multipart/form-data"):
+        # Only the small text fields are needed; file parts are skipped by the pattern
+        return {match["name"].decode(): match["value"].decode("utf-8", "replace")
+                for match in _MULTIPART_FIELD.finditer(body) if len(match["value"]) < 8192}
+    return {key: values[-1] for key, values in parse_qs(body.decode("utf-8", "replace")).items()}
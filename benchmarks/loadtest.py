@@ -0,0 +1,297 @@
+# In benchmarks/loadtest.py
+#
+# Webhook load test. Starts the fake Telegram Bot API (fake_telegram.py) and the bot
+# (loadtest_app.py, with recorded dependencies and a latency profile), then for each
+# concurrency level runs that many simulated chats against /webhook for a fixed time.
+# Each chat posts a synthetic Update drawn from the message mix (/start, analyses,
+# follow-ups), waits for the reply to finish arriving at the fake API, and repeats.
+#
+#   python -m benchmarks.loadtest --concurrency 1,5,10,25 --duration 60 --mix start=1,analysis=6,followup=3
+#
+# Reported per level: completed requests per second, p50/p95/p99 latency to the first
+# reply (the acknowledgement) and to the final one (PDF, follow-up answer, welcome),
+# and error rates (webhook failures, timeouts, error replies, Telegram 429s).
+# Needs the fixtures from `python -m benchmarks.pipeline_bench record`.
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import uvicorn
+
+from benchmarks.fake_telegram import CHAT_BURST, CHAT_RATE, GLOBAL_RATE, FakeTelegram, Send
+from benchmarks.pipeline_bench import SCENARIOS
+from benchmarks.replay import LATENCY_PROFILES
+
+# --- Configuration ---
+MESSAGES = {
+    "start": ["/start"],
+    "analysis": [SCENARIOS["tcs"][0], SCENARIOS["reliance"][0]],
+    "followup": [SCENARIOS["tcs_followup"][1]],
+}
+DEFAULT_MIX = "start=1,analysis=6,followup=3"
+REPLY_TIMEOUT = 180.0
+APP_STARTUP_TIMEOUT = 120.0
+# Mirror main.telegram_webhook's acknowledgements and run_analysis's failure replies
+ACK_PREFIXES = ("Got it!", "Acknowledged!", "Request received!", "Alright, I'm on it!")
+ERROR_PREFIXES = ("Sorry", "Apologies")
+LOADTEST_CHAT_ID = 900_000_000
+
+
+def _is_ack(send: Send) -> bool:
+    return send.method == "sendMessage" and send.text.startswith(ACK_PREFIXES)
+
+def _is_error(send: Send) -> bool:
+    return send.method == "sendMessage" and send.text.startswith(ERROR_PREFIXES)
+
+# The send that completes each kind of request
+FINAL_REPLY: Dict[str, Callable[[Send], bool]] = {
+    "start": lambda send: True,
+    "analysis": lambda send: send.method == "sendDocument" or _is_error(send),
+    "followup": lambda send: send.method == "sendMessage" and not _is_ack(send),
+}
+
+
+@dataclass
+class Result:
+    kind: str
+    first_reply: Optional[float] = None
+    final_reply: Optional[float] = None
+    error: Optional[str] = None       # webhook, timeout or error_reply
+
+
+def _update(update_id: int, chat_id: int, text: str) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"Load {chat_id}"},
+        },
+    }
+
+def _parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in MESSAGES:
+            raise SystemExit(f"Unknown message kind '{kind}'; expected one of {sorted(MESSAGES)}.")
+        weights[kind.strip()] = float(weight or 1)
+    return weights
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace, fake: FakeTelegram):
+        self.args = args
+        self.fake = fake
+        self.mix = _parse_mix(args.mix)
+        self.rng = random.Random(args.seed)
+        self._update_ids = itertools.count(1)
+        self._chat_ids = itertools.count(LOADTEST_CHAT_ID)
+        self.client = httpx.AsyncClient(base_url=args.app_url, timeout=30.0,
+                                        limits=httpx.Limits(max_connections=None, max_keepalive_connections=None))
+
+    async def request(self, chat_id: int, kind: str) -> Result:
+        """Posts one update and waits for its first and final replies."""
+        result = Result(kind)
+        start_index = len(self.fake.sent_to(chat_id))
+        text = self.rng.choice(MESSAGES[kind])
+        started = time.monotonic()
+        try:
+            response = await self.client.post("/webhook", json=_update(next(self._update_ids), chat_id, text))
+            if response.status_code != 200:
+                result.error = "webhook"
+                return result
+        except httpx.HTTPError:
+            result.error = "webhook"
+            return result
+
+        first = await self.fake.wait_for(chat_id, start_index, lambda send: True, self.args.reply_timeout)
+        if first is None:
+            result.error = "timeout"
+            return result
+        result.first_reply = first.at - started
+        final = await self.fake.wait_for(chat_id, start_index, FINAL_REPLY[kind], self.args.reply_timeout - result.first_reply)
+        if final is None:
+            result.error = "timeout"
+            return result
+        result.final_reply = final.at - started
+        if _is_error(final):
+            result.error = "error_reply"
+        return result
+
+    async def chat(self, deadline: float, results: List[Result]):
+        """One simulated user: requests back to back (plus think time) until the deadline."""
+        chat_id = next(self._chat_ids)
+        analyzed = False
+        kinds, weights = list(self.mix), list(self.mix.values())
+        while time.monotonic() < deadline:
+            kind = self.rng.choices(kinds, weights)[0]
+            if kind == "followup" and not analyzed:
+                kind = "analysis"  # A follow-up needs an earlier analysis in the same chat
+            elif kind == "analysis" and analyzed:
+                # New analyses start a fresh chat: with a session in place the router would ask
+                # Gemini whether it is a follow-up, and the replayed answer could not tell.
+                chat_id, analyzed = next(self._chat_ids), False
+            result = await self.request(chat_id, kind)
+            results.append(result)
+            analyzed = analyzed or (kind == "analysis" and result.error is None)
+            if self.args.think_time:
+                await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+
+    async def stage(self, concurrency: int) -> Dict[str, Any]:
+        print(f"\n=== {concurrency} concurrent chats for {self.args.duration:.0f}s ===")
+        self.fake.reset_counters()
+        results: List[Result] = []
+        started = time.monotonic()
+        deadline = started + self.args.duration
+        await asyncio.gather(*(self.chat(deadline, results) for _ in range(concurrency)))
+        return summarize(concurrency, results, time.monotonic() - started, self.fake)
+
+
+def summarize(concurrency: int, results: List[Result], elapsed: float, fake: FakeTelegram) -> Dict[str, Any]:
+    def latencies(attribute: str, kinds=None) -> Dict[str, Optional[float]]:
+        values = [getattr(result, attribute) for result in results
+                  if getattr(result, attribute) is not None and (kinds is None or result.kind in kinds)]
+        return {name: (round(value, 3) if value is not None else None)
+                for name, value in (("p50", _percentile(values, 0.5)), ("p95", _percentile(values, 0.95)), ("p99", _percentile(values, 0.99)))}
+
+    errors: Dict[str, int] = {}
+    for result in results:
+        if result.error:
+            errors[result.error] = errors.get(result.error, 0) + 1
+    completed = sum(1 for result in results if result.error is None)
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "completed": completed,
+        "throughput_per_s": round(completed / elapsed, 3) if elapsed else 0.0,
+        "first_reply": latencies("first_reply"),
+        "final_reply": latencies("final_reply"),
+        "final_reply_by_kind": {kind: latencies("final_reply", {kind}) for kind in MESSAGES},
+        "error_rate": round(sum(errors.values()) / len(results), 4) if results else 0.0,
+        "errors": errors,
+        "telegram_429s": fake.rate_limited,
+        "telegram_calls": fake.calls,
+    }
+
+def print_table(stages: List[Dict[str, Any]]):
+    def seconds(value: Optional[float]) -> str:
+        return f"{value:.2f}" if value is not None else "-"
+
+    print(f"\n{'chats':>5} {'reqs':>6} {'ok/s':>7} {'ack p50':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'errors':>7} {'429s':>6}")
+    for stage in stages:
+        final = stage["final_reply"]
+        print(f"{stage['concurrency']:>5} {stage['requests']:>6} {stage['throughput_per_s']:>7.2f} "
+              f"{seconds(stage['first_reply']['p50']):>8} {seconds(final['p50']):>7} {seconds(final['p95']):>7} "
+              f"{seconds(final['p99']):>7} {stage['error_rate']:>7.1%} {stage['telegram_429s']:>6}")
+        if stage["errors"]:
+            print(f"      errors: {stage['errors']}")
+
+
+# --- Processes ---
+
+async def _serve_fake_telegram(fake: FakeTelegram, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(fake.app, host="127.0.0.1", port=port, log_level="warning"))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server
+
+def _start_app(args: argparse.Namespace, log_path: str) -> subprocess.Popen:
+    command = [sys.executable, "-m", "benchmarks.loadtest_app", "--port", str(args.app_port),
+               "--telegram-url", f"http://127.0.0.1:{args.telegram_port}", "--latency-profile", args.latency_profile]
+    if args.node_cache:
+        command.append("--node-cache")
+    print(f"Starting the bot: {' '.join(command)} (log: {log_path})")
+    with open(log_path, "w") as log_file:
+        return subprocess.Popen(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                stdout=log_file, stderr=subprocess.STDOUT)
+
+async def _wait_until_healthy(app_url: str, process: Optional[subprocess.Popen]):
+    deadline = time.monotonic() + APP_STARTUP_TIMEOUT
+    async with httpx.AsyncClient(base_url=app_url, timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise SystemExit(f"The bot exited during startup (code {process.returncode}); see its log.")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise SystemExit(f"The bot at {app_url} did not become healthy within {APP_STARTUP_TIMEOUT:.0f}s.")
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    fake = FakeTelegram(global_rate=args.telegram_global_rate, chat_rate=args.telegram_chat_rate,
+                        chat_burst=args.telegram_chat_burst, error_rate=args.telegram_429_rate,
+                        latency=args.telegram_latency_ms / 1000)
+    server = await _serve_fake_telegram(fake, args.telegram_port)
+    process = None
+    if args.app_url is None:
+        args.app_url = f"http://127.0.0.1:{args.app_port}"
+        process = _start_app(args, args.app_log)
+    test = LoadTest(args, fake)
+    stages = []
+    try:
+        await _wait_until_healthy(args.app_url, process)
+        for concurrency in args.concurrency:
+            stages.append(await test.stage(concurrency))
+            print_table(stages[-1:])
+    finally:
+        await test.client.aclose()
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        server.should_exit = True
+    print_table(stages)
+    return stages
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load-test the Telegram webhook with a local Bot API stand-in.")
+    parser.add_argument("--concurrency", default="1,5,10,25",
+                        type=lambda value: [int(level) for level in value.split(",")],
+                        help="Comma-separated numbers of concurrent chats, one stage each.")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds per stage.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Relative weights of start, analysis and followup requests.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a chat's requests (seconds).")
+    parser.add_argument("--reply-timeout", type=float, default=REPLY_TIMEOUT)
+    parser.add_argument("--latency-profile", choices=sorted(LATENCY_PROFILES), default="typical")
+    parser.add_argument("--node-cache", action="store_true", help="Run the bot with the node cache on.")
+    parser.add_argument("--app-url", help="Target an already running bot instead of starting one (it must use the fake API).")
+    parser.add_argument("--app-port", type=int, default=8000)
+    parser.add_argument("--app-log", default="loadtest-app.log")
+    parser.add_argument("--telegram-port", type=int, default=8081)
+    parser.add_argument("--telegram-latency-ms", type=float, default=30.0)
+    parser.add_argument("--telegram-global-rate", type=float, default=GLOBAL_RATE)
+    parser.add_argument("--telegram-chat-rate", type=float, default=CHAT_RATE)
+    parser.add_argument("--telegram-chat-burst", type=int, default=CHAT_BURST)
+    parser.add_argument("--telegram-429-rate", type=float, default=0.0, help="Extra fraction of sends refused with 429.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the per-stage results as JSON to this path.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    stages = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(stages, output_file, indent=2)
@@ -0,0 +1,57 @@
+# In benchmarks/loadtest_app.py
+#
+# Runs main.py's FastAPI app for a load test: Telegram calls go to the local stand-in
+# (TELEGRAM_API_URL), and Screener, Yahoo, Google News and Gemini are served from the
+# recorded fixtures with latencies drawn from a profile. Databases, traces and the
+# network guard are set up as for the pipeline benchmark. Started by loadtest.py.
+
+import argparse
+import os
+import tempfile
+
+from benchmarks.pipeline_bench import SCENARIOS
+from benchmarks.replay import LATENCY_PROFILES, ReplayModel, ReplayTransport, block_network, latency_sampler, load_fixtures
+
+LOADTEST_BOT_TOKEN = "123456:LOADTEST"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve main.py with stand-in dependencies for load testing.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--telegram-url", required=True, help="Base URL of the fake Bot API, e.g. http://127.0.0.1:8081")
+    parser.add_argument("--latency-profile", choices=sorted(LATENCY_PROFILES), default="typical")
+    parser.add_argument("--node-cache", action="store_true")
+    args = parser.parse_args()
+
+    # Read at import time by main and the modules it imports
+    workdir = tempfile.mkdtemp(prefix="equisage-loadtest-")
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": LOADTEST_BOT_TOKEN,
+        "TELEGRAM_API_URL": args.telegram_url,
+        "WEBHOOK_URL": f"http://127.0.0.1:{args.port}/webhook",
+        "SESSIONS_DB": os.path.join(workdir, "sessions.db"),
+        "FUNDAMENTALS_DB": os.path.join(workdir, "fundamentals.db"),
+        "TRACE_DIR": os.path.join(workdir, "traces"),
+        "NODE_CACHE": "true" if args.node_cache else "false",
+        "ALERTS_ENABLED": "false",   # Watchlist alerts would download prices on their own schedule
+        "GEMINI_API_KEY": "loadtest-replay",
+    })
+    print(f"Load-test app working directory: {workdir}")
+
+    import uvicorn
+
+    import main as bot_main
+    from stock_analyzer import http_client, llm
+
+    fixtures = load_fixtures(list(SCENARIOS))
+    sampler = latency_sampler(args.latency_profile)
+    http_client.use_transport(ReplayTransport(fixtures["http"], sampler=sampler))
+    for name in sorted({llm.CHAT_MODEL, llm.REPORT_MODEL, llm.FALLBACK_MODEL} - {""}):
+        llm.install_model(name, ReplayModel(name, fixtures["llm"], sampler=sampler))
+    block_network(allow_loopback=True)
+
+    uvicorn.run(bot_main.api, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
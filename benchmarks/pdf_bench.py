@@ -0,0 +1,105 @@
+# In benchmarks/pdf_bench.py
+#
+# Throughput of the PDF report build alone (no Gemini call, no network): PDFs per second
+# and bytes per report for a synthetic but realistically sized state and analysis.
+# "rebuild" builds the style sheet and fixed layout for every report and draws the page
+# frame on every page, as the generator used to; "cached" uses the shared template and
+# the page-frame form.
+#
+#   python -m benchmarks.pdf_bench --reports 200
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_REPORTS = 100
+WARMUP_REPORTS = 5
+
+
+def synthetic_state() -> Dict[str, Any]:
+    key_ratios = {"Market Cap": "₹ 13,45,678 Cr.", "Current Price": "₹ 3,712", "High / Low": "₹ 4,255 / 3,311",
+                  "Stock P/E": "28.4", "Book Value": "₹ 262", "Dividend Yield": "1.48 %", "ROCE": "64.3 %",
+                  "ROE": "51.5 %", "Face Value": "₹ 1.00", "Debt to equity": "0.09"}
+    news = [{"title": f"Company wins large multi-year deal #{i}", "source": "Example Wire", "published_date": "2026-10-01",
+             "summary": "The company announced a multi-year transformation engagement with a European retailer. " * 3}
+            for i in range(8)]
+    quarters = [f"{month} {year}" for year in (2024, 2025, 2026) for month in ("Mar", "Jun", "Sep", "Dec")][:10]
+    quarterly = {"headers": quarters, "rows": [
+        {"metric": "Sales", "values": [f"{60000 + 900 * i:,}" for i in range(10)]},
+        {"metric": "NetProfit", "values": [f"{11000 + 250 * i:,}" for i in range(10)]}]}
+    shareholding = {"headers": quarters, "rows": [
+        {"metric": "Promoters +", "values": ["71.77%"] * 10},
+        {"metric": "FIIs +", "values": [f"{12.4 + 0.1 * i:.2f}%" for i in range(10)]},
+        {"metric": "DIIs +", "values": [f"{10.1 + 0.1 * i:.2f}%" for i in range(10)]},
+        {"metric": "Public +", "values": [f"{5.7 - 0.2 * i:.2f}%" for i in range(10)]}]}
+    return {"company_name": "Tata Consultancy Services Ltd", "stock_ticker": "TCS.NS",
+            "screener_data": {"key_ratios": key_ratios, "quarterly_results": quarterly, "shareholding_pattern": shareholding},
+            "news_articles": news}
+
+def synthetic_analysis() -> Dict[str, Any]:
+    paragraph = ("Revenue growth has moderated in constant currency while margins held up on utilisation gains "
+                 "and a favourable currency tailwind; deal wins remain healthy across verticals. ")
+    return {"executive_summary": paragraph * 2, "investment_recommendation": "HOLD - Valuation already prices in the recovery",
+            "fundamental_analysis": paragraph * 4, "technical_outlook": paragraph * 3,
+            "risk_factors": ["Slower discretionary spend in key markets", "Wage inflation", "Currency volatility"],
+            "growth_catalysts": ["Large deal ramp-ups", "AI-led services demand"], "valuation_summary": paragraph * 2}
+
+
+def bench(mode: str, reports: int, output_dir: str) -> Dict[str, Any]:
+    from stock_analyzer import reporter_pdf
+
+    state, analysis = synthetic_state(), synthetic_analysis()
+
+    def build_one() -> Dict[str, str]:
+        if mode == "rebuild":
+            generator = reporter_pdf.ProfessionalReportGenerator(reporter_pdf.ReportTemplate(), header_form=False)
+        else:
+            generator = reporter_pdf.report_generator()
+        result = generator.build_pdf(state, analysis, output_dir=output_dir)
+        if not result.get("pdf_report_path"):
+            raise RuntimeError(result.get("error", "PDF build failed"))
+        return result
+
+    for _ in range(WARMUP_REPORTS):
+        build_one()
+    timings, sizes = [], []
+    for _ in range(reports):
+        started = time.perf_counter()
+        path = build_one()["pdf_report_path"]
+        timings.append(time.perf_counter() - started)
+        sizes.append(os.path.getsize(path))
+    return {"mode": mode, "reports": reports, "pdfs_per_sec": round(reports / sum(timings), 2),
+            "p50_ms": round(statistics.median(timings) * 1000, 2),
+            "bytes_per_report": round(statistics.mean(sizes))}
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="PDFs/sec and bytes per report for the report generator.")
+    parser.add_argument("--reports", type=int, default=DEFAULT_REPORTS)
+    parser.add_argument("--mode", choices=["rebuild", "cached", "both"], default="both")
+    parser.add_argument("--output", help="Also write the results as JSON to this file.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    modes = ["rebuild", "cached"] if args.mode == "both" else [args.mode]
+    # print() in build_pdf would dominate the timing on a terminal
+    with tempfile.TemporaryDirectory(prefix="equisage-pdf-bench-") as output_dir, open(os.devnull, "w") as devnull:
+        results = []
+        for mode in modes:
+            with contextlib.redirect_stdout(devnull):
+                results.append(bench(mode, args.reports, output_dir))
+            row = results[-1]
+            print(f"{mode:>8}: {row['pdfs_per_sec']:8.2f} PDFs/s  p50 {row['p50_ms']:8.2f} ms  {row['bytes_per_report']:>8} bytes/report")
+    if len(results) == 2:
+        print(f"Speed-up: {results[1]['pdfs_per_sec'] / results[0]['pdfs_per_sec']:.2f}x, "
+              f"size change: {results[1]['bytes_per_report'] - results[0]['bytes_per_report']:+d} bytes/report")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,342 @@
+# In benchmarks/pipeline_bench.py
+#
+# Offline benchmark of the full analysis pipeline (router -> Screener -> technicals/news
+# -> report -> PDF), driven through the compiled LangGraph exactly as the bot runs it.
+#
+#   python -m benchmarks.pipeline_bench record                 # once, live: needs network and GEMINI_API_KEY
+#   python -m benchmarks.pipeline_bench run --save-baseline    # replay and store the numbers as the baseline
+#   python -m benchmarks.pipeline_bench run --check            # replay and exit 1 on a regression
+#
+# A replay serves the recorded Screener HTML, Yahoo chart OHLCV, Google News RSS and
+# Gemini responses (see replay.py) with the network blocked, and reports per-node and
+# per-call latency (from the trace spans), end-to-end latency, throughput and peak
+# memory. Recorded latencies are replayed by default (--latency-profile swaps in a
+# synthetic one; --latency-scale 0 measures the pipeline's own CPU time alone). Each invocation uses a throwaway sessions DB and
+# trace directory, and the node cache is off unless --node-cache is given.
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.replay import (LATENCY_PROFILES, LatencySampler, RecordingModel, RecordingTransport, ReplayModel,
+                               ReplayTransport, block_network, latency_sampler, load_fixture, save_fixture)
+
+# --- Configuration ---
+# Each scenario is one chat: its messages run in order, with the session saved in between
+SCENARIOS = {
+    "tcs": ["Analyze TCS"],
+    "reliance": ["Give me a detailed analysis of Reliance Industries"],
+    "tcs_followup": ["Analyze TCS", "What is its PE ratio?"],
+    "greeting": ["Hi there!"],
+    "compare": ["Compare TCS vs Infosys vs Wipro"],
+}
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_RUNS = 5
+DEFAULT_THRESHOLD = 0.20            # Fail --check when a metric is this much worse than its baseline
+HIGHER_IS_BETTER = {"throughput_per_min"}
+# Differences smaller than this are noise, whatever the ratio (a 2 ms node taking 3 ms is not a regression)
+MIN_REGRESSION = {"seconds": 0.005, "mb": 2.0, "count": 0}
+BENCH_CHAT_ID = -1_000_000          # Negative ids never collide with Telegram users
+
+_chat_ids = itertools.count()
+
+
+def prepare_environment(node_cache: bool, replay: bool) -> str:
+    """Must run before the pipeline is imported: these settings are read at import time."""
+    workdir = tempfile.mkdtemp(prefix="equisage-bench-")
+    os.environ["SESSIONS_DB"] = os.path.join(workdir, "sessions.db")
+    os.environ["TRACE_DIR"] = os.path.join(workdir, "traces")
+    os.environ["TRACING"] = "true"
+    os.environ["NODE_CACHE"] = "true" if node_cache else "false"
+    if replay:
+        os.environ.setdefault("GEMINI_API_KEY", "benchmark-replay")
+    return workdir
+
+def load_pipeline(collect_spans: bool = True) -> SimpleNamespace:
+    from langchain_core.messages import HumanMessage
+
+    import graph
+    from db_manager import asave_session, session_from_state, setup_database
+    from delivery import stream_graph
+    from stock_analyzer import http_client, llm, tracing
+
+    setup_database()
+    spans: List[Dict[str, Any]] = []
+    if collect_spans:
+        tracing.add_span_listener(spans.append)
+    return SimpleNamespace(app=graph.app, stream_graph=stream_graph, HumanMessage=HumanMessage,
+                           session_from_state=session_from_state, asave_session=asave_session,
+                           http_client=http_client, llm=llm, tracing=tracing, spans=spans)
+
+def _model_names(llm: Any) -> List[str]:
+    return sorted({llm.CHAT_MODEL, llm.REPORT_MODEL, llm.FALLBACK_MODEL} - {""})
+
+def install_stand_ins(pipeline: SimpleNamespace, fixture: Dict[str, Any], latency_scale: float = 1.0,
+                      sampler: Optional[LatencySampler] = None) -> Tuple[ReplayTransport, List[ReplayModel]]:
+    """Routes HTTP and every Gemini model through replays of `fixture`."""
+    transport = ReplayTransport(fixture["http"], latency_scale, sampler)
+    pipeline.http_client.use_transport(transport)
+    models = [ReplayModel(name, fixture["llm"], latency_scale, sampler) for name in _model_names(pipeline.llm)]
+    for model in models:
+        pipeline.llm.install_model(model.name, model)
+    return transport, models
+
+async def run_scenario(pipeline: SimpleNamespace, scenario: str) -> float:
+    """
+    One scenario through the graph, consumed the way main.run_analysis does (including
+    saving the session that follow-ups read); returns its wall time.
+    """
+    chat_id = BENCH_CHAT_ID - next(_chat_ids)
+    started = time.perf_counter()
+    with pipeline.tracing.start_trace("benchmark", scenario=scenario):
+        for message in SCENARIOS[scenario]:
+            initial_state = {"messages": [pipeline.HumanMessage(content=message)], "chat_id": chat_id}
+            final_state = dict(initial_state)
+            async for node, update, state in pipeline.stream_graph(pipeline.app, initial_state):
+                final_state = {**final_state, **state, **update}
+            session_data = pipeline.session_from_state(final_state)
+            if session_data is not None:
+                await pipeline.asave_session(chat_id, session_data)
+            pdf_path = final_state.get("pdf_report_path")
+            if pdf_path and os.path.exists(pdf_path):
+                os.remove(pdf_path)  # Delivery normally removes it after sending
+    return time.perf_counter() - started
+
+
+# --- Record ---
+
+async def record(scenarios: List[str]):
+    pipeline = load_pipeline()
+    llm = pipeline.llm
+    real_models = {name: llm.get_model(name) for name in _model_names(llm)}
+    if any(model is None for model in real_models.values()):
+        raise SystemExit("Recording needs a working GEMINI_API_KEY.")
+    for scenario in scenarios:
+        print(f"\n=== Recording '{scenario}' ===")
+        transport = RecordingTransport()
+        pipeline.http_client.use_transport(transport)
+        calls: List[Dict[str, Any]] = []
+        for name, model in real_models.items():
+            llm.install_model(name, RecordingModel(name, model, calls))
+        await run_scenario(pipeline, scenario)
+        await pipeline.http_client.close_http_client()
+        await transport.aclose()
+        save_fixture(scenario, SCENARIOS[scenario], transport.exchanges, calls)
+
+
+# --- Replay ---
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _latency_summary(values: List[float]) -> Dict[str, float]:
+    return {"p50": round(_percentile(values, 0.5), 4), "p95": round(_percentile(values, 0.95), 4),
+            "mean": round(sum(values) / len(values), 4), "count": len(values)}
+
+def _span_summary(spans: List[Dict[str, Any]], prefix: str) -> Dict[str, Dict[str, float]]:
+    durations: Dict[str, List[float]] = {}
+    for record in spans:
+        if record["name"].startswith(prefix):
+            durations.setdefault(record["name"][len(prefix):], []).append(record["duration_ms"] / 1000)
+    return {name: _latency_summary(values) for name, values in sorted(durations.items())}
+
+async def replay(pipeline: SimpleNamespace, scenario: str, runs: int, concurrency: int, warmup: int,
+                 latency_scale: float, latency_profile: Optional[str] = None) -> Dict[str, Any]:
+    fixture = load_fixture(scenario)
+    sampler = latency_sampler(latency_profile, seed=0) if latency_profile else None
+    transport, models = install_stand_ins(pipeline, fixture, latency_scale, sampler)
+
+    print(f"\n=== Replaying '{scenario}': {warmup} warm-up + {runs} runs, concurrency {concurrency} ===")
+    for _ in range(warmup):
+        await run_scenario(pipeline, scenario)  # Lazy imports, the LLM latency window, page caches
+    pipeline.spans.clear()
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited() -> float:
+        async with semaphore:
+            return await run_scenario(pipeline, scenario)
+
+    started = time.perf_counter()
+    durations = await asyncio.gather(*(limited() for _ in range(runs)))
+    wall = time.perf_counter() - started
+    spans = list(pipeline.spans)
+
+    # Separate pass: tracemalloc slows allocation-heavy code too much to time under it
+    tracemalloc.start()
+    try:
+        await run_scenario(pipeline, scenario)
+        _, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    node_errors = sum(1 for record in spans if record["name"].startswith("node:")
+                      and (record["status"] != "ok" or record["attributes"].get("outcome", "ok") != "ok"))
+    return {
+        "scenario": scenario,
+        "settings": {"runs": runs, "concurrency": concurrency, "latency_scale": latency_scale, "latency_profile": latency_profile,
+                     "node_cache": os.environ.get("NODE_CACHE") == "true"},
+        "end_to_end": _latency_summary(durations),
+        "throughput_per_min": round(runs / wall * 60, 2),
+        "nodes": _span_summary(spans, "node:"),
+        "calls": _span_summary(spans, "call:"),
+        "node_errors": node_errors,
+        "unrecorded_requests": sorted(set(transport.misses)),
+        "inexact_llm_matches": sum(model.inexact for model in models),
+        "peak_traced_mb": round(traced_peak / 2**20, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # Process high-water mark (Linux reports KB)
+    }
+
+
+# --- Baselines ---
+
+def flat_metrics(result: Dict[str, Any]) -> Dict[str, float]:
+    """The metrics compared against a baseline."""
+    metrics = {
+        "end_to_end.p50": result["end_to_end"]["p50"],
+        "end_to_end.p95": result["end_to_end"]["p95"],
+        "throughput_per_min": result["throughput_per_min"],
+        "node_errors": result["node_errors"],
+        "peak_traced_mb": result["peak_traced_mb"],
+        "peak_rss_mb": result["peak_rss_mb"],
+    }
+    for node, summary in result["nodes"].items():
+        metrics[f"node.{node}.p50"] = summary["p50"]
+    return metrics
+
+def _min_regression(metric: str) -> float:
+    if metric.endswith("_mb"):
+        return MIN_REGRESSION["mb"]
+    if metric == "node_errors" or metric in HIGHER_IS_BETTER:
+        return MIN_REGRESSION["count"]
+    return MIN_REGRESSION["seconds"]
+
+def compare(current: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    """Human-readable regressions of `current` against `baseline`; empty when within the threshold."""
+    regressions = []
+    for metric, base in baseline.items():
+        value = current.get(metric)
+        if value is None:
+            continue
+        if metric in HIGHER_IS_BETTER:
+            worse = value < base * (1 - threshold) and base - value > _min_regression(metric)
+        else:
+            worse = value > base * (1 + threshold) and value - base > _min_regression(metric)
+        if worse:
+            change = f"{(value - base) / base:+.0%}" if base else "new"
+            regressions.append(f"{metric}: {base} -> {value} ({change})")
+    return regressions
+
+def load_baselines() -> Dict[str, Any]:
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, encoding="utf-8") as baseline_file:
+        return json.load(baseline_file)
+
+def save_baselines(results: List[Dict[str, Any]]):
+    baselines = load_baselines()
+    for result in results:
+        baselines[result["scenario"]] = {"recorded_at": datetime.now().isoformat(timespec="seconds"),
+                                         "settings": result["settings"], "metrics": flat_metrics(result)}
+    with open(BASELINE_FILE, "w", encoding="utf-8") as baseline_file:
+        json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+    print(f"Baselines for {', '.join(result['scenario'] for result in results)} saved to {BASELINE_FILE}.")
+
+
+def print_result(result: Dict[str, Any]):
+    e2e = result["end_to_end"]
+    print(f"\n--- {result['scenario']} ---")
+    print(f"end-to-end   p50 {e2e['p50']:.3f}s  p95 {e2e['p95']:.3f}s  mean {e2e['mean']:.3f}s  ({e2e['count']} runs)")
+    print(f"throughput   {result['throughput_per_min']} analyses/min at concurrency {result['settings']['concurrency']}")
+    print(f"memory       traced peak {result['peak_traced_mb']} MB, process RSS peak {result['peak_rss_mb']} MB")
+    for title, section in (("node", result["nodes"]), ("call", result["calls"])):
+        for name, summary in section.items():
+            print(f"{title:<6} {name:<22} p50 {summary['p50']:.4f}s  p95 {summary['p95']:.4f}s  n={summary['count']}")
+    if result["node_errors"]:
+        print(f"WARNING: {result['node_errors']} node run(s) ended in error or timeout.")
+    if result["unrecorded_requests"]:
+        print(f"WARNING: requests missing from the fixture: {result['unrecorded_requests']}")
+    if result["inexact_llm_matches"]:
+        print(f"Note: {result['inexact_llm_matches']} Gemini prompt(s) differed from the recording and were matched by template.")
+
+
+async def run(args: argparse.Namespace) -> int:
+    pipeline = load_pipeline()
+    block_network()
+    results = []
+    for scenario in args.scenario:
+        results.append(await replay(pipeline, scenario, args.runs, args.concurrency, args.warmup, args.latency_scale,
+                                    args.latency_profile))
+    await pipeline.http_client.close_http_client()
+
+    for result in results:
+        print_result(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.save_baseline:
+        save_baselines(results)
+
+    if not args.check:
+        return 0
+    baselines = load_baselines()
+    failed = False
+    for result in results:
+        baseline = baselines.get(result["scenario"])
+        if baseline is None:
+            print(f"No baseline for '{result['scenario']}'; skipping the check.")
+            continue
+        if baseline["settings"] != result["settings"]:
+            print(f"Warning: '{result['scenario']}' baseline was recorded with {baseline['settings']}; numbers may not be comparable.")
+        regressions = compare(flat_metrics(result), baseline["metrics"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION [{result['scenario']}] {regression}")
+        failed = failed or bool(regressions)
+    print("Benchmark check " + ("FAILED." if failed else f"passed (threshold {args.threshold:.0%})."))
+    return 1 if failed else 0
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Record/replay benchmark of the analysis pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="Run each scenario live once and store its responses as a fixture.")
+    run_parser = commands.add_parser("run", help="Replay the fixtures and measure.")
+    for command in (record_parser, run_parser):
+        command.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                             help="Scenario to use (repeatable; default: all).")
+    run_parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    run_parser.add_argument("--concurrency", type=int, default=1, help="Analyses in flight at once.")
+    run_parser.add_argument("--warmup", type=int, default=1, help="Untimed runs before measuring.")
+    run_parser.add_argument("--latency-scale", type=float, default=1.0,
+                            help="Multiplier on recorded network/Gemini latencies (0 = serve instantly).")
+    run_parser.add_argument("--latency-profile", choices=sorted(LATENCY_PROFILES),
+                            help="Draw network/Gemini latencies from a profile instead of the recording.")
+    run_parser.add_argument("--node-cache", action="store_true", help="Leave the node cache on (measures warm-cache runs).")
+    run_parser.add_argument("--save-baseline", action="store_true", help=f"Store the results in {os.path.basename(BASELINE_FILE)}.")
+    run_parser.add_argument("--check", action="store_true", help="Exit 1 if any metric regressed past --threshold.")
+    run_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    run_parser.add_argument("--output", help="Also write the full results as JSON to this path.")
+    args = parser.parse_args(argv)
+    args.scenario = args.scenario or list(SCENARIOS)
+    return args
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    workdir = prepare_environment(node_cache=getattr(args, "node_cache", False), replay=args.command == "run")
+    print(f"Benchmark working directory: {workdir}")
+    if args.command == "record":
+        asyncio.run(record(args.scenario))
+        sys.exit(0)
+    sys.exit(asyncio.run(run(args)))
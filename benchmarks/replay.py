@@ -0,0 +1,295 @@
+# In benchmarks/replay.py
+#
+# Record/replay stand-ins for everything the pipeline talks to. Recording wraps the
+# real clients and keeps each response with its latency; replay serves the stored
+# responses, sleeping for the recorded (scaled) latency or one drawn from a latency
+# profile, so a run needs no network and no API key.
+#   - HTTP (Screener HTML, Yahoo chart OHLCV, Google News RSS) goes through the shared
+#     httpx client, so it is captured at its transport.
+#   - Gemini is captured at the model object the LLM gateway calls, so the gateway's
+#     queueing, rate limiting and hedging stay part of what is measured.
+
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import socket
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Given a service name and the recorded latency, returns how long a replayed call should take
+LatencySampler = Callable[[str, float], float]
+
+
+# --- Fixtures ---
+
+def fixture_path(scenario: str) -> str:
+    return os.path.join(FIXTURE_DIR, f"{scenario}.json")
+
+def save_fixture(scenario: str, messages: List[str], http: List[Dict[str, Any]], llm: List[Dict[str, Any]]):
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    fixture = {"scenario": scenario, "messages": messages, "recorded_at": datetime.now().isoformat(timespec="seconds"),
+               "http": http, "llm": llm}
+    with open(fixture_path(scenario), "w", encoding="utf-8") as fixture_file:
+        json.dump(fixture, fixture_file, indent=1)
+    print(f"Recorded {len(http)} HTTP and {len(llm)} Gemini responses to {fixture_path(scenario)}.")
+
+def load_fixture(scenario: str) -> Dict[str, Any]:
+    path = fixture_path(scenario)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No fixture for '{scenario}'; run `python -m benchmarks.pipeline_bench record` first.")
+    with open(path, encoding="utf-8") as fixture_file:
+        return json.load(fixture_file)
+
+def load_fixtures(scenarios: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """HTTP exchanges and Gemini calls of every recorded scenario among `scenarios`, merged so any of them replays."""
+    merged: Dict[str, List[Dict[str, Any]]] = {"http": [], "llm": []}
+    for scenario in scenarios:
+        if os.path.exists(fixture_path(scenario)):
+            fixture = load_fixture(scenario)
+            merged["http"].extend(fixture["http"])
+            merged["llm"].extend(fixture["llm"])
+    if not merged["http"] and not merged["llm"]:
+        raise FileNotFoundError(f"No fixtures in {FIXTURE_DIR}; run `python -m benchmarks.pipeline_bench record` first.")
+    return merged
+
+def _request_key(request: httpx.Request) -> str:
+    return f"{request.method} {request.url}"
+
+def _encode_body(body: bytes) -> Dict[str, str]:
+    try:
+        return {"text": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(body).decode("ascii")}
+
+def _decode_body(entry: Dict[str, Any]) -> bytes:
+    if "base64" in entry:
+        return base64.b64decode(entry["base64"])
+    return entry.get("text", "").encode("utf-8")
+
+def service_for(url: Any) -> str:
+    """The service name (as used by track_call) of a recorded request URL."""
+    host = httpx.URL(str(url)).host
+    if "screener" in host:
+        return "screener"
+    if "yahoo" in host:
+        return "yahoo_chart"
+    if "news.google" in host:
+        return "google_news"
+    return host
+
+def _response_headers(content_type: Optional[str]) -> Dict[str, str]:
+    # Bodies are stored decoded, so content-encoding/length from the wire must not be replayed
+    return {"content-type": content_type} if content_type else {}
+
+
+# --- Latency profiles ---
+# (p50, p95) seconds per service; replayed calls draw from a log-normal with those
+# quantiles instead of using the recorded latency.
+
+LATENCY_PROFILES: Dict[str, Dict[str, Tuple[float, float]]] = {
+    "fast": {"screener": (0.15, 0.4), "yahoo_chart": (0.1, 0.3), "google_news": (0.2, 0.5), "gemini": (0.8, 2.0)},
+    "typical": {"screener": (0.6, 1.5), "yahoo_chart": (0.3, 1.0), "google_news": (0.5, 1.5), "gemini": (3.0, 8.0)},
+    "degraded": {"screener": (2.0, 6.0), "yahoo_chart": (1.0, 4.0), "google_news": (1.5, 5.0), "gemini": (8.0, 20.0)},
+}
+
+def latency_sampler(profile: str, seed: Optional[int] = None) -> LatencySampler:
+    """Sampler for a named profile; services the profile does not list keep their recorded latency."""
+    quantiles = LATENCY_PROFILES[profile]
+    rng = random.Random(seed)
+
+    def sample(service: str, recorded: float) -> float:
+        if service not in quantiles:
+            return recorded
+        p50, p95 = quantiles[service]
+        return rng.lognormvariate(math.log(p50), math.log(p95 / p50) / 1.645)
+    return sample
+
+def _delay(sampler: Optional[LatencySampler], scale: float, service: str, recorded: float) -> float:
+    return (sampler(service, recorded) if sampler else recorded) * scale
+
+
+# --- HTTP ---
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Sends requests to the network and keeps every exchange."""
+
+    def __init__(self):
+        self._inner = httpx.AsyncHTTPTransport()
+        self.exchanges: List[Dict[str, Any]] = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self._inner.handle_async_request(request)
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        latency = time.perf_counter() - started
+        content_type = response.headers.get("content-type")
+        if response.status_code >= 400:
+            print(f"Warning: recorded HTTP {response.status_code} for {_request_key(request)}.")
+        self.exchanges.append({"key": _request_key(request), "status": response.status_code,
+                               "content_type": content_type, "latency": round(latency, 4), **_encode_body(body)})
+        return httpx.Response(response.status_code, headers=_response_headers(content_type), content=body, request=request)
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Answers requests from recorded exchanges; anything unrecorded fails like a connection error."""
+
+    def __init__(self, exchanges: List[Dict[str, Any]], latency_scale: float = 1.0,
+                 sampler: Optional[LatencySampler] = None):
+        self._exchanges = {entry["key"]: entry for entry in exchanges}
+        self.latency_scale = latency_scale
+        self.sampler = sampler
+        self.misses: List[str] = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        entry = self._exchanges.get(_request_key(request))
+        if entry is None:
+            self.misses.append(_request_key(request))
+            raise httpx.ConnectError(f"No recorded response for {_request_key(request)}", request=request)
+        delay = _delay(self.sampler, self.latency_scale, service_for(request.url), entry["latency"])
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return httpx.Response(entry["status"], headers=_response_headers(entry.get("content_type")),
+                              content=_decode_body(entry), request=request)
+
+
+# --- Gemini ---
+
+def _prompt_hash(prompt: Any) -> str:
+    return hashlib.sha256(str(prompt).encode("utf-8")).hexdigest()
+
+def _common_prefix_length(a: str, b: str) -> int:
+    length = min(len(a), len(b))
+    for index in range(length):
+        if a[index] != b[index]:
+            return index
+    return length
+
+
+class RecordingModel:
+    """Forwards to a real GenerativeModel and keeps each prompt, response text, usage and latency."""
+
+    def __init__(self, name: str, model: Any, calls: List[Dict[str, Any]]):
+        self.name = name
+        self._model = model
+        self._calls = calls
+
+    def _keep(self, prompt: Any, response: Any, latency: float):
+        usage = getattr(response, "usage_metadata", None)
+        self._calls.append({
+            "model": self.name, "prompt_hash": _prompt_hash(prompt), "prompt": str(prompt), "text": response.text,
+            "latency": round(latency, 4),
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        })
+
+    async def generate_content_async(self, prompt: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        response = await self._model.generate_content_async(prompt, **kwargs)
+        self._keep(prompt, response, time.perf_counter() - started)
+        return response
+
+    def generate_content(self, prompt: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        response = self._model.generate_content(prompt, **kwargs)
+        self._keep(prompt, response, time.perf_counter() - started)
+        return response
+
+
+class ReplayModel:
+    """
+    Answers prompts from recorded calls. An exact prompt match wins; otherwise the
+    recorded prompt sharing the longest prefix (i.e. the same template) is used, so
+    prompts that embed today's date or slightly changed wording still replay.
+    """
+
+    def __init__(self, name: str, calls: List[Dict[str, Any]], latency_scale: float = 1.0,
+                 sampler: Optional[LatencySampler] = None):
+        self.name = name
+        self._calls = [call for call in calls if call["model"] == name] or list(calls)
+        self._by_hash = {call["prompt_hash"]: call for call in self._calls}
+        self.latency_scale = latency_scale
+        self.sampler = sampler
+        self.inexact = 0
+
+    def _match(self, prompt: Any) -> Dict[str, Any]:
+        call = self._by_hash.get(_prompt_hash(prompt))
+        if call is not None:
+            return call
+        if not self._calls:
+            raise RuntimeError(f"No recorded Gemini responses for {self.name}.")
+        self.inexact += 1
+        prompt = str(prompt)
+        return max(self._calls, key=lambda recorded: _common_prefix_length(recorded["prompt"], prompt))
+
+    @staticmethod
+    def _response(call: Dict[str, Any]) -> Any:
+        usage = SimpleNamespace(prompt_token_count=call.get("prompt_tokens", 0), candidates_token_count=call.get("output_tokens", 0))
+        return SimpleNamespace(text=call["text"], usage_metadata=usage)
+
+    async def generate_content_async(self, prompt: Any, **kwargs: Any) -> Any:
+        call = self._match(prompt)
+        delay = _delay(self.sampler, self.latency_scale, "gemini", call["latency"])
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self._response(call)
+
+    def generate_content(self, prompt: Any, **kwargs: Any) -> Any:
+        call = self._match(prompt)
+        delay = _delay(self.sampler, self.latency_scale, "gemini", call["latency"])
+        if delay > 0:
+            time.sleep(delay)
+        return self._response(call)
+
+
+# --- Network guard ---
+
+_LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+def _network_disabled(*args: Any, **kwargs: Any):
+    raise OSError("Network access is disabled during benchmark replay.")
+
+def block_network(allow_loopback: bool = False):
+    """
+    Makes any outbound connection fail, so a replay can never silently fall back to
+    live services (e.g. yfinance). allow_loopback keeps local servers reachable (the
+    load test's app and Telegram stand-in).
+    """
+    real_connect, real_connect_ex = socket.socket.connect, socket.socket.connect_ex
+    real_create_connection, real_getaddrinfo = socket.create_connection, socket.getaddrinfo
+
+    def is_local(address: Any) -> bool:
+        # Non-tuple addresses are Unix sockets, which never leave the machine
+        return not isinstance(address, tuple) or (allow_loopback and address[0] in _LOOPBACK_HOSTS)
+
+    def connect(sock: socket.socket, address: Any):
+        return real_connect(sock, address) if is_local(address) else _network_disabled()
+
+    def connect_ex(sock: socket.socket, address: Any):
+        return real_connect_ex(sock, address) if is_local(address) else _network_disabled()
+
+    def create_connection(address: Any, *args: Any, **kwargs: Any):
+        return real_create_connection(address, *args, **kwargs) if is_local(address) else _network_disabled()
+
+    def getaddrinfo(host: Any, *args: Any, **kwargs: Any):
+        return real_getaddrinfo(host, *args, **kwargs) if is_local((host,)) else _network_disabled()
+
+    socket.socket.connect = connect
+    socket.socket.connect_ex = connect_ex
+    socket.create_connection = create_connection
+    socket.getaddrinfo = getaddrinfo
@@ -0,0 +1,163 @@
+# In benchmarks/soak.py
+#
+# Memory stability ("soak") mode: runs thousands of replayed analyses through the
+# graph, round-robin over the recorded scenarios, and samples the process as it goes:
+# resident set size, Python allocations (tracemalloc), live matplotlib figures, open
+# file descriptors and threads. At the end it prints the call sites whose allocations
+# grew most since warm-up, and fails if RSS grew past the budget or figures were left
+# open, so leaks in the chart, pandas and PDF paths show up before production does.
+#
+#   python -m benchmarks.soak --analyses 2000 --concurrency 4 --rss-budget-mb 50
+
+import argparse
+import asyncio
+import gc
+import itertools
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from benchmarks.pipeline_bench import SCENARIOS, install_stand_ins, load_pipeline, prepare_environment, run_scenario
+from benchmarks.replay import FIXTURE_DIR, block_network, fixture_path, load_fixtures
+
+# --- Configuration ---
+DEFAULT_ANALYSES = 2000
+DEFAULT_RSS_BUDGET_MB = 50.0      # Allowed RSS growth from the end of warm-up to the end of the run
+WARMUP_ANALYSES = 50              # Lazy imports, font caches and connection pools settle in this many
+TRACEBACK_DEPTH = 8               # Frames kept per allocation; deeper costs more memory and time
+TOP_GROWTH_SITES = 15
+_IGNORED_ALLOCATIONS = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"))
+
+
+def rss_mb() -> float:
+    """Current resident set size (not the high-water mark)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # Peak only, where /proc is unavailable
+
+def live_figures() -> Dict[str, int]:
+    """Figures pyplot still manages, and Figure objects still alive at all (e.g. closed but referenced)."""
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    figure = sys.modules.get("matplotlib.figure")
+    if pyplot is None or figure is None:
+        return {"open": 0, "alive": 0}
+    alive = sum(1 for obj in gc.get_objects() if isinstance(obj, figure.Figure))
+    return {"open": len(pyplot.get_fignums()), "alive": alive}
+
+def open_fds() -> Optional[int]:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+def sample(done: int, started: float) -> Dict[str, Any]:
+    gc.collect()   # Measure what is really retained, not garbage waiting for a cycle
+    figures = live_figures()
+    return {
+        "analyses": done,
+        "elapsed_s": round(time.perf_counter() - started, 1),
+        "rss_mb": round(rss_mb(), 1),
+        "traced_mb": round(tracemalloc.get_traced_memory()[0] / 2**20, 1) if tracemalloc.is_tracing() else None,
+        "figures_open": figures["open"],
+        "figures_alive": figures["alive"],
+        "gc_objects": len(gc.get_objects()),
+        "threads": threading.active_count(),
+        "fds": open_fds(),
+    }
+
+def print_samples(samples: List[Dict[str, Any]]):
+    columns = list(samples[0])
+    print("\n" + " ".join(f"{column:>13}" for column in columns))
+    for row in samples:
+        print(" ".join(f"{'-' if row[column] is None else row[column]:>13}" for column in columns))
+
+def print_growth(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot):
+    stats = after.filter_traces(_IGNORED_ALLOCATIONS).compare_to(before.filter_traces(_IGNORED_ALLOCATIONS), "traceback")
+    print(f"\nTop {TOP_GROWTH_SITES} allocation sites by growth since warm-up:")
+    for stat in stats[:TOP_GROWTH_SITES]:
+        if stat.size_diff <= 0:
+            break
+        print(f"  {stat.size_diff / 1024:+10.1f} KiB  {stat.count_diff:+7d} blocks")
+        for line in stat.traceback.format(limit=4):
+            print(f"      {line}")
+
+
+async def soak(args: argparse.Namespace) -> int:
+    scenarios = [name for name in SCENARIOS if os.path.exists(fixture_path(name))]
+    if not scenarios:
+        raise SystemExit(f"No fixtures in {FIXTURE_DIR}; run `python -m benchmarks.pipeline_bench record` first.")
+    pipeline = load_pipeline(collect_spans=False)   # Collected spans would themselves grow without bound
+    install_stand_ins(pipeline, load_fixtures(scenarios), latency_scale=args.latency_scale)
+    block_network()
+    order = itertools.cycle(scenarios)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_batch(count: int):
+        async def limited(scenario: str):
+            async with semaphore:
+                await run_scenario(pipeline, scenario)
+        await asyncio.gather(*(limited(next(order)) for _ in range(count)))
+
+    print(f"Soaking with {args.analyses} analyses over {', '.join(scenarios)} at concurrency {args.concurrency}...")
+    if args.tracemalloc:
+        tracemalloc.start(TRACEBACK_DEPTH)
+    started = time.perf_counter()
+    await run_batch(args.warmup)
+    samples = [sample(0, started)]
+    baseline_snapshot = tracemalloc.take_snapshot() if args.tracemalloc else None
+
+    done = 0
+    while done < args.analyses:
+        batch = min(args.sample_every, args.analyses - done)
+        await run_batch(batch)
+        done += batch
+        samples.append(sample(done, started))
+        print(f"{done}/{args.analyses} analyses: RSS {samples[-1]['rss_mb']} MB, "
+              f"{samples[-1]['figures_open']} open figure(s), {samples[-1]['fds']} fds")
+    await pipeline.http_client.close_http_client()
+
+    print_samples(samples)
+    if baseline_snapshot is not None:
+        print_growth(baseline_snapshot, tracemalloc.take_snapshot())
+        tracemalloc.stop()
+
+    # Judge the tail rather than the last point, so one GC-timing blip neither hides nor fakes a leak
+    tail = samples[-max(1, len(samples) // 4):]
+    growth = min(row["rss_mb"] for row in tail) - samples[0]["rss_mb"]
+    problems = []
+    if growth > args.rss_budget_mb:
+        problems.append(f"RSS grew {growth:.1f} MB after warm-up (budget {args.rss_budget_mb:.0f} MB)")
+    if samples[-1]["figures_open"]:
+        problems.append(f"{samples[-1]['figures_open']} matplotlib figure(s) left open")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if not problems:
+        print(f"PASS: RSS grew {growth:.1f} MB after warm-up (budget {args.rss_budget_mb:.0f} MB), no figures left open.")
+    return 1 if problems else 0
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Long-running memory stability test of the analysis pipeline.")
+    parser.add_argument("--analyses", type=int, default=DEFAULT_ANALYSES)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=WARMUP_ANALYSES)
+    parser.add_argument("--sample-every", type=int, default=100, help="Analyses between samples.")
+    parser.add_argument("--latency-scale", type=float, default=0.0,
+                        help="Multiplier on recorded latencies (default 0: as many analyses as the CPU allows).")
+    parser.add_argument("--rss-budget-mb", type=float, default=DEFAULT_RSS_BUDGET_MB)
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false",
+                        help="Skip allocation tracking (faster, but no growth-by-call-site report).")
+    parser.add_argument("--node-cache", action="store_true", help="Leave the node cache on.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    print(f"Soak working directory: {prepare_environment(node_cache=args.node_cache, replay=True)}")
+    sys.exit(asyncio.run(soak(args)))
@@ -0,0 +1,278 @@
+# In database/db.py
+
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from db_manager import BASE_DIR, get_connection_manager
+from database.models import (
+    SCHEMA, SECTION_RATIO, SECTION_QUARTERLY, SECTION_SHAREHOLDING, CURRENT_PERIOD,
+)
+
+FUNDAMENTALS_DB_FILE = os.getenv("FUNDAMENTALS_DB", os.path.join(BASE_DIR, "fundamentals.db"))
+
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+_MONTHS = {m: i for i, m in enumerate(["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], start=1)}
+
+# (db file, section, name) -> metric_id, for committed metrics only; metrics are never
+# deleted, so this only grows
+_metric_ids: Dict[Tuple[str, str, str], int] = {}
+_metric_ids_lock = threading.Lock()
+
+
+def get_fundamentals_connection() -> sqlite3.Connection:
+    """This thread's persistent connection to fundamentals.db."""
+    return get_connection_manager(FUNDAMENTALS_DB_FILE).get()
+
+def setup_fundamentals_database():
+    """Creates the fundamentals tables and indexes if they don't exist."""
+    try:
+        conn = get_fundamentals_connection()
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        print("Fundamentals database setup complete.")
+    except sqlite3.Error as e:
+        print(f"Fundamentals database setup error: {e}")
+
+
+# --- Parsing helpers ---
+
+def parse_number(text: Any) -> Optional[float]:
+    """'₹ 1,23,456 Cr.' -> 123456.0, '23.5 %' -> 23.5. Returns None unless there is exactly one number."""
+    if isinstance(text, (int, float)):
+        return float(text)
+    if not text:
+        return None
+    numbers = _NUMBER_RE.findall(str(text).replace(",", ""))
+    return float(numbers[0]) if len(numbers) == 1 else None
+
+def normalize_period(header: str) -> str:
+    """'Mar 2024' -> '2024-03'. Anything else is kept as-is."""
+    parts = header.split()
+    if len(parts) == 2 and parts[0][:3] in _MONTHS and parts[1].isdigit():
+        return f"{parts[1]}-{_MONTHS[parts[0][:3]]:02d}"
+    return header
+
+def normalize_metric(name: str) -> str:
+    """
+    'Net Profit +' -> 'NetProfit', 'OPM %' -> 'OPM%'. The scraper already strips spaces from
+    quarterly names but keeps the '+' of expandable shareholding rows; every table row is
+    stored and looked up under this one spelling.
+    """
+    return "".join(name.split()).replace("+", "")
+
+def _table_rows(section: str, table: Dict[str, Any]) -> Iterable[Tuple[str, str, str, float]]:
+    periods = [normalize_period(h) for h in table.get("headers", [])]
+    for row in table.get("rows", []):
+        metric = normalize_metric(row.get("metric", ""))
+        if not metric:
+            continue
+        for period, raw in zip(periods, row.get("values", [])):
+            value = parse_number(raw)
+            if value is not None:
+                yield section, metric, period, value
+
+def screener_rows(screener_data: Dict[str, Any]) -> List[Tuple[str, str, str, float]]:
+    """Flattens fetch_screener_data output into (section, metric, period, value) rows."""
+    rows = []
+    for name, raw in screener_data.get("key_ratios", {}).items():
+        value = parse_number(raw)
+        if value is not None:
+            rows.append((SECTION_RATIO, name, CURRENT_PERIOD, value))
+    rows.extend(_table_rows(SECTION_QUARTERLY, screener_data.get("quarterly_results", {})))
+    rows.extend(_table_rows(SECTION_SHAREHOLDING, screener_data.get("shareholding_pattern", {})))
+    return rows
+
+
+# --- Writes ---
+
+def _metric_id(conn: sqlite3.Connection, db_file: str, section: str, name: str, new_ids: Dict[Tuple[str, str, str], int]) -> int:
+    """
+    Looks up or inserts a metric. Ids first seen in this transaction go into new_ids, and only
+    reach the shared cache once it commits: a rolled-back insert must not leave a stale id.
+    """
+    key = (db_file, section, name)
+    metric_id = _metric_ids.get(key) or new_ids.get(key)
+    if metric_id is None:
+        conn.execute("INSERT INTO metrics (section, name) VALUES (?, ?) ON CONFLICT (section, name) DO NOTHING", (section, name))
+        metric_id = conn.execute("SELECT metric_id FROM metrics WHERE section = ? AND name = ?", (section, name)).fetchone()[0]
+        new_ids[key] = metric_id
+    return metric_id
+
+def bulk_store_screener_data(records: Iterable[Dict[str, Any]]) -> int:
+    """
+    Upserts many fetch_screener_data results in one transaction.
+    Each record needs 'stock_ticker' and 'screener_data'; 'company_name' is optional.
+    Returns the number of metric values written.
+    """
+    db_file = FUNDAMENTALS_DB_FILE
+    conn = get_connection_manager(db_file).get()
+    now = datetime.now()
+    written = 0
+    new_ids: Dict[Tuple[str, str, str], int] = {}
+    with conn:
+        for record in records:
+            screener_data = record.get("screener_data") or {}
+            if screener_data.get("error"):
+                continue
+            symbol = record["stock_ticker"]
+            ticker_id = conn.execute("""
+                INSERT INTO tickers (symbol, company_name, sector, industry, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (symbol) DO UPDATE SET
+                    company_name = COALESCE(excluded.company_name, company_name),
+                    sector = COALESCE(excluded.sector, sector),
+                    industry = COALESCE(excluded.industry, industry),
+                    updated_at = excluded.updated_at
+                RETURNING ticker_id;
+            """, (symbol, record.get("company_name"), screener_data.get("sector"), screener_data.get("industry"), now)).fetchone()[0]
+            values = [(ticker_id, _metric_id(conn, db_file, section, metric, new_ids), period, value)
+                      for section, metric, period, value in screener_rows(screener_data)]
+            conn.executemany("""
+                INSERT INTO metric_values (ticker_id, metric_id, period, value) VALUES (?, ?, ?, ?)
+                ON CONFLICT (ticker_id, metric_id, period) DO UPDATE SET value = excluded.value;
+            """, values)
+            written += len(values)
+    with _metric_ids_lock:
+        _metric_ids.update(new_ids)
+    return written
+
+def store_screener_data(stock_ticker: str, screener_data: Dict[str, Any], company_name: Optional[str] = None) -> int:
+    """Upserts a single fetch_screener_data result."""
+    try:
+        return bulk_store_screener_data([{"stock_ticker": stock_ticker, "screener_data": screener_data, "company_name": company_name}])
+    except sqlite3.Error as e:
+        print(f"Error storing fundamentals for {stock_ticker}: {e}")
+        return 0
+
+
+# --- Queries ---
+
+def _sector_filter(sector: Optional[str]) -> Tuple[str, Dict[str, str]]:
+    if not sector:
+        return "", {}
+    return " AND (t.sector LIKE :sector OR t.industry LIKE :sector)", {"sector": f"%{sector}%"}
+
+def top_by_metric(metric: str, sector: Optional[str] = None, limit: int = 10, section: str = SECTION_RATIO,
+                  period: str = CURRENT_PERIOD, ascending: bool = False) -> List[Dict[str, Any]]:
+    """Ranks tickers by one metric, e.g. top_by_metric('ROCE', sector='auto')."""
+    conn = get_fundamentals_connection()
+    sector_sql, sector_params = _sector_filter(sector)
+    order = "ASC" if ascending else "DESC"
+    rows = conn.execute(f"""
+        SELECT t.symbol, t.company_name, t.sector, mv.value
+        FROM metric_values mv
+        JOIN metrics m ON m.metric_id = mv.metric_id
+        JOIN tickers t ON t.ticker_id = mv.ticker_id
+        WHERE m.section = :section AND m.name = :metric AND mv.period = :period{sector_sql}
+        ORDER BY mv.value {order}
+        LIMIT :limit
+    """, {"section": section, "metric": metric, "period": period, "limit": limit, **sector_params}).fetchall()
+    return [dict(row) for row in rows]
+
+def qoq_growth(metric: str = "NetProfit", sector: Optional[str] = None, limit: int = 10,
+               section: str = SECTION_QUARTERLY) -> List[Dict[str, Any]]:
+    """Ranks tickers by growth between their two latest quarters for a metric."""
+    conn = get_fundamentals_connection()
+    sector_sql, sector_params = _sector_filter(sector)
+    metric_row = conn.execute("SELECT metric_id FROM metrics WHERE section = ? AND name = ?",
+                              (section, normalize_metric(metric))).fetchone()
+    if not metric_row:
+        return []
+    # Two index seeks per ticker on idx_metric_values_series beat a window over every quarter.
+    rows = conn.execute(f"""
+        WITH latest AS (
+            SELECT t.symbol, t.company_name, t.sector,
+                   (SELECT mv.period FROM metric_values mv WHERE mv.metric_id = :metric_id AND mv.ticker_id = t.ticker_id
+                    ORDER BY mv.period DESC LIMIT 1) AS period,
+                   (SELECT mv.value FROM metric_values mv WHERE mv.metric_id = :metric_id AND mv.ticker_id = t.ticker_id
+                    ORDER BY mv.period DESC LIMIT 1) AS value,
+                   (SELECT mv.value FROM metric_values mv WHERE mv.metric_id = :metric_id AND mv.ticker_id = t.ticker_id
+                    ORDER BY mv.period DESC LIMIT 1 OFFSET 1) AS previous_value
+            FROM tickers t
+            WHERE 1 = 1{sector_sql}
+        )
+        SELECT symbol, company_name, sector, period, value, previous_value,
+               (value - previous_value) * 100.0 / ABS(previous_value) AS growth_pct
+        FROM latest
+        WHERE previous_value IS NOT NULL AND previous_value != 0
+        ORDER BY growth_pct DESC
+        LIMIT :limit
+    """, {"metric_id": metric_row["metric_id"], "limit": limit, **sector_params}).fetchall()
+    return [dict(row) for row in rows]
+
+def metric_series(stock_ticker: str, metric: str, section: str = SECTION_QUARTERLY) -> List[Tuple[str, float]]:
+    """All stored (period, value) points for one ticker and metric, oldest first."""
+    conn = get_fundamentals_connection()
+    rows = conn.execute("""
+        SELECT mv.period, mv.value
+        FROM metric_values mv
+        JOIN metrics m ON m.metric_id = mv.metric_id
+        JOIN tickers t ON t.ticker_id = mv.ticker_id
+        WHERE t.symbol = ? AND m.section = ? AND m.name = ?
+        ORDER BY mv.period
+    """, (stock_ticker, section, metric if section == SECTION_RATIO else normalize_metric(metric))).fetchall()
+    return [(row["period"], row["value"]) for row in rows]
+
+
+# --- Benchmark: bulk load and query latency at 2,000 tickers ---
+if __name__ == '__main__':
+    import random
+    import tempfile
+    import time
+
+    N_TICKERS = 2000
+    QUARTERS = [f"{m} {y}" for y in range(2022, 2026) for m in ("Mar", "Jun", "Sep", "Dec")][-12:]
+    SECTORS = ["Automobile and Auto Components", "Information Technology", "Financial Services", "Healthcare", "FMCG"]
+    # Row labels as shown on Screener; the tables are built through normalize_metric, as stored
+    QUARTERLY_METRICS = ["Sales +", "Expenses +", "Operating Profit", "OPM %", "Other Income +", "Interest",
+                         "Depreciation", "Profit before tax", "Tax %", "Net Profit +", "EPS in Rs"]
+    HOLDERS = ["Promoters +", "FIIs +", "DIIs +", "Government +", "Public +", "No. of Shareholders"]
+    RATIOS = ["Market Cap", "Current Price", "High / Low", "Stock P/E", "Book Value", "Dividend Yield",
+              "ROCE", "ROE", "Face Value"]
+
+    def _fake_record(i: int) -> Dict[str, Any]:
+        rnd = random.Random(i)
+        table = lambda metrics: {"headers": QUARTERS, "rows": [
+            {"metric": normalize_metric(m), "values": [f"{rnd.uniform(1, 5000):,.2f}" for _ in QUARTERS]} for m in metrics]}
+        return {
+            "stock_ticker": f"TICK{i:04d}.NS",
+            "company_name": f"Company {i}",
+            "screener_data": {
+                "key_ratios": {r: f"₹ {rnd.uniform(1, 500):,.2f}" for r in RATIOS},
+                "quarterly_results": table(QUARTERLY_METRICS),
+                "shareholding_pattern": table(HOLDERS),
+                "sector": SECTORS[i % len(SECTORS)],
+            },
+        }
+
+    def _time_query(label, fn, repeat=50):
+        fn()  # warm the statement cache
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = fn()
+        print(f"{label:<38} {(time.perf_counter() - start) / repeat * 1000:7.2f} ms  ({len(result)} rows)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        FUNDAMENTALS_DB_FILE = os.path.join(tmp, "fundamentals.db")
+        setup_fundamentals_database()
+        records = [_fake_record(i) for i in range(N_TICKERS)]
+
+        start = time.perf_counter()
+        written = bulk_store_screener_data(records)
+        elapsed = time.perf_counter() - start
+        print(f"Bulk load: {N_TICKERS} tickers, {written:,} values in {elapsed:.2f} s ({written / elapsed:,.0f} rows/s)")
+
+        start = time.perf_counter()
+        bulk_store_screener_data(records)
+        print(f"Re-upsert of the same data: {time.perf_counter() - start:.2f} s")
+
+        _time_query("top ROCE (all)", lambda: top_by_metric("ROCE"))
+        _time_query("top ROCE in autos", lambda: top_by_metric("ROCE", sector="auto"))
+        _time_query("QoQ Net Profit growth (all)", lambda: qoq_growth())
+        _time_query("QoQ Net Profit growth in IT", lambda: qoq_growth(sector="Information"))
+        _time_query("Net Profit series for one ticker", lambda: metric_series("TICK0042.NS", "NetProfit"))
+        _time_query("Promoter holding for one ticker", lambda: metric_series("TICK0042.NS", "Promoters", SECTION_SHAREHOLDING))
@@ -0,0 +1,49 @@
+# In database/models.py
+#
+# Schema for the local fundamentals store. Every scraped number becomes one
+# (ticker, metric, period, value) row so cross-ticker questions can be answered
+# with indexed SQL instead of live scraping.
+
+# --- Metric sections (which part of the Screener page a metric came from) ---
+SECTION_RATIO = "ratio"                  # #top-ratios, stored with period CURRENT_PERIOD
+SECTION_QUARTERLY = "quarterly"          # #quarters table
+SECTION_SHAREHOLDING = "shareholding"    # #shareholding table
+
+CURRENT_PERIOD = "current"               # Ratios are a snapshot, overwritten on each scrape
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS tickers (
+        ticker_id INTEGER PRIMARY KEY,
+        symbol TEXT NOT NULL UNIQUE,
+        company_name TEXT,
+        sector TEXT,
+        industry TEXT,
+        updated_at TIMESTAMP NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS metrics (
+        metric_id INTEGER PRIMARY KEY,
+        section TEXT NOT NULL,
+        name TEXT NOT NULL,
+        UNIQUE (section, name)
+    );
+    """,
+    # Periods are normalised to 'YYYY-MM' so they sort chronologically.
+    """
+    CREATE TABLE IF NOT EXISTS metric_values (
+        ticker_id INTEGER NOT NULL REFERENCES tickers (ticker_id),
+        metric_id INTEGER NOT NULL REFERENCES metrics (metric_id),
+        period TEXT NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (ticker_id, metric_id, period)
+    ) WITHOUT ROWID;
+    """,
+    # Covering index for rankings: "top ROCE" walks (metric, period) in value order.
+    "CREATE INDEX IF NOT EXISTS idx_metric_values_rank ON metric_values (metric_id, period, value);",
+    # Covering index for per-ticker series of one metric: "QoQ profit growth".
+    "CREATE INDEX IF NOT EXISTS idx_metric_values_series ON metric_values (metric_id, ticker_id, period, value);",
+    "CREATE INDEX IF NOT EXISTS idx_tickers_sector ON tickers (sector);",
+    "CREATE INDEX IF NOT EXISTS idx_tickers_industry ON tickers (industry);",
+)
@@ -1,27 +1,121 @@
 import sqlite3
 import json
-from datetime import datetime
+import zlib
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import os
+import time
+
+from stock_analyzer.metrics import CACHE_LOOKUPS
 
 # Get the directory of the current script to ensure the DB is in the project root
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(BASE_DIR, "sessions.db")
+DB_FILE = os.getenv("SESSIONS_DB", os.path.join(BASE_DIR, "sessions.db"))
+
+# --- Connection tuning ---
+DB_THREADS = 2                   # Worker threads behind the async API, each with its own connection
+BUSY_TIMEOUT_MS = 5000           # Wait for a competing writer instead of failing with "database is locked"
+STATEMENT_CACHE_SIZE = 256       # Prepared statements kept per connection
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",          # Readers no longer block the writer (and vice versa)
+    "PRAGMA synchronous=NORMAL;",        # Safe with WAL; avoids an fsync on every commit
+    "PRAGMA cache_size=-16000;",         # ~16 MB page cache per connection
+    "PRAGMA temp_store=MEMORY;",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};",
+)
+
+# --- Session storage ---
+SESSION_FORMAT_VERSION = 1       # First byte of every state_blob; bump when the encoding changes
+SESSION_COMPRESSION_LEVEL = 6
+SESSION_TTL = timedelta(days=7)  # Sessions untouched for longer than this are evicted
+SESSION_CACHE_SIZE = 512         # Decoded sessions kept in memory for hot chats
+SESSION_HISTORY_SIZE = 5         # Past analyses kept per chat for follow-up questions
+EVICTION_BATCH_SIZE = 500
+VACUUM_PAGES_PER_PASS = 1000     # Free pages returned to the OS per incremental_vacuum call
+
+# --- Watchlists ---
+WATCHLIST_MAX_SIZE = 20          # Tickers one chat may watch
+ALERT_LOG_TTL = timedelta(days=30)
+
+
+class ConnectionManager:
+    """
+    Hands out one long-lived connection per thread for a database file.
+    Connections are opened lazily with WAL and the tuned pragmas above, and keep their
+    prepared-statement cache for the life of the process.
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: list[sqlite3.Connection] = []
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+            conn.row_factory = sqlite3.Row  # Makes rows accessible like dicts
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+
+_managers: dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="sqlite")
+
+
+def get_connection_manager(db_file: str | None = None) -> ConnectionManager:
+    """Returns the process-wide manager for a database file (sessions.db by default)."""
+    db_file = db_file or DB_FILE
+    with _managers_lock:
+        if db_file not in _managers:
+            _managers[db_file] = ConnectionManager(db_file)
+        return _managers[db_file]
 
 def get_db_connection():
-    """Establishes a connection to the SQLite database."""
+    """
+    Returns this thread's persistent connection to the SQLite database.
+    Callers must not close it.
+    """
     try:
-        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-        conn.row_factory = sqlite3.Row  # Makes rows accessible like dicts
-        return conn
+        return get_connection_manager().get()
     except sqlite3.Error as e:
         print(f"Database connection error: {e}")
         return None
 
+async def run_db(func, *args):
+    """Runs a blocking database function on the dedicated SQLite threads."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, func, *args)
+
 def setup_database():
     """Creates the necessary tables if they don't exist."""
     conn = get_db_connection()
     if conn:
         try:
+            # Incremental auto-vacuum lets the eviction task give space back without a full VACUUM.
+            # Switching an existing database needs one full VACUUM to take effect.
+            if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+                conn.execute("VACUUM;")
             # Table to store user session data (the result of the last analysis)
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS sessions (
@@ -30,6 +124,24 @@ def setup_database():
                     last_updated TIMESTAMP NOT NULL
                 );
             """)
+            # Sessions are now stored as a versioned, compressed blob; state_json is only read for older rows.
+            session_columns = {row["name"] for row in conn.execute("PRAGMA table_info(sessions);")}
+            if "state_blob" not in session_columns:
+                conn.execute("ALTER TABLE sessions ADD COLUMN state_blob BLOB;")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_updated ON sessions (last_updated);")
+            # The last few analyses per chat, so follow-ups can refer back to an earlier stock
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_history (
+                    history_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    stock_ticker TEXT,
+                    company_name TEXT,
+                    state_blob BLOB NOT NULL,
+                    created_at TIMESTAMP NOT NULL
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_session_history_chat ON session_history (chat_id, created_at);")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_session_history_ticker ON session_history (chat_id, stock_ticker, created_at);")
             # Table to track if we've sent a welcome message
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -37,45 +149,383 @@ def setup_database():
                     first_seen TIMESTAMP NOT NULL
                 );
             """)
+            # Table to persist background analyses across restarts (see job_queue.py)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    chat_id INTEGER NOT NULL,
+                    user_message TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP NOT NULL,
+                    updated_at TIMESTAMP NOT NULL
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);")
+            # Each unfinished job is leased by the worker process running it; only expired leases are recovered
+            job_columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs);")}
+            if "owner" not in job_columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT;")
+            if "lease_expires" not in job_columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires REAL;")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs (status, lease_expires);")
+            # Small key/value table for webhook bookkeeping (e.g. the last seen update_id)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS webhook_state (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+            """)
+            # Memoized graph node outputs (see stock_analyzer/node_cache.py), shared across workers
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS node_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    node TEXT NOT NULL,
+                    value_blob BLOB NOT NULL,
+                    expires_at REAL NOT NULL
+                ) WITHOUT ROWID;
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_node_cache_expires ON node_cache (expires_at);")
+            # Tickers each chat watches for alerts (see stock_analyzer/alerts.py)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS watchlist (
+                    chat_id INTEGER NOT NULL,
+                    stock_ticker TEXT NOT NULL,
+                    added_at TIMESTAMP NOT NULL,
+                    PRIMARY KEY (chat_id, stock_ticker)
+                ) WITHOUT ROWID;
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_watchlist_ticker ON watchlist (stock_ticker);")
+            # Alerts already sent, per ticker and bar, so a signal is pushed once however often it is evaluated
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS alert_log (
+                    stock_ticker TEXT NOT NULL,
+                    rule TEXT NOT NULL,
+                    bar_date TEXT NOT NULL,
+                    sent_at TIMESTAMP NOT NULL,
+                    PRIMARY KEY (stock_ticker, rule, bar_date)
+                ) WITHOUT ROWID;
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_alert_log_sent ON alert_log (sent_at);")
             conn.commit()
             print("SQLite database setup complete.")
         except sqlite3.Error as e:
             print(f"Database setup error: {e}")
-        finally:
-            conn.close()
+
+# --- Statements (kept as constants so every call hits the connection's statement cache) ---
+
+SAVE_SESSION_SQL = """
+    INSERT INTO sessions (chat_id, state_json, state_blob, last_updated)
+    VALUES (?, '', ?, ?)
+    ON CONFLICT(chat_id) DO UPDATE SET
+        state_json=excluded.state_json,
+        state_blob=excluded.state_blob,
+        last_updated=excluded.last_updated;
+"""
+LOAD_SESSION_SQL = "SELECT state_json, state_blob, last_updated FROM sessions WHERE chat_id = ?"
+SESSION_STAMP_SQL = "SELECT last_updated FROM sessions WHERE chat_id = ?"
+EVICT_SESSIONS_SQL = """
+    DELETE FROM sessions WHERE chat_id IN (
+        SELECT chat_id FROM sessions WHERE last_updated < ? LIMIT ?
+    );
+"""
+APPEND_HISTORY_SQL = """
+    INSERT INTO session_history (chat_id, stock_ticker, company_name, state_blob, created_at)
+    VALUES (?, ?, ?, ?, ?);
+"""
+TRIM_HISTORY_SQL = """
+    DELETE FROM session_history WHERE chat_id = ? AND history_id NOT IN (
+        SELECT history_id FROM session_history WHERE chat_id = ? ORDER BY created_at DESC LIMIT ?
+    );
+"""
+LIST_HISTORY_SQL = """
+    SELECT stock_ticker, company_name, created_at FROM session_history
+    WHERE chat_id = ? ORDER BY created_at DESC LIMIT ?
+"""
+LOAD_HISTORY_SQL = """
+    SELECT state_blob FROM session_history
+    WHERE chat_id = ? AND stock_ticker = ? ORDER BY created_at DESC LIMIT 1
+"""
+EVICT_HISTORY_SQL = """
+    DELETE FROM session_history WHERE history_id IN (
+        SELECT history_id FROM session_history WHERE created_at < ? LIMIT ?
+    );
+"""
+REGISTER_USER_SQL = "INSERT INTO users (chat_id, first_seen) VALUES (?, ?) ON CONFLICT(chat_id) DO NOTHING"
+LOAD_USERS_SQL = "SELECT chat_id FROM users"
+LOAD_NODE_RESULT_SQL = "SELECT value_blob, expires_at FROM node_cache WHERE cache_key = ? AND expires_at > ?"
+STORE_NODE_RESULT_SQL = """
+    INSERT INTO node_cache (cache_key, node, value_blob, expires_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(cache_key) DO UPDATE SET value_blob=excluded.value_blob, expires_at=excluded.expires_at;
+"""
+EVICT_NODE_RESULTS_SQL = """
+    DELETE FROM node_cache WHERE cache_key IN (
+        SELECT cache_key FROM node_cache WHERE expires_at <= ? LIMIT ?
+    );
+"""
+ADD_WATCH_SQL = """
+    INSERT INTO watchlist (chat_id, stock_ticker, added_at)
+    SELECT ?, ?, ? WHERE (SELECT COUNT(*) FROM watchlist WHERE chat_id = ?) < ?
+    ON CONFLICT(chat_id, stock_ticker) DO NOTHING;
+"""
+WATCH_EXISTS_SQL = "SELECT 1 FROM watchlist WHERE chat_id = ? AND stock_ticker = ?"
+REMOVE_WATCH_SQL = "DELETE FROM watchlist WHERE chat_id = ? AND stock_ticker = ?"
+LIST_WATCH_SQL = "SELECT stock_ticker FROM watchlist WHERE chat_id = ? ORDER BY added_at"
+LOAD_WATCHERS_SQL = "SELECT stock_ticker, chat_id FROM watchlist ORDER BY stock_ticker"
+RECORD_ALERT_SQL = "INSERT INTO alert_log (stock_ticker, rule, bar_date, sent_at) VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING"
+EVICT_ALERTS_SQL = """
+    DELETE FROM alert_log WHERE (stock_ticker, rule, bar_date) IN (
+        SELECT stock_ticker, rule, bar_date FROM alert_log WHERE sent_at < ? LIMIT ?
+    );
+"""
+
+def encode_session(state_data: dict) -> bytes:
+    """Compact binary form of a session: a format-version byte followed by zlib-compressed JSON."""
+    payload = json.dumps(state_data, separators=(",", ":")).encode("utf-8")
+    return bytes([SESSION_FORMAT_VERSION]) + zlib.compress(payload, SESSION_COMPRESSION_LEVEL)
+
+def decode_session(blob: bytes) -> dict:
+    version = blob[0]
+    if version == 1:
+        return json.loads(zlib.decompress(blob[1:]))
+    raise ValueError(f"Unknown session format version {version}")
+
+
+class _SessionCache:
+    """Thread-safe LRU of decoded sessions, keyed by chat_id and validated against last_updated."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[int, tuple[str, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id: int, stamp: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None or entry[0] != stamp:
+                return None
+            self._entries.move_to_end(chat_id)
+            return entry[1]
+
+    def put(self, chat_id: int, stamp: str, state_data: dict):
+        with self._lock:
+            self._entries[chat_id] = (stamp, state_data)
+            self._entries.move_to_end(chat_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_session_cache = _SessionCache(SESSION_CACHE_SIZE)
 
 def save_session(chat_id: int, state_data: dict):
     """Saves or updates a user's session state in the database."""
     conn = get_db_connection()
     if conn:
         try:
-            conn.execute("""
-                INSERT INTO sessions (chat_id, state_json, last_updated)
-                VALUES (?, ?, ?)
-                ON CONFLICT(chat_id) DO UPDATE SET
-                    state_json=excluded.state_json,
-                    last_updated=excluded.last_updated;
-            """, (chat_id, json.dumps(state_data), datetime.now()))
-            conn.commit()
+            stamp = datetime.now().isoformat(" ")
+            blob = encode_session(state_data)
+            with conn:
+                conn.execute(SAVE_SESSION_SQL, (chat_id, blob, stamp))
+                conn.execute(APPEND_HISTORY_SQL, (chat_id, state_data.get("stock_ticker"), state_data.get("company_name"), blob, stamp))
+                conn.execute(TRIM_HISTORY_SQL, (chat_id, chat_id, SESSION_HISTORY_SIZE))
+            _session_cache.put(chat_id, stamp, state_data)
         except sqlite3.Error as e:
             print(f"Error saving session for chat_id {chat_id}: {e}")
-        finally:
-            conn.close()
 
 def load_session(chat_id: int) -> dict | None:
-    """Loads a user's session state from the database."""
+    """
+    Loads a user's session state from the database.
+    The returned dict may be shared with the cache, so treat it as read-only.
+    """
     conn = get_db_connection()
     if conn:
         try:
-            session_row = conn.execute("SELECT state_json FROM sessions WHERE chat_id = ?", (chat_id,)).fetchone()
+            # Another worker may have saved since we cached, so always check the timestamp first.
+            stamp_row = conn.execute(SESSION_STAMP_SQL, (chat_id,)).fetchone()
+            if not stamp_row:
+                return None
+            cached = _session_cache.get(chat_id, str(stamp_row['last_updated']))
+            CACHE_LOOKUPS.inc(cache="session", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                return cached
+            session_row = conn.execute(LOAD_SESSION_SQL, (chat_id,)).fetchone()
             if session_row:
-                return json.loads(session_row['state_json'])
-        except sqlite3.Error as e:
+                if session_row['state_blob'] is not None:
+                    state_data = decode_session(session_row['state_blob'])
+                else:
+                    state_data = json.loads(session_row['state_json'])
+                _session_cache.put(chat_id, str(session_row['last_updated']), state_data)
+                return state_data
+        except (sqlite3.Error, ValueError, zlib.error) as e:
             print(f"Error loading session for chat_id {chat_id}: {e}")
-        finally:
-            conn.close()
     return None
 
+def load_session_history(chat_id: int, limit: int = SESSION_HISTORY_SIZE) -> list[dict]:
+    """Lists a chat's recent analyses (newest first) without decoding their data."""
+    conn = get_db_connection()
+    if conn:
+        try:
+            return [dict(row) for row in conn.execute(LIST_HISTORY_SQL, (chat_id, limit))]
+        except sqlite3.Error as e:
+            print(f"Error loading session history for chat_id {chat_id}: {e}")
+    return []
+
+def load_history_analyses(chat_id: int, stock_tickers: list[str]) -> list[dict]:
+    """Loads the most recent stored analysis for each of the given tickers."""
+    conn = get_db_connection()
+    analyses = []
+    if conn:
+        try:
+            for stock_ticker in stock_tickers:
+                row = conn.execute(LOAD_HISTORY_SQL, (chat_id, stock_ticker)).fetchone()
+                if row:
+                    analyses.append(decode_session(row['state_blob']))
+        except (sqlite3.Error, ValueError, zlib.error) as e:
+            print(f"Error loading past analyses for chat_id {chat_id}: {e}")
+    return analyses
+
+def evict_expired_sessions(ttl: timedelta = SESSION_TTL) -> int:
+    """Deletes sessions older than the TTL in small batches, then returns free pages to the OS."""
+    conn = get_db_connection()
+    evicted = 0
+    if conn:
+        cutoff = (datetime.now() - ttl).isoformat(" ")
+        try:
+            for evict_sql in (EVICT_SESSIONS_SQL, EVICT_HISTORY_SQL):
+                while True:
+                    with conn:
+                        deleted = conn.execute(evict_sql, (cutoff, EVICTION_BATCH_SIZE)).rowcount
+                    evicted += deleted
+                    if deleted < EVICTION_BATCH_SIZE:
+                        break
+            if evicted:
+                conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_PASS});").fetchall()
+                print(f"Evicted {evicted} expired session and history row(s).")
+        except sqlite3.Error as e:
+            print(f"Error evicting expired sessions: {e}")
+    return evicted
+
+def load_node_result(cache_key: str) -> tuple[dict, float] | None:
+    """Returns (node output, expires_at) for an unexpired cached node result."""
+    conn = get_db_connection()
+    if conn:
+        try:
+            row = conn.execute(LOAD_NODE_RESULT_SQL, (cache_key, time.time())).fetchone()
+            if row:
+                return decode_session(row["value_blob"]), row["expires_at"]
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error loading cached node result {cache_key}: {e}")
+    return None
+
+def store_node_result(cache_key: str, node: str, output: dict, expires_at: float):
+    conn = get_db_connection()
+    if conn:
+        try:
+            with conn:
+                conn.execute(STORE_NODE_RESULT_SQL, (cache_key, node, encode_session(output), expires_at))
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"Error caching node result {cache_key}: {e}")
+
+def evict_expired_node_results() -> int:
+    """Deletes expired node cache rows in small batches."""
+    conn = get_db_connection()
+    evicted = 0
+    if conn:
+        try:
+            while True:
+                with conn:
+                    deleted = conn.execute(EVICT_NODE_RESULTS_SQL, (time.time(), EVICTION_BATCH_SIZE)).rowcount
+                evicted += deleted
+                if deleted < EVICTION_BATCH_SIZE:
+                    break
+            if evicted:
+                print(f"Evicted {evicted} expired node cache row(s).")
+        except sqlite3.Error as e:
+            print(f"Error evicting node cache: {e}")
+    return evicted
+
+def add_to_watchlist(chat_id: int, stock_ticker: str) -> str:
+    """Adds a ticker to a chat's watchlist; returns "added", "exists", "full" or "error"."""
+    conn = get_db_connection()
+    if conn:
+        try:
+            # One statement, so two concurrent adds cannot take a chat past the limit
+            with conn:
+                added = conn.execute(ADD_WATCH_SQL, (chat_id, stock_ticker, datetime.now(), chat_id, WATCHLIST_MAX_SIZE)).rowcount == 1
+            if added:
+                return "added"
+            return "exists" if conn.execute(WATCH_EXISTS_SQL, (chat_id, stock_ticker)).fetchone() else "full"
+        except sqlite3.Error as e:
+            print(f"Error adding {stock_ticker} to the watchlist of chat_id {chat_id}: {e}")
+    return "error"
+
+def remove_from_watchlist(chat_id: int, stock_ticker: str) -> bool:
+    conn = get_db_connection()
+    if conn:
+        try:
+            with conn:
+                return conn.execute(REMOVE_WATCH_SQL, (chat_id, stock_ticker)).rowcount == 1
+        except sqlite3.Error as e:
+            print(f"Error removing {stock_ticker} from the watchlist of chat_id {chat_id}: {e}")
+    return False
+
+def load_watchlist(chat_id: int) -> list[str]:
+    conn = get_db_connection()
+    if conn:
+        try:
+            return [row["stock_ticker"] for row in conn.execute(LIST_WATCH_SQL, (chat_id,))]
+        except sqlite3.Error as e:
+            print(f"Error loading the watchlist of chat_id {chat_id}: {e}")
+    return []
+
+def load_watchers() -> dict[str, list[int]]:
+    """Every watched ticker with the chats watching it, in one scan."""
+    conn = get_db_connection()
+    watchers: dict[str, list[int]] = {}
+    if conn:
+        try:
+            for row in conn.execute(LOAD_WATCHERS_SQL):
+                watchers.setdefault(row["stock_ticker"], []).append(row["chat_id"])
+        except sqlite3.Error as e:
+            print(f"Error loading watchlists: {e}")
+    return watchers
+
+def record_alerts(alerts: list[tuple[str, str, str]]) -> list[tuple[str, str, str]]:
+    """Logs (stock_ticker, rule, bar_date) alerts and returns the ones not logged before, i.e. those still to send."""
+    conn = get_db_connection()
+    new_alerts = []
+    if conn:
+        try:
+            now = datetime.now()
+            with conn:
+                for alert in alerts:
+                    if conn.execute(RECORD_ALERT_SQL, (*alert, now)).rowcount == 1:
+                        new_alerts.append(alert)
+        except sqlite3.Error as e:
+            print(f"Error recording alerts: {e}")
+            return []
+    return new_alerts
+
+def evict_old_alerts(ttl: timedelta = ALERT_LOG_TTL) -> int:
+    conn = get_db_connection()
+    evicted = 0
+    if conn:
+        cutoff = (datetime.now() - ttl).isoformat(" ")
+        try:
+            while True:
+                with conn:
+                    deleted = conn.execute(EVICT_ALERTS_SQL, (cutoff, EVICTION_BATCH_SIZE)).rowcount
+                evicted += deleted
+                if deleted < EVICTION_BATCH_SIZE:
+                    break
+        except sqlite3.Error as e:
+            print(f"Error evicting the alert log: {e}")
+    return evicted
+
 def check_and_register_user(chat_id: int) -> bool:
     """
     Checks if a user is new. If so, registers them and returns True.
@@ -85,17 +535,123 @@ def check_and_register_user(chat_id: int) -> bool:
     is_new_user = False
     if conn:
         try:
-            user = conn.execute("SELECT 1 FROM users WHERE chat_id = ?", (chat_id,)).fetchone()
-            if not user:
-                # User not found, so they are new
-                is_new_user = True
-                conn.execute(
-                    "INSERT INTO users (chat_id, first_seen) VALUES (?, ?)",
-                    (chat_id, datetime.now())
-                )
-                conn.commit()
+            # A single statement, so concurrent workers can't both see the user as new.
+            with conn:
+                is_new_user = conn.execute(REGISTER_USER_SQL, (chat_id, datetime.now())).rowcount == 1
         except sqlite3.Error as e:
             print(f"Error checking user {chat_id}: {e}")
-        finally:
-            conn.close()
-    return is_new_user
\ No newline at end of file
+    return is_new_user
+
+# --- Async API (keeps the event loop off the disk) ---
+
+def session_from_state(final_state: dict) -> dict | None:
+    """The part of a finished analysis kept for follow-ups; None unless it was a successful stock analysis."""
+    if final_state.get('intent') != 'stock_analysis' or (final_state.get('screener_data') or {}).get('error'):
+        return None
+    tech_analysis_to_save = (final_state.get("technical_analysis") or {}).copy()
+    if isinstance(tech_analysis_to_save, dict):
+        tech_analysis_to_save.pop("chart_path", None)  # Chart files are temporary; never persist their paths
+    return {
+        "company_name": final_state.get("company_name"),
+        "stock_ticker": final_state.get("stock_ticker"),
+        "screener_data": final_state.get("screener_data"),
+        "technical_analysis": tech_analysis_to_save,
+        "news_articles": final_state.get("news_articles"),
+        "market_context_articles": final_state.get("market_context_articles"),
+    }
+
+async def asave_session(chat_id: int, state_data: dict):
+    await run_db(save_session, chat_id, state_data)
+
+async def aload_session(chat_id: int) -> dict | None:
+    return await run_db(load_session, chat_id)
+
+async def aload_session_history(chat_id: int, limit: int = SESSION_HISTORY_SIZE) -> list[dict]:
+    return await run_db(load_session_history, chat_id, limit)
+
+async def aload_history_analyses(chat_id: int, stock_tickers: list[str]) -> list[dict]:
+    return await run_db(load_history_analyses, chat_id, stock_tickers)
+
+async def acheck_and_register_user(chat_id: int) -> bool:
+    return await run_db(check_and_register_user, chat_id)
+
+async def aadd_to_watchlist(chat_id: int, stock_ticker: str) -> str:
+    return await run_db(add_to_watchlist, chat_id, stock_ticker)
+
+async def aremove_from_watchlist(chat_id: int, stock_ticker: str) -> bool:
+    return await run_db(remove_from_watchlist, chat_id, stock_ticker)
+
+async def aload_watchlist(chat_id: int) -> list[str]:
+    return await run_db(load_watchlist, chat_id)
+
+async def aload_watchers() -> dict[str, list[int]]:
+    return await run_db(load_watchers)
+
+async def arecord_alerts(alerts: list[tuple[str, str, str]]) -> list[tuple[str, str, str]]:
+    return await run_db(record_alerts, alerts)
+
+
+# --- Benchmark: persistent connections vs. connect-per-call ---
+if __name__ == '__main__':
+    import tempfile
+    import time
+
+    def _connect_per_call(db_file):
+        """The previous behaviour: a fresh connection (default pragmas) for every call."""
+        def save(chat_id, state_data):
+            conn = sqlite3.connect(db_file)
+            try:
+                conn.execute(
+                    "INSERT INTO sessions (chat_id, state_json, last_updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET state_json=excluded.state_json, last_updated=excluded.last_updated;",
+                    (chat_id, json.dumps(state_data), datetime.now()))
+                conn.commit()
+            finally:
+                conn.close()
+        def load(chat_id):
+            conn = sqlite3.connect(db_file)
+            try:
+                row = conn.execute("SELECT state_json FROM sessions WHERE chat_id = ?", (chat_id,)).fetchone()
+                return json.loads(row[0]) if row else None
+            finally:
+                conn.close()
+        def register(chat_id):
+            conn = sqlite3.connect(db_file)
+            try:
+                if not conn.execute("SELECT 1 FROM users WHERE chat_id = ?", (chat_id,)).fetchone():
+                    conn.execute("INSERT INTO users (chat_id, first_seen) VALUES (?, ?)", (chat_id, datetime.now()))
+                    conn.commit()
+                    return True
+                return False
+            finally:
+                conn.close()
+        return save, load, register
+
+    def _bench(label, save, load, register, n):
+        payload = {"company_name": "Benchmark Ltd", "screener_data": {"key_ratios": {f"k{i}": str(i) for i in range(40)}}}
+        results = {}
+        for name, op in (("save_session", lambda i: save(i % 100, payload)),
+                         ("load_session", lambda i: load(i % 100)),
+                         ("check_and_register_user", lambda i: register(i))):
+            start = time.perf_counter()
+            for i in range(n):
+                op(i)
+            results[name] = n / (time.perf_counter() - start)
+        print(f"{label:<22}" + "  ".join(f"{k}: {v:>9,.0f} ops/s" for k, v in results.items()))
+        return results
+
+    N = 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        old_file = os.path.join(tmp, "per_call.db")
+        DB_FILE = old_file
+        setup_database()
+        get_connection_manager(old_file).close_all()
+        with sqlite3.connect(old_file) as c:
+            c.execute("PRAGMA journal_mode=DELETE;")
+        baseline = _bench("connect-per-call", *_connect_per_call(old_file), N)
+
+        DB_FILE = os.path.join(tmp, "persistent.db")
+        setup_database()
+        improved = _bench("persistent + WAL", save_session, load_session, check_and_register_user, N)
+        for name in baseline:
+            print(f"  {name}: {improved[name] / baseline[name]:.1f}x")
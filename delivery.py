@@ -0,0 +1,133 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram.request import HTTPXRequest
+
+from sanitize import split_for_telegram, TELEGRAM_MAX_MESSAGE_LENGTH
+from stock_analyzer import speculative, tracing
+from stock_analyzer.metrics import EXTERNAL_CALL_DURATION
+from stock_analyzer.reporter import build_key_ratios_card
+from stock_analyzer.comparison import format_comparison_card
+
+
+class MetricsRequest(HTTPXRequest):
+    """The bot's HTTP transport, timing every Bot API call (sendMessage, sendPhoto, ...) for /metrics."""
+
+    async def do_request(self, url: str, *args, **kwargs):
+        service = f"telegram.{url.rsplit('/', 1)[-1]}"
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with tracing.span(f"call:{service}", service=service) as call_span:
+                code, payload = await super().do_request(url, *args, **kwargs)
+                if call_span is not None:
+                    call_span.set("status_code", code)
+            outcome = "ok" if code < 400 else "error"
+            return code, payload
+        finally:
+            EXTERNAL_CALL_DURATION.observe(time.perf_counter() - started, service=service, outcome=outcome)
+
+
+async def send_long_message(bot, chat_id: int, text: str, max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH):
+    chunks = split_for_telegram(text, max_length)
+    for i, chunk in enumerate(chunks):
+        if i:
+            await asyncio.sleep(0.5)
+        await bot.send_message(chat_id=chat_id, text=chunk, parse_mode='HTML')
+
+
+async def stream_graph(graph, initial_state: Dict[str, Any]):
+    """
+    Runs a compiled graph on the event loop and yields (node name, update, state so far) as each node finishes.
+    When the run ends, however it ends, any speculative fetches it launched and never used are discarded.
+    """
+    state: Dict[str, Any] = dict(initial_state)
+    speculation_id = None
+    try:
+        async for mode, chunk in graph.astream(initial_state, stream_mode=["updates", "values"]):
+            if mode == "values":
+                state = chunk
+                continue
+            for node, update in chunk.items():
+                speculation_id = (update or {}).get("speculation_id") or speculation_id
+                yield node, update or {}, state
+    finally:
+        speculative.discard(speculation_id or state.get("speculation_id"))
+
+
+class ProgressiveDelivery:
+    """
+    Sends each artifact of an analysis as soon as the node producing it finishes:
+    key-ratios card after Screener, chart after technicals, report text, then the PDF.
+    A comparison sends its side-by-side table and chart, then the report text.
+    """
+
+    def __init__(self, bot, chat_id: int, before_first_send: Callable[[], Awaitable[None]]):
+        self.bot = bot
+        self.chat_id = chat_id
+        self._before_first_send = before_first_send
+        self.sent_anything = False
+        self._handlers: Dict[str, Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[None]]] = {
+            "fetch_screener": self._send_key_ratios,
+            "fetch_technicals": self._send_chart,
+            "generate_pdf": self._send_pdf,
+            "fetch_comparison": self._send_comparison,
+        }
+
+    async def handle(self, node: str, update: Dict[str, Any], state: Dict[str, Any]):
+        handler = self._handlers.get(node)
+        if handler:
+            await handler(update, state)
+        elif update.get("messages"):
+            # Report text, follow-up answers, greetings and other replies
+            await self._send_text(update["messages"][-1].content)
+
+    async def _mark(self):
+        if not self.sent_anything:
+            await self._before_first_send()
+            self.sent_anything = True
+
+    async def _send_text(self, text: str):
+        await self._mark()
+        await send_long_message(self.bot, self.chat_id, text)
+
+    async def _send_key_ratios(self, update: Dict[str, Any], state: Dict[str, Any]):
+        screener_data = update.get("screener_data") or {}
+        if screener_data.get("error") or not screener_data.get("key_ratios"):
+            return
+        await self._send_text(build_key_ratios_card({**state, **update}))
+
+    async def _send_chart(self, update: Dict[str, Any], state: Dict[str, Any]):
+        tech_analysis = update.get("technical_analysis")
+        if isinstance(tech_analysis, dict) and (chart_path := tech_analysis.get("chart_path")) and os.path.exists(chart_path):
+            await self._mark()
+            with open(chart_path, 'rb') as photo_file:
+                await self.bot.send_photo(chat_id=self.chat_id, photo=photo_file)
+            # The chart is kept: cached technicals point at it. SessionJanitor removes stale ones.
+
+    async def _send_comparison(self, update: Dict[str, Any], state: Dict[str, Any]):
+        comparison = update.get("comparison") or {}
+        if (comparison.get("table") or {}).get("rows"):
+            await self._send_text(format_comparison_card(comparison["table"]))
+        if (chart_path := comparison.get("chart_path")) and os.path.exists(chart_path):
+            await self._mark()
+            with open(chart_path, 'rb') as photo_file:
+                await self.bot.send_photo(chat_id=self.chat_id, photo=photo_file)
+            _remove(chart_path)   # Drawn for this comparison only; nothing caches it
+
+    async def _send_pdf(self, update: Dict[str, Any], state: Dict[str, Any]):
+        if (pdf_path := update.get("pdf_report_path")) and os.path.exists(pdf_path):
+            await self._mark()
+            with open(pdf_path, "rb") as pdf_file:
+                await self.bot.send_document(chat_id=self.chat_id, document=pdf_file, filename=update.get("pdf_filename"), caption="Here is your professional PDF research report.")
+            _remove(pdf_path)
+
+
+def _remove(path: Optional[str]):
+    try:
+        os.remove(path)
+        print(f"Cleaned up file: {path}")
+    except Exception as e:
+        print(f"Error cleaning up file {path}: {e}")
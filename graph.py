@@ -1,70 +1,123 @@
-import os
+import asyncio
+import re
+import time
 import random
 import json
-from typing import TypedDict, List, Any, Optional, Dict
+import operator
+from typing import TypedDict, List, Any, Optional, Dict, Annotated
 
-from dotenv import load_dotenv
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import BaseMessage, AIMessage, HumanMessage
-import google.generativeai as genai
 
 # Import your existing nodes and db functions
-from stock_analyzer.intent_classifier import classify_intent
-from stock_analyzer.screener import fetch_screener_data
-from stock_analyzer.technicals import fetch_technical_analysis
-from stock_analyzer.news import fetch_stock_news
-from stock_analyzer.market_news import fetch_market_context_news
-from stock_analyzer.reporter import generate_report
-from stock_analyzer.reporter_pdf import generate_pdf_report
-from db_manager import load_session
-
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-llm = genai.GenerativeModel('gemini-2.0-flash')
+from stock_analyzer.intent_classifier import aclassify_intent
+from stock_analyzer.screener import afetch_screener_data
+from stock_analyzer.technicals import afetch_technical_analysis, afetch_technical_data, arender_technical_analysis
+from stock_analyzer.news import afetch_stock_news
+from stock_analyzer.market_news import afetch_market_context_news
+from stock_analyzer.reporter import agenerate_report, build_fallback_report
+from stock_analyzer.session_sections import build_follow_up_context
+from stock_analyzer import comparison
+from stock_analyzer import speculative
+from stock_analyzer.node_cache import memoized, is_cached
+from stock_analyzer.deadlines import with_deadline
+from stock_analyzer import llm
+from stock_analyzer.lazy import lazy_module
+from stock_analyzer.metrics import instrumented
+from db_manager import aload_session, aload_session_history, aload_history_analyses
+
+reporter_pdf = lazy_module("stock_analyzer.reporter_pdf")
+
 
 # --- AgentState Definition ---
 class AgentState(TypedDict):
     messages: List[BaseMessage]
     intent: Optional[str]
     stock_ticker: Optional[str]
+    stock_tickers: Optional[List[str]]
     company_name: Optional[str]
     screener_data: Optional[Dict[str, Any]]
     technical_analysis: Optional[Dict[str, Any]]
     news_articles: Optional[List[Dict[str, str]]]
     market_context_articles: Optional[List[Dict[str, str]]]
+    comparison: Optional[Dict[str, Any]]
     pdf_report_path: Optional[str]
     pdf_filename: Optional[str]
     chat_id: Optional[int]
     session_data: Optional[Dict[str, Any]]
+    session_history: Optional[List[Dict[str, Any]]]
+    speculation_id: Optional[str]
+    run_deadline: Optional[float]
+    # Sections abandoned at their deadline; parallel nodes append to it
+    missing_sections: Annotated[List[str], operator.add]
     next_node: Optional[str]
 
 
 # --- Node Functions ---
+# All nodes are async: the graph runs on the event loop via astream/ainvoke, and
+# CPU-bound steps inside them are offloaded to threads explicitly.
 
-def generate_greeting_response(state: AgentState) -> Dict[str, Any]:
+async def generate_greeting_response(state: AgentState) -> Dict[str, Any]:
     return {"messages": state['messages'] + [AIMessage(content="Hello! I am EquiSage, your AI stock research assistant. Which stock can I analyze for you today?")]}
 
-def generate_help_response(state: AgentState) -> Dict[str, Any]:
-    return {"messages": state['messages'] + [AIMessage(content="I am EquiSage! Ask me to analyze any Indian stock by name (e.g., 'tell me about Reliance Industries') to get a full report.")]}
+async def generate_help_response(state: AgentState) -> Dict[str, Any]:
+    return {"messages": state['messages'] + [AIMessage(content="I am EquiSage! Ask me to analyze any Indian stock by name (e.g., 'tell me about Reliance Industries') to get a full report, or to compare a few (e.g., 'compare TCS vs INFY vs WIPRO').")]}
 
-def generate_off_topic_response(state: AgentState) -> Dict[str, Any]:
+async def generate_off_topic_response(state: AgentState) -> Dict[str, Any]:
     fallback_replies = ["My circuits are 100% focused on candlestick charts. Try asking me about a stock!", "That question is currently trading outside my knowledge-circuit. Let's talk about the Indian market."]
     return {"messages": state['messages'] + [AIMessage(content=random.choice(fallback_replies))]}
 
-def run_report_generation(state: AgentState) -> Dict[str, Any]:
+async def generate_busy_response(state: AgentState) -> Dict[str, Any]:
+    return {"messages": state['messages'] + [AIMessage(content="Sorry, I'm a little overloaded right now and couldn't get to your message in time. Please try again in a moment.")]}
+
+async def run_report_generation(state: AgentState) -> Dict[str, Any]:
     print("---NODE: Preparing to generate final AI message---")
-    report_text = generate_report(state).get("final_report", "An error occurred while generating the report.")
+    report_text = (await agenerate_report(state)).get("final_report", "An error occurred while generating the report.")
     return {"messages": state['messages'] + [AIMessage(content=report_text)]}
 
-def run_pdf_report_generation(state: AgentState) -> Dict[str, Any]:
+async def run_pdf_report_generation(state: AgentState) -> Dict[str, Any]:
     print("---NODE: Generating PDF report---")
     if state.get("screener_data") and not state["screener_data"].get("error"):
-        pdf_result = generate_pdf_report(state)
+        # The first PDF imports reportlab; keep that off the event loop.
+        pdf_module = await asyncio.to_thread(reporter_pdf.load)
+        pdf_result = await pdf_module.agenerate_pdf_report(state)
         return {"pdf_report_path": pdf_result.get("pdf_report_path"), "pdf_filename": pdf_result.get("pdf_filename")}
     return {}
 
-def answer_follow_up_question(state: AgentState) -> Dict[str, Any]:
+_NAME_STOPWORDS = {"ltd", "limited", "india", "the", "and", "of", "company", "corporation", "industries", "bank"}
+
+def _first_name_word(company_name: str) -> Optional[str]:
+    words = company_name.lower().split()
+    if words and len(words[0]) > 2 and words[0] not in _NAME_STOPWORDS:
+        return words[0]
+    return None
+
+def resolve_referenced_analyses(question: str, history: List[Dict[str, Any]]) -> List[str]:
+    """
+    Returns the tickers of past analyses that the question mentions, in history order.
+    An entry matches on its NSE symbol, its full company name, or the first word of the name
+    when no other entry shares it ("infosys" is fine, "tata" is ambiguous).
+    """
+    question = question.lower()
+    first_words = [_first_name_word(entry.get("company_name") or "") for entry in history]
+    referenced = []
+    for entry, first_word in zip(history, first_words):
+        ticker = entry.get("stock_ticker")
+        if not ticker or ticker in referenced:
+            continue
+        aliases = [ticker.replace(".NS", "").lower()]
+        if entry.get("company_name"):
+            company_name = entry["company_name"].lower()
+            aliases += [company_name, re.sub(r"\s+(ltd|limited)\.?$", "", company_name)]
+        if first_word and first_words.count(first_word) == 1:
+            aliases.append(first_word)
+        if any(re.search(rf"\b{re.escape(alias)}\b", question) for alias in aliases):
+            referenced.append(ticker)
+    return referenced
+
+async def answer_follow_up_question(state: AgentState) -> Dict[str, Any]:
     print("---NODE: Answering Follow-up Question---")
+    started = time.perf_counter()
     messages = state['messages']
     user_question = messages[-1].content
     
@@ -72,20 +125,40 @@ def answer_follow_up_question(state: AgentState) -> Dict[str, Any]:
     if not session_data:
         return {"messages": messages + [AIMessage(content="I seem to have lost our previous conversation context. Please ask for a new analysis.")]}
 
-    company_name = session_data.get("company_name", "the previously discussed company")
-
-    prompt = f"""You are EquiSage, a helpful AI stock analyst. The user is asking a follow-up question about **{company_name}**.
+    # Answer from whichever stored analyses the question names; default to the latest one.
+    analyses = [session_data]
+    referenced = resolve_referenced_analyses(user_question, state.get("session_history") or [])
+    if referenced:
+        analyses = await aload_history_analyses(state.get("chat_id"), referenced) or analyses
+        print(f"Follow-up refers to stored analyses: {', '.join(referenced)}")
+
+    company_names = " and ".join(f"**{a.get('company_name', 'the previously discussed company')}**" for a in analyses)
+    # Only send the sections of each analysis that the question is about.
+    context_parts, full_size = [], 0
+    for analysis in analyses:
+        section_context, sections, analysis_size = build_follow_up_context(analysis, user_question)
+        full_size += analysis_size
+        context_parts.append(f"--- Analysis of {analysis.get('company_name', 'N/A')} ({analysis.get('stock_ticker', 'N/A')}) ---\n{section_context}")
+        print(f"Follow-up sections for {analysis.get('stock_ticker')}: {', '.join(sections)}")
+    data_context = "\n\n".join(context_parts)
+
+    prompt = f"""You are EquiSage, a helpful AI stock analyst. The user is asking a follow-up question about {company_names}.
     Your task is to answer the user's question based *only* on the provided data from the previous analysis.
     If the data does not contain the answer, state that clearly and politely. Be concise.
 
     **User's Question:** "{user_question}"
     **Data Context from Previous Analysis:**
-    {json.dumps(session_data, indent=2)}"""
+    {data_context}"""
+    reduction = 100 * (1 - len(data_context) / full_size) if full_size else 0
+    print(f"Follow-up prompt context: {len(data_context)} chars instead of {full_size} ({reduction:.0f}% smaller).")
     
-    response = llm.generate_content(prompt)
-    return {"messages": messages + [AIMessage(content=response.text)]}
+    llm_started = time.perf_counter()
+    answer = await llm.generate("answer_follow_up", prompt, priority=llm.PRIORITY_INTERACTIVE)
+    finished = time.perf_counter()
+    print(f"Follow-up answered in {finished - started:.2f}s (LLM {finished - llm_started:.2f}s).")
+    return {"messages": messages + [AIMessage(content=answer)]}
 
-def conversational_router(state: AgentState) -> Dict[str, Any]:
+async def conversational_router(state: AgentState) -> Dict[str, Any]:
     """
     This node prioritizes checking for a follow-up before classifying intent.
     """
@@ -94,38 +167,48 @@ def conversational_router(state: AgentState) -> Dict[str, Any]:
     chat_id = state.get('chat_id')
 
     # 1. Prioritize checking for a follow-up conversation from the database.
-    session_data = load_session(chat_id)
+    session_data = await aload_session(chat_id)
     if session_data:
         print("Previous session found. Asking LLM to determine if this is a follow-up.")
         company_name = session_data.get("company_name", "a stock")
+        session_history = await aload_session_history(chat_id)
+        earlier_topics = ", ".join(
+            f"{entry.get('company_name')} ({entry.get('stock_ticker')})" for entry in session_history[1:]
+        ) or "None"
 
         prompt = f"""You are a conversation router for a stock analysis bot. The user's previous analysis was about **{company_name}**. Now, the user has sent a new message.
-        Decide if the new message is a follow-up question about the previous analysis, a request for a completely new analysis, or something else.
+        Decide if the new message is a follow-up question about the previous analysis (or one of the earlier analyses), a request for a completely new analysis, or something else.
 
         Previous Topic: Analysis of {company_name}
+        Earlier Analyses in this Chat: {earlier_topics}
         User's New Message: "{user_message}"
 
         Respond with a single word: **FOLLOWUP**, **NEW**, or **OTHER**.
-        - **FOLLOWUP**: If the message asks a question about the previous topic (e.g., "what was its PE ratio?", "tell me more about the fundamentals").
-        - **NEW**: If the message clearly asks for a different stock (e.g., "now analyze Reliance", "what about TCS?").
+        - **FOLLOWUP**: If the message asks a question about the previous topic or an earlier analysis, including comparisons between them (e.g., "what was its PE ratio?", "tell me more about the fundamentals", "how did it compare to the INFY one?").
+        - **NEW**: If the message clearly asks for a stock that has not been analyzed yet (e.g., "now analyze Reliance", "what about TCS?").
         - **OTHER**: If it's a greeting, a thank you, or something unrelated.
         """
-        response = llm.generate_content(prompt)
-        decision = response.text.strip().upper()
+        decision = (await llm.generate("conversational_router", prompt, priority=llm.PRIORITY_ROUTING)).strip().upper()
         print(f"Router Decision: {decision}")
 
         if decision == "FOLLOWUP":
-            return {"session_data": session_data, "next_node": "answer_follow_up"}
+            return {"session_data": session_data, "session_history": session_history, "next_node": "answer_follow_up"}
             
     # 2. If it's not a follow-up, THEN classify the intent of the message.
     print("No follow-up context, or router decided it's a new request. Classifying intent...")
-    classification_state = classify_intent(state)
+    classification_state = await aclassify_intent(state)
     intent = classification_state.get("intent")
     
     if intent == "stock_analysis" and classification_state.get("stock_ticker"):
         updates = classification_state
+        if speculative.SPECULATIVE_FETCH:
+            # Everything but Screener only needs the ticker: start it now, alongside the scrape.
+            cached = [name for name, node in SPECULATIVE_NODES.items() if await is_cached(node, updates)]
+            updates["speculation_id"] = speculative.launch(updates["stock_ticker"], skip=cached)
         updates["next_node"] = "fetch_screener"
         return updates
+    elif intent == "comparison" and classification_state.get("stock_tickers"):
+        return {**classification_state, "next_node": "fetch_comparison"}
     elif intent in ["greeting", "help"]:
         return {"next_node": f"generate_{intent}"}
     else:
@@ -134,35 +217,178 @@ def conversational_router(state: AgentState) -> Dict[str, Any]:
 
 # --- Conditional Edge Functions ---
 
-def decide_next_node(state: AgentState) -> str:
+async def decide_next_node(state: AgentState) -> str:
     """This function reads the decision from the state and tells the graph where to go."""
     return state.get("next_node")
 
-def route_after_screener(state: AgentState) -> str:
-    """Checks if screener data was fetched successfully."""
+async def route_after_screener(state: AgentState) -> str:
+    """Checks if screener data was fetched successfully (or only timed out, in which case the report goes ahead without it)."""
     if state.get("screener_data") and not state["screener_data"].get("error"):
         return "fetch_data_parallel"
+    elif "fundamentals" in (state.get("missing_sections") or []):
+        return "fetch_data_parallel"
     else:
+        speculative.cancel(state.get("speculation_id"))
         return "generate_off_topic"
 
 
+# --- Speculative Fetch Nodes ---
+# Each uses the result launched by the router when there is one, else fetches as before.
+
+SPECULATIVE_NODES = {
+    speculative.TECHNICALS: "fetch_technicals",
+    speculative.STOCK_NEWS: "fetch_stock_news",
+    speculative.MARKET_NEWS: "fetch_market_news",
+}
+
+async def _finish_technicals(data: Dict[str, Any], state: AgentState) -> Dict[str, Any]:
+    # The chart title needs Screener's company name, so only the drawing waits for it.
+    return await arender_technical_analysis(data, state["stock_ticker"], state.get("company_name") or state["stock_ticker"])
+
+async def _finish_stock_news(result: Dict[str, Any], state: AgentState) -> Dict[str, Any]:
+    # A bare ticker finds nothing for some smaller companies; retry with the company name.
+    return result if result.get("news_articles") else await afetch_stock_news(state)
+
+async def _finish_market_news(result: Dict[str, Any], state: AgentState) -> Dict[str, Any]:
+    return result
+
+async def fan_out(state: AgentState) -> Dict[str, Any]:
+    """Pseudo-node the parallel fetch branches start from."""
+    return {}
+
+fetch_technicals_node = speculative.speculative_node(speculative.TECHNICALS, afetch_technical_analysis, _finish_technicals)
+fetch_stock_news_node = speculative.speculative_node(speculative.STOCK_NEWS, afetch_stock_news, _finish_stock_news)
+fetch_market_news_node = speculative.speculative_node(speculative.MARKET_NEWS, afetch_market_context_news, _finish_market_news)
+
+
+# --- Memoized Nodes ---
+# Served from the node cache while fresh (see stock_analyzer/node_cache.py for TTLs and opt-outs).
+
+fetch_screener_node = memoized("fetch_screener", afetch_screener_data)
+fetch_technicals_node = memoized("fetch_technicals", fetch_technicals_node)
+fetch_stock_news_node = memoized("fetch_stock_news", fetch_stock_news_node)
+fetch_market_news_node = memoized("fetch_market_news", fetch_market_news_node)
+
+
+# --- Deadline-Bound Nodes ---
+# Fallback output used when a node misses its deadline (see stock_analyzer/deadlines.py).
+
+fetch_screener_node = with_deadline("fetch_screener", fetch_screener_node, "fundamentals",
+                                    lambda state: {"screener_data": {}})
+fetch_technicals_node = with_deadline("fetch_technicals", fetch_technicals_node, "technicals",
+                                      lambda state: {"technical_analysis": {"error": "Timed out"}})
+fetch_stock_news_node = with_deadline("fetch_stock_news", fetch_stock_news_node, "company news",
+                                      lambda state: {"news_articles": []})
+fetch_market_news_node = with_deadline("fetch_market_news", fetch_market_news_node, "market context",
+                                       lambda state: {"market_context_articles": []})
+generate_report_node = with_deadline("generate_report", run_report_generation, "AI write-up",
+                                     lambda state: {"messages": state['messages'] + [AIMessage(content=build_fallback_report(state))]})
+generate_pdf_node = with_deadline("generate_pdf", run_pdf_report_generation, "PDF report", lambda state: {})
+router_node = with_deadline("router", conversational_router, "routing", lambda state: {"next_node": "generate_busy"})
+answer_follow_up_node = with_deadline("answer_follow_up", answer_follow_up_question, "follow-up answer",
+                                      lambda state: {"messages": state['messages'] + [AIMessage(content="Sorry, I couldn't answer that in time. Please ask again.")]})
+
+
+# --- Comparison Nodes ---
+# Every ticker's Screener, technicals and news fetches run concurrently, through the same
+# cached, deadline-bound nodes as a single analysis. Market news is fetched once for all
+# of them, and a single report and chart cover the whole comparison.
+
+async def _comparison_technicals(state: Dict[str, Any]) -> Dict[str, Any]:
+    # Only the numbers: the comparison draws one chart for all tickers instead of one each
+    return {"technical_data": await afetch_technical_data(state["stock_ticker"])}
+
+fetch_comparison_technicals_node = with_deadline("fetch_technicals", _comparison_technicals, "technicals",
+                                                 lambda state: {"technical_data": {"error": "Timed out"}})
+
+async def _fetch_company(stock_ticker: str, run_deadline: Optional[float]) -> Dict[str, Any]:
+    ticker_state = {"stock_ticker": stock_ticker, "run_deadline": run_deadline}
+
+    async def screener_then_news() -> Dict[str, Any]:
+        screener = await fetch_screener_node(ticker_state)
+        if not screener.get("screener_data") or screener["screener_data"].get("error"):
+            return screener
+        news = await fetch_stock_news_node({**ticker_state, "company_name": screener.get("company_name") or stock_ticker})
+        return {**screener, **news, "missing_sections": screener.get("missing_sections", []) + news.get("missing_sections", [])}
+
+    fundamentals, technicals = await asyncio.gather(screener_then_news(), fetch_comparison_technicals_node(ticker_state))
+    return {"stock_ticker": stock_ticker, **fundamentals, **technicals}
+
+async def fetch_comparison_data(state: AgentState) -> Dict[str, Any]:
+    print("---NODE: Fetching Comparison Data---")
+    tickers = state["stock_tickers"]
+    fetched = await asyncio.gather(fetch_market_news_node(state),
+                                   *(_fetch_company(ticker, state.get("run_deadline")) for ticker in tickers))
+    market_news, results = fetched[0], fetched[1:]
+
+    companies, closes, missing = [], {}, []
+    for result in results:
+        missing += [f"{result['stock_ticker']} {section}" for section in result.get("missing_sections", [])]
+        screener_data = result.get("screener_data") or {}
+        if screener_data.get("error") or not screener_data:
+            print(f"Leaving {result['stock_ticker']} out of the comparison: no fundamentals.")
+            continue
+        technical_data = result.get("technical_data") or {}
+        if "df" in technical_data:
+            closes[result["stock_ticker"]] = technical_data["df"]["Close"]
+        companies.append({
+            "stock_ticker": result["stock_ticker"],
+            "company_name": result.get("company_name"),
+            "screener_data": screener_data,
+            "technical_summary": technical_data.get("summary"),
+            "news_articles": result.get("news_articles") or [],
+        })
+
+    chart_path = None
+    if len(closes) >= 2:
+        returns = comparison.one_year_returns(closes)
+        for company in companies:
+            company["one_year_return"] = returns.get(company["stock_ticker"])
+        try:
+            chart_path = await asyncio.to_thread(comparison.render_comparison_chart, closes)
+        except Exception as e:
+            print(f"Comparison chart failed: {e}")
+    return {
+        "comparison": {"companies": companies, "table": comparison.build_comparison_table(companies), "chart_path": chart_path},
+        "market_context_articles": market_news.get("market_context_articles", []),
+        "missing_sections": missing + market_news.get("missing_sections", []),
+    }
+
+async def run_comparison_report(state: AgentState) -> Dict[str, Any]:
+    print("---NODE: Generating Comparison Report---")
+    report_text = await comparison.agenerate_comparison_report(state.get("comparison") or {}, state.get("market_context_articles") or [])
+    return {"messages": state['messages'] + [AIMessage(content=report_text)]}
+
+fetch_comparison_node = with_deadline("fetch_comparison", fetch_comparison_data, "comparison data",
+                                      lambda state: {"comparison": {"companies": [], "table": {"headers": [], "rows": []}}})
+generate_comparison_node = with_deadline("generate_comparison", run_comparison_report, "AI comparison",
+                                         lambda state: {"messages": state['messages'] + [AIMessage(content=comparison.build_fallback_comparison(state.get("comparison") or {}))]})
+
+
 # --- Build the Graph ---
 
 workflow = StateGraph(AgentState)
 
-# 1. Add all nodes
-workflow.add_node("router", conversational_router)
-workflow.add_node("answer_follow_up", answer_follow_up_question)
-workflow.add_node("fetch_screener", fetch_screener_data)
-workflow.add_node("fetch_data_parallel", lambda state: {}) # Pseudo-node for parallelism
-workflow.add_node("fetch_technicals", fetch_technical_analysis)
-workflow.add_node("fetch_stock_news", fetch_stock_news)
-workflow.add_node("fetch_market_news", fetch_market_context_news)
-workflow.add_node("generate_report", run_report_generation)
-workflow.add_node("generate_pdf", run_pdf_report_generation)
-workflow.add_node("generate_greeting", generate_greeting_response)
-workflow.add_node("generate_help", generate_help_response)
-workflow.add_node("generate_off_topic", generate_off_topic_response)
+# 1. Add all nodes (each one timed and counted for /metrics)
+GRAPH_NODES = {
+    "router": router_node,
+    "answer_follow_up": answer_follow_up_node,
+    "fetch_screener": fetch_screener_node,
+    "fetch_data_parallel": fan_out, # Pseudo-node for parallelism
+    "fetch_technicals": fetch_technicals_node,
+    "fetch_stock_news": fetch_stock_news_node,
+    "fetch_market_news": fetch_market_news_node,
+    "generate_report": generate_report_node,
+    "generate_pdf": generate_pdf_node,
+    "fetch_comparison": fetch_comparison_node,
+    "generate_comparison": generate_comparison_node,
+    "generate_greeting": generate_greeting_response,
+    "generate_help": generate_help_response,
+    "generate_off_topic": generate_off_topic_response,
+    "generate_busy": generate_busy_response,
+}
+for node_name, node in GRAPH_NODES.items():
+    workflow.add_node(node_name, instrumented(node_name, node))
 
 # 2. Set the entry point
 workflow.set_entry_point("router")
@@ -173,10 +399,12 @@ workflow.add_conditional_edges(
     decide_next_node,
     {
         "fetch_screener": "fetch_screener",
+        "fetch_comparison": "fetch_comparison",
         "answer_follow_up": "answer_follow_up",
         "generate_greeting": "generate_greeting",
         "generate_help": "generate_help",
         "generate_off_topic": "generate_off_topic",
+        "generate_busy": "generate_busy",
     }
 )
 
@@ -193,11 +421,15 @@ workflow.add_edge("fetch_market_news", "generate_report")
 
 workflow.add_edge("generate_report", "generate_pdf")
 
+workflow.add_edge("fetch_comparison", "generate_comparison")
+
 # 5. Define end points for all branches
 workflow.add_edge("generate_pdf", END)
+workflow.add_edge("generate_comparison", END)
 workflow.add_edge("answer_follow_up", END)
 workflow.add_edge("generate_greeting", END)
 workflow.add_edge("generate_help", END)
+workflow.add_edge("generate_busy", END)
 workflow.add_edge("generate_off_topic", END)
 
 # 6. Compile the graph
@@ -0,0 +1,272 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from db_manager import get_db_connection, run_db
+
+# --- Configuration ---
+# Workers are coroutines awaiting network I/O, not threads, so this can be high
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "100"))
+JOB_MAX_AGE = timedelta(minutes=15)      # Queued work older than this is stale and gets expired
+JOB_MAX_ATTEMPTS = 2                     # A job that crashed the process this often is given up on
+JOB_RETENTION = timedelta(days=1)        # Finished rows are purged after this long
+FLUSH_INTERVAL_SECONDS = 0.05            # Group-commit window for buffered writes
+FLUSH_MAX_BATCH = 200
+JOB_LEASE = timedelta(seconds=60)        # A worker process that stops renewing for this long is presumed dead
+LEASE_RENEW_SECONDS = 15                 # Also how often expired leases of other workers are looked for
+
+# Job lifecycle: queued -> running -> delivering -> done
+# Anything that reached 'delivering' may already have produced a reply, so it is
+# never re-run after a restart (at-most-once delivery).
+# Every worker process owns the jobs it enqueued or recovered and keeps renewing their
+# lease. Recovery only touches jobs whose lease has expired, so one worker restarting
+# never takes over work that another live worker is still running.
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DELIVERING = "delivering"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_EXPIRED = "expired"
+
+JobHandler = Callable[[str, int, str], Awaitable[None]]
+ExpiredHandler = Callable[[int], Awaitable[None]]
+
+
+class JobQueue:
+    """
+    Persistent queue for background analyses, stored in the `jobs` table of sessions.db.
+    All writes go through a single flusher task that commits them in batches.
+    """
+
+    def __init__(self, handler: JobHandler, expired_handler: Optional[ExpiredHandler] = None, workers: int = JOB_WORKERS):
+        self.handler = handler
+        self.expired_handler = expired_handler
+        self.workers = workers
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._pending: List[Tuple[str, tuple, Optional[asyncio.Future]]] = []
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._running = False
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    # --- Lifecycle ---
+
+    async def start(self):
+        """Recovers abandoned jobs from the database and starts the flusher, lease renewal and workers."""
+        resumed, expired = await run_db(self._recover)
+        self._running = True
+        self._tasks.append(asyncio.create_task(self._flush_loop()))
+        self._tasks.append(asyncio.create_task(self._lease_loop()))
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker_loop()))
+        self._schedule_recovered(resumed, expired)
+        print(f"Job queue {self.owner} started: {len(resumed)} job(s) resumed, {len(expired)} expired.")
+
+    async def stop(self):
+        """
+        Stops the workers and flushes any buffered writes. The leases of in-flight jobs are
+        released, so the next worker to look (this one restarted, or another) resumes them.
+        """
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self._pending:
+            batch, self._pending = self._pending, []
+            await run_db(self._write_batch, batch)
+            self._resolve(batch)
+        await run_db(self._release_leases)
+
+    # --- Public API ---
+
+    async def enqueue(self, chat_id: int, user_message: str) -> str:
+        """Persists a new job and schedules it. The job is durable once this returns."""
+        job_id = uuid.uuid4().hex
+        now = datetime.now()
+        await self._write(
+            "INSERT INTO jobs (job_id, chat_id, user_message, status, attempts, created_at, updated_at, owner, lease_expires) "
+            "VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)",
+            (job_id, chat_id, user_message, STATUS_QUEUED, now, now, self.owner, time.time() + JOB_LEASE.total_seconds()),
+            wait=True,
+        )
+        self._ready.put_nowait((job_id, chat_id, user_message, now))
+        return job_id
+
+    async def mark_delivering(self, job_id: Optional[str]):
+        """Must be awaited before a job sends anything to the user."""
+        if job_id:
+            await self._set_status(job_id, STATUS_DELIVERING, wait=True)
+
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._ready.qsize()
+
+    # --- Internals ---
+
+    async def _set_status(self, job_id: str, status: str, wait: bool = False, bump_attempts: bool = False):
+        attempts_sql = ", attempts = attempts + 1" if bump_attempts else ""
+        await self._write(
+            f"UPDATE jobs SET status = ?, updated_at = ?{attempts_sql} WHERE job_id = ?",
+            (status, datetime.now(), job_id),
+            wait=wait,
+        )
+
+    async def _write(self, sql: str, params: tuple, wait: bool = False):
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self._pending.append((sql, params, future))
+        if len(self._pending) >= FLUSH_MAX_BATCH or wait:
+            self._wakeup.set()
+        if future:
+            await future
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            # Give concurrent writers a moment to join the same commit.
+            await asyncio.sleep(0)
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+            batch, self._pending = self._pending, []
+            try:
+                await run_db(self._write_batch, batch)
+                self._resolve(batch)
+            except Exception as e:
+                print(f"Job queue flush failed for {len(batch)} write(s): {e}")
+                self._resolve(batch, error=e)
+
+    @staticmethod
+    def _write_batch(batch: List[Tuple[str, tuple, Optional[asyncio.Future]]]):
+        conn = _require_connection()
+        with conn:
+            for sql, params, _ in batch:
+                conn.execute(sql, params)
+
+    @staticmethod
+    def _resolve(batch, error: Optional[Exception] = None):
+        for _, _, future in batch:
+            if future and not future.done():
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+
+    async def _worker_loop(self):
+        while True:
+            job_id, chat_id, user_message, created_at = await self._ready.get()
+            try:
+                if datetime.now() - created_at > JOB_MAX_AGE:
+                    await self._set_status(job_id, STATUS_EXPIRED, wait=True)
+                    if self.expired_handler:
+                        await self.expired_handler(chat_id)
+                    continue
+                # Durable before the handler runs, so a crash mid-run still counts as an attempt
+                await self._set_status(job_id, STATUS_RUNNING, wait=True, bump_attempts=True)
+                await self.handler(job_id, chat_id, user_message)
+                await self._set_status(job_id, STATUS_DONE)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job {job_id} for chat_id {chat_id} failed: {e}")
+                traceback.print_exc()
+                await self._set_status(job_id, STATUS_FAILED)
+            finally:
+                self._ready.task_done()
+
+    async def _lease_loop(self):
+        """Renews this worker's leases, then takes over jobs whose owner stopped renewing."""
+        while True:
+            await asyncio.sleep(LEASE_RENEW_SECONDS)
+            try:
+                await run_db(self._renew_leases)
+                self._schedule_recovered(*await run_db(self._recover))
+            except Exception as e:
+                print(f"Job queue lease renewal failed: {e}")
+
+    def _schedule_recovered(self, resumed: List[Tuple[str, int, str, datetime]], expired: List[int]):
+        for job in resumed:
+            self._ready.put_nowait(job)
+        if self.expired_handler:
+            for chat_id in expired:
+                asyncio.create_task(self.expired_handler(chat_id))
+
+    def _renew_leases(self):
+        conn = _require_connection()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE owner = ? AND status IN (?, ?, ?)",
+                (time.time() + JOB_LEASE.total_seconds(), self.owner, STATUS_QUEUED, STATUS_RUNNING, STATUS_DELIVERING),
+            )
+
+    def _release_leases(self):
+        conn = _require_connection()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET lease_expires = 0 WHERE owner = ? AND status IN (?, ?)",
+                (self.owner, STATUS_QUEUED, STATUS_RUNNING),
+            )
+
+    def _recover(self) -> Tuple[List[Tuple[str, int, str, datetime]], List[int]]:
+        """
+        Decides what happens to unfinished jobs whose lease has expired. Each one is claimed
+        with a conditional UPDATE, so when several workers recover at once only one acts on it.
+        """
+        conn = _require_connection()
+        now, lease_now = datetime.now(), time.time()
+        resumed, expired = [], []
+        with conn:
+            rows = conn.execute(
+                "SELECT job_id, chat_id, user_message, status, attempts, created_at FROM jobs "
+                "WHERE status IN (?, ?, ?) AND (lease_expires IS NULL OR lease_expires < ?) ORDER BY created_at",
+                (STATUS_QUEUED, STATUS_RUNNING, STATUS_DELIVERING, lease_now),
+            ).fetchall()
+            for row in rows:
+                created_at = _parse_timestamp(row["created_at"])
+                if row["status"] == STATUS_DELIVERING:
+                    # A reply may already have gone out for these; never send it twice.
+                    new_status = STATUS_FAILED
+                elif now - created_at > JOB_MAX_AGE:
+                    new_status = STATUS_EXPIRED
+                elif row["attempts"] >= JOB_MAX_ATTEMPTS:
+                    new_status = STATUS_FAILED
+                else:
+                    new_status = STATUS_QUEUED
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, lease_expires = ?, updated_at = ? "
+                    "WHERE job_id = ? AND status = ? AND (lease_expires IS NULL OR lease_expires < ?)",
+                    (new_status, self.owner, lease_now + JOB_LEASE.total_seconds(), now,
+                     row["job_id"], row["status"], lease_now),
+                ).rowcount
+                if not claimed:
+                    continue   # Another worker got there first
+                if new_status == STATUS_EXPIRED:
+                    expired.append(row["chat_id"])
+                elif new_status == STATUS_QUEUED:
+                    resumed.append((row["job_id"], row["chat_id"], row["user_message"], created_at))
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated_at < ?",
+                (STATUS_DONE, STATUS_FAILED, STATUS_EXPIRED, now - JOB_RETENTION),
+            )
+        return resumed, expired
+
+
+def _require_connection() -> sqlite3.Connection:
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Job queue could not open the database.")
+    return conn
+
+def _parse_timestamp(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
@@ -1,111 +1,133 @@
 import os
 import asyncio
+import hmac
 import json
 import traceback
 import random
 from contextlib import asynccontextmanager
+import time
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from telegram import Update
 from telegram.ext import Application
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage
 
 from graph import app as analysis_graph
-from db_manager import setup_database, save_session, load_session, check_and_register_user
-from sanitize import sanitize_for_telegram
+from stock_analyzer.deadlines import node_timeout_stats, RUN_BUDGET
+from stock_analyzer.node_cache import node_cache_stats
+from stock_analyzer.http_client import close_http_client
+from stock_analyzer.lazy import preload_lazy_modules
+from stock_analyzer.llm import llm_stats
+from stock_analyzer import profiler
+from stock_analyzer.alerts import AlertScheduler, normalize_ticker
+from stock_analyzer.tracing import start_trace, span
+from stock_analyzer.metrics import render_metrics, ANALYSIS_DURATION, ANALYSIS_ERRORS, ANALYSES_IN_FLIGHT, QUEUE_DEPTH
+from db_manager import setup_database, asave_session, run_db, session_from_state, aadd_to_watchlist, aremove_from_watchlist, aload_watchlist, WATCHLIST_MAX_SIZE
+from database.db import setup_fundamentals_database, store_screener_data
+from job_queue import JobQueue
+from update_dedup import UpdateDeduplicator
+from user_index import KnownUserIndex
+from session_janitor import SessionJanitor
+from delivery import MetricsRequest, ProgressiveDelivery, stream_graph
 from logs.logger_config import user_logger # <-- IMPORT THE NEW LOGGER
 
 # Run the database setup once on startup
 setup_database()
+setup_fundamentals_database()
 
 load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Bot API server to talk to instead of api.telegram.org (a self-hosted Bot API server, or the load-test stand-in)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")   # Enables the /admin endpoints; sent as the X-Admin-Token header
+# Import the analysis libraries in the background once the server is up
+PRELOAD_ANALYSIS_MODULES = os.getenv("PRELOAD_ANALYSIS_MODULES", "true").lower() == "true"
 
 if not TELEGRAM_BOT_TOKEN or not WEBHOOK_URL:
     raise ValueError("TELEGRAM_BOT_TOKEN and WEBHOOK_URL must be set.")
 
-bot_app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-
-
-async def send_long_message(bot, chat_id: int, text: str, max_length: int = 4096):
-    sanitized_text = sanitize_for_telegram(text)
-    if len(sanitized_text) <= max_length:
-        await bot.send_message(chat_id=chat_id, text=sanitized_text, parse_mode='HTML')
-        return
-    # Chunking logic remains the same
-    chunks = []
-    current_chunk = ""
-    paragraphs = sanitized_text.split('\n\n')
-    for paragraph in paragraphs:
-        if len(current_chunk) + len(paragraph) + 2 > max_length:
-            if current_chunk:
-                chunks.append(current_chunk)
-            current_chunk = paragraph
-        else:
-            current_chunk = (current_chunk + '\n\n' + paragraph) if current_chunk else paragraph
-    if current_chunk:
-        chunks.append(current_chunk)
-    for i, chunk in enumerate(chunks):
-        await bot.send_message(chat_id=chat_id, text=chunk, parse_mode='HTML')
-        await asyncio.sleep(0.5)
-
-
-async def process_analysis_and_reply(chat_id: int, user_message: str):
-    """Runs the full analysis and saves the result to the DB."""
+TELEGRAM_CONNECTION_POOL_SIZE = 256   # Matches the builder's default; a custom request needs it set explicitly
+bot_builder = Application.builder().token(TELEGRAM_BOT_TOKEN).request(MetricsRequest(connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE))
+if TELEGRAM_API_URL:
+    bot_builder = bot_builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot").base_file_url(f"{TELEGRAM_API_URL.rstrip('/')}/file/bot")
+bot_app = bot_builder.build()
+
+
+async def process_analysis_and_reply(job_id: str | None, chat_id: int, user_message: str):
+    """Runs one chat request inside its own trace (and the CPU profile, when an admin has armed one)."""
+    profiled = profiler.analysis_started()
+    try:
+        with start_trace("analysis", chat_id=chat_id, job_id=job_id, profiled=profiled) as trace:
+            if trace is not None:
+                print(f"Trace {trace.trace_id} started for chat_id {chat_id}.")
+            final_state = await run_analysis(job_id, chat_id, user_message)
+            if trace is not None:
+                trace.set("intent", final_state.get("intent"))
+                trace.set("stock_ticker", final_state.get("stock_ticker"))
+    finally:
+        if profiled:
+            profiler.analysis_finished()
+
+
+async def run_analysis(job_id: str | None, chat_id: int, user_message: str) -> dict:
+    """Streams the analysis, sending each artifact as soon as it is ready, then saves the result to the DB."""
+    delivery = ProgressiveDelivery(bot_app.bot, chat_id, before_first_send=lambda: job_queue.mark_delivering(job_id))
+    started = time.perf_counter()
+    ANALYSES_IN_FLIGHT.inc()
+    initial_state = {
+        "messages": [HumanMessage(content=user_message)],
+        "chat_id": chat_id,
+        "run_deadline": time.time() + RUN_BUDGET,  # The budget counts from dequeue, including routing
+    }
+    final_state = initial_state
     try:
         print(f"--- Background Task Started for Chat ID: {chat_id} ---")
-        initial_state = {
-            "messages": [HumanMessage(content=user_message)],
-            "chat_id": chat_id
-        }
-        final_state = await asyncio.to_thread(analysis_graph.invoke, initial_state)
-
-        if final_state.get('intent') == 'stock_analysis' and not final_state.get('screener_data', {}).get('error'):
-            tech_analysis_to_save = final_state.get("technical_analysis", {}).copy()
-            if isinstance(tech_analysis_to_save, dict):
-                tech_analysis_to_save.pop("chart_path", None)
-
-            session_data = {
-                "company_name": final_state.get("company_name"),
-                "stock_ticker": final_state.get("stock_ticker"),
-                "screener_data": final_state.get("screener_data"),
-                "technical_analysis": tech_analysis_to_save,
-                "news_articles": final_state.get("news_articles"),
-                "market_context_articles": final_state.get("market_context_articles"),
-            }
-            save_session(chat_id, session_data)
-            print(f"Saved session for chat_id {chat_id} to database (without file paths).")
+        async for node, update, state in stream_graph(analysis_graph, initial_state):
+            # Sibling nodes of one step all see the same prior state, so accumulate their updates.
+            final_state = {**final_state, **state, **update}
+            await delivery.handle(node, update, final_state)
 
-        if final_state and final_state.get('messages'):
-            ai_response_message = final_state['messages'][-1].content
-            await send_long_message(bot_app.bot, chat_id, ai_response_message)
-            
-            if final_state.get('intent') == 'stock_analysis' and not final_state.get('screener_data', {}).get('error'):
-                tech_analysis = final_state.get('technical_analysis')
-                if isinstance(tech_analysis, dict) and (chart_path := tech_analysis.get("chart_path")) and os.path.exists(chart_path):
-                    with open(chart_path, 'rb') as photo_file:
-                        await bot_app.bot.send_photo(chat_id=chat_id, photo=photo_file)
-                    try:
-                        os.remove(chart_path)
-                        print(f"Cleaned up chart file: {chart_path}")
-                    except Exception as e:
-                        print(f"Error cleaning up chart file {chart_path}: {e}")
-
-                if (pdf_path := final_state.get("pdf_report_path")) and os.path.exists(pdf_path):
-                    with open(pdf_path, "rb") as pdf_file:
-                        await bot_app.bot.send_document(chat_id=chat_id, document=pdf_file, filename=final_state.get("pdf_filename"), caption="Here is your professional PDF research report.")
-                    try:
-                        os.remove(pdf_path)
-                        print(f"Cleaned up PDF file: {pdf_path}")
-                    except Exception as e:
-                        print(f"Error cleaning up PDF file {pdf_path}: {e}")
-        else:
+        if not delivery.sent_anything:
+            # Past this point the user may receive output, so the job must never be re-run.
+            await job_queue.mark_delivering(job_id)
             await bot_app.bot.send_message(chat_id=chat_id, text="Sorry, I couldn't process your request.")
+
+        session_data = session_from_state(final_state)
+        if session_data is not None:
+            with span("save_session"):
+                await asave_session(chat_id, session_data)
+                # Keep every scrape in the local fundamentals store for cross-ticker queries.
+                if final_state.get("screener_data"):
+                    await run_db(store_screener_data, final_state.get("stock_ticker"), final_state.get("screener_data"), final_state.get("company_name"))
+            print(f"Saved session for chat_id {chat_id} to database (without file paths).")
     except Exception as e:
         print(f"CRITICAL ERROR in background task for chat_id {chat_id}: {e}")
         traceback.print_exc()
+        ANALYSIS_ERRORS.inc()
+        await job_queue.mark_delivering(job_id)
         await bot_app.bot.send_message(chat_id=chat_id, text="Apologies, an error occurred while processing your report.")
+    finally:
+        ANALYSES_IN_FLIGHT.dec()
+        ANALYSIS_DURATION.observe(time.perf_counter() - started, intent=final_state.get("intent") or "unknown")
+    return final_state
+
+
+async def notify_expired_job(chat_id: int):
+    """Tells the user that a request queued before a restart was dropped."""
+    try:
+        await bot_app.bot.send_message(chat_id=chat_id, text="Sorry, I couldn't finish your earlier request in time. Please send it again.")
+    except Exception as e:
+        print(f"Error notifying chat_id {chat_id} about an expired job: {e}")
+
+
+job_queue = JobQueue(handler=process_analysis_and_reply, expired_handler=notify_expired_job)
+QUEUE_DEPTH.set_function(job_queue.depth)
+update_dedup = UpdateDeduplicator()
+known_users = KnownUserIndex()
+session_janitor = SessionJanitor()
+alert_scheduler = AlertScheduler(send=lambda chat_id, text: bot_app.bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML'))
 
 
 @asynccontextmanager
@@ -113,7 +135,21 @@ async def lifespan(app: FastAPI):
     print("Application startup: Setting Telegram webhook...")
     await bot_app.bot.set_webhook(url=f"{WEBHOOK_URL}")
     print(f"Webhook has been set to: {WEBHOOK_URL}")
+    await update_dedup.start()
+    await known_users.start()
+    await job_queue.start()
+    await session_janitor.start()
+    await alert_scheduler.start()
+    if PRELOAD_ANALYSIS_MODULES:
+        defer(asyncio.to_thread(preload_lazy_modules))
     yield
+    print("Application shutdown: Stopping job queue...")
+    await alert_scheduler.stop()
+    await session_janitor.stop()
+    await job_queue.stop()
+    await known_users.stop()
+    await update_dedup.stop()
+    await close_http_client()
     print("Application shutdown: Removing Telegram webhook...")
     await bot_app.bot.delete_webhook()
     print("Webhook has been removed.")
@@ -121,12 +157,81 @@ async def lifespan(app: FastAPI):
 
 api = FastAPI(lifespan=lifespan, title="EquiSage API", version="5.3.0-logging")
 
+async def send_welcome(chat_id: int, user_details):
+    """Registers the user if needed and sends the matching /start reply."""
+    if await known_users.register(chat_id):
+        # --- THIS IS THE NEW LOGGING LOGIC ---
+        log_message = (
+            f"New user registered: ID={chat_id}, "
+            f"Username={user_details.username or 'N/A'}, "
+            f"Name='{user_details.first_name}'"
+        )
+        user_logger.info(log_message)
+        # --- END OF LOGGING LOGIC ---
+        
+        welcome_text = (
+            "🎉 <b>Welcome to EquiSage!</b> 🎉\n\n"
+            "I am your personal AI stock research assistant for the Indian market.\n\n"
+            "Just ask me to analyze any stock by name to get a full report, chart, and PDF.\n\n"
+            "<b>For example:</b>\n"
+            "<i>'analyze Tata Motors'</i>\n"
+            "<i>'tell me about INFY'</i>\n"
+            "<i>'compare TCS vs INFY vs WIPRO'</i>\n\n"
+            "Use <b>/watch TCS</b> to get alerts on RSI, MACD and support/resistance breaks."
+        )
+        await bot_app.bot.send_message(chat_id, welcome_text, parse_mode='HTML')
+    else:
+        await bot_app.bot.send_message(chat_id, "Welcome back! Which stock can I analyze for you today?")
+
+
+async def handle_watch_command(chat_id: int, user_message: str):
+    """/watch SYMBOL, /unwatch SYMBOL and /watchlist."""
+    command, _, argument = user_message.partition(" ")
+    command = command.lower().split("@")[0]
+    if command == "/watchlist":
+        tickers = await aload_watchlist(chat_id)
+        text = ("<b>Your watchlist:</b> " + ", ".join(t.replace(".NS", "") for t in tickers)) if tickers else "Your watchlist is empty. Add a stock with /watch TCS."
+    elif (ticker := normalize_ticker(argument)) is None:
+        text = f"Please give a stock symbol, e.g. <b>{command} TCS</b>."
+    elif command == "/watch":
+        text = {
+            "added": f"Watching <b>{ticker}</b>. I'll message you on RSI, MACD and support/resistance signals.",
+            "exists": f"<b>{ticker}</b> is already on your watchlist.",
+            "full": f"Your watchlist is full ({WATCHLIST_MAX_SIZE} stocks). Remove one with /unwatch first.",
+        }.get(await aadd_to_watchlist(chat_id, ticker), "Sorry, I couldn't update your watchlist.")
+    else:
+        removed = await aremove_from_watchlist(chat_id, ticker)
+        text = f"Stopped watching <b>{ticker}</b>." if removed else f"<b>{ticker}</b> is not on your watchlist."
+    await bot_app.bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML')
+
+
+_deferred_tasks: set[asyncio.Task] = set()
+
+def defer(coro):
+    """Runs outbound I/O after the webhook has already answered Telegram."""
+    task = asyncio.create_task(_run_deferred(coro))
+    _deferred_tasks.add(task)
+    task.add_done_callback(_deferred_tasks.discard)
+
+async def _run_deferred(coro):
+    try:
+        await coro
+    except Exception as e:
+        print(f"Error in deferred webhook task: {e}")
+        traceback.print_exc()
+
+
 @api.post("/webhook")
 async def telegram_webhook(request: Request):
+    # Telegram redelivers any update that isn't answered quickly, so this handler only does
+    # local work (dedup, enqueue) and defers every Telegram API call.
     try:
         data = await request.json()
         update = Update.de_json(data, bot_app.bot)
 
+        if update_dedup.is_duplicate(update.update_id):
+            return Response(status_code=200)
+
         if not update.message or not update.message.text:
             return Response(status_code=200)
 
@@ -135,31 +240,15 @@ async def telegram_webhook(request: Request):
         user_details = update.message.from_user
 
         if user_message == "/start":
-            if check_and_register_user(chat_id):
-                # --- THIS IS THE NEW LOGGING LOGIC ---
-                log_message = (
-                    f"New user registered: ID={chat_id}, "
-                    f"Username={user_details.username or 'N/A'}, "
-                    f"Name='{user_details.first_name}'"
-                )
-                user_logger.info(log_message)
-                # --- END OF LOGGING LOGIC ---
-                
-                welcome_text = (
-                    "🎉 <b>Welcome to EquiSage!</b> 🎉\n\n"
-                    "I am your personal AI stock research assistant for the Indian market.\n\n"
-                    "Just ask me to analyze any stock by name to get a full report, chart, and PDF.\n\n"
-                    "<b>For example:</b>\n"
-                    "<i>'analyze Tata Motors'</i>\n"
-                    "<i>'tell me about INFY'</i>"
-                )
-                await bot_app.bot.send_message(chat_id, welcome_text, parse_mode='HTML')
-            else:
-                await bot_app.bot.send_message(chat_id, "Welcome back! Which stock can I analyze for you today?")
+            defer(send_welcome(chat_id, user_details))
+            return Response(status_code=200)
+
+        if user_message.lower().split(" ")[0].split("@")[0] in ("/watch", "/unwatch", "/watchlist"):
+            defer(handle_watch_command(chat_id, user_message))
             return Response(status_code=200)
 
         if user_message.lower() in ["pdf", "send pdf", "download pdf"]:
-            await bot_app.bot.send_message(chat_id, "PDF reports are generated with new analyses. Please ask me to analyze a stock to receive a fresh report.")
+            defer(bot_app.bot.send_message(chat_id, "PDF reports are generated with new analyses. Please ask me to analyze a stock to receive a fresh report."))
             return Response(status_code=200)
 
         acknowledgment_messages = [
@@ -169,9 +258,9 @@ async def telegram_webhook(request: Request):
             "Alright, I'm on it! Preparing your comprehensive analysis now. This can take up to 30 seconds. 📊"
         ]
         
-        await bot_app.bot.send_message(chat_id=chat_id, text=random.choice(acknowledgment_messages))
-        
-        asyncio.create_task(process_analysis_and_reply(chat_id, user_message))
+        # Persist the job first so a restart between the ack and the analysis cannot lose it.
+        await job_queue.enqueue(chat_id, user_message)
+        defer(bot_app.bot.send_message(chat_id=chat_id, text=random.choice(acknowledgment_messages)))
 
     except Exception as e:
         print(f"Error in main webhook handler: {e}")
@@ -180,6 +269,32 @@ async def telegram_webhook(request: Request):
     return Response(status_code=200)
 
 
+@api.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def is_admin(request: Request) -> bool:
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN)
+
+@api.post("/admin/profile")
+def start_profile(request: Request, analyses: int = 1):
+    """Captures a sampling CPU profile (folded stacks, for flamegraphs) of the next `analyses` analyses."""
+    if not is_admin(request):
+        return Response(status_code=403)
+    try:
+        return profiler.request_capture(analyses)
+    except RuntimeError as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+
+@api.get("/admin/profile")
+def profile_status(request: Request):
+    if not is_admin(request):
+        return Response(status_code=403)
+    return profiler.capture_status()
+
+
 @api.get("/")
 def health_check():
-    return {"status": "ok", "bot": "EquiSage", "architecture": "Stateful (SQLite) with auto-cleanup & dynamic replies"}
\ No newline at end of file
+    return {"status": "ok", "bot": "EquiSage", "architecture": "Stateful (SQLite) with auto-cleanup & dynamic replies", "queue_depth": job_queue.depth(), "duplicate_updates_suppressed": update_dedup.duplicates_suppressed, "node_timeouts": node_timeout_stats(), "node_cache": node_cache_stats(), "llm": llm_stats()}
\ No newline at end of file
@@ -1,27 +1,350 @@
 import re
+from collections import deque
+from typing import List, Tuple
+
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+# Tags Telegram's HTML parse mode accepts (anything else is stripped)
+ALLOWED_TAGS = frozenset(['b', 'i', 'u', 's', 'tg-spoiler', 'a', 'code', 'pre'])
+# Common HTML the model produces that has a Telegram equivalent
+TAG_ALIASES = {'strong': 'b', 'em': 'i', 'ins': 'u', 'strike': 's', 'del': 's'}
+# Inside these, Markdown markers and other tags are literal text
+LITERAL_TAGS = frozenset(['code', 'pre'])
+
+# One pattern, compiled once, drives the whole single-pass scan. The leading
+# lookahead lets the scanner skip plain text without trying every alternative.
+_TOKEN_RE = re.compile(r"""(?=[<>&*])(?:
+      (?P<tag><(?P<close>/)?(?P<name>[a-zA-Z][\w-]*)(?P<attrs>(?:\s[^<>]*)?)/?>)
+    | (?P<bullet>\*[ \t]+)
+    | (?P<bold>\*\*)
+    | (?P<italic>\*)
+    | (?P<entity>&(?:lt|gt|amp|quot|\#[0-9]+|\#x[0-9a-fA-F]+);)
+    | (?P<special>[<>&])
+)""", re.VERBOSE)
+_HREF_RE = re.compile(r"""href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
+_LANGUAGE_RE = re.compile(r"""class\s*=\s*["']?language-([\w+#.-]+)""", re.IGNORECASE)
+# Telegram only knows these named entities (plus numeric ones); any other '&' is escaped
+_ENTITY_RE = re.compile(r"&(?:lt|gt|amp|quot|#[0-9]+|#x[0-9a-fA-F]+);")
+_TAG_ONLY_RE = re.compile(r"<[^>]+>")
+_LONE_STAR_RE = re.compile(r"(?<!\*)\*(?!\*)")
+_ESCAPES = {'<': '&lt;', '>': '&gt;', '&': '&amp;'}
+_ATTR_ESCAPES = {**_ESCAPES, '"': '&quot;'}
+
+def _escape_attribute(value: str) -> str:
+    """Escapes a value for a double-quoted attribute, keeping entities that are already valid."""
+    parts, position = [], 0
+    for match in _ENTITY_RE.finditer(value):
+        parts.append(''.join(_ATTR_ESCAPES.get(c, c) for c in value[position:match.start()]))
+        parts.append(match.group())
+        position = match.end()
+    parts.append(''.join(_ATTR_ESCAPES.get(c, c) for c in value[position:]))
+    return ''.join(parts)
+
+# Segment kinds produced by the tokenizer
+TEXT, OPEN, CLOSE = 0, 1, 2
+Segment = Tuple[int, str, str]   # (kind, tag name or '', rendered text)
+
+
+def _tokenize(text: str) -> List[Segment]:
+    """
+    Converts Markdown, maps or strips tags, escapes stray '<', '>' and '&', and keeps
+    the allowed tags properly nested, all in one left-to-right pass. A lone '*' only
+    opens an italic when another '*' closes it on the same line.
+    """
+    segments: List[Segment] = []
+    stack: List[Tuple[str, str]] = []   # (name, rendered open tag)
+
+    def emit_text(value: str):
+        if value:
+            segments.append((TEXT, '', value))
+
+    def open_tag(name: str, rendered: str):
+        stack.append((name, rendered))
+        segments.append((OPEN, name, rendered))
+
+    def close_tag(name: str):
+        if not any(open_name == name for open_name, _ in stack):
+            return  # Stray closing tag: drop it
+        # Close anything opened inside `name`, then reopen it so nesting stays valid.
+        reopen = []
+        while stack[-1][0] != name:
+            inner = stack.pop()
+            segments.append((CLOSE, inner[0], f"</{inner[0]}>"))
+            reopen.append(inner)
+        stack.pop()
+        segments.append((CLOSE, name, f"</{name}>"))
+        for inner in reversed(reopen):
+            open_tag(*inner)
+
+    def toggle(name: str):
+        if any(open_name == name for open_name, _ in stack):
+            close_tag(name)
+        else:
+            open_tag(name, f"<{name}>")
+
+    position = 0
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        in_literal = bool(stack) and stack[-1][0] in LITERAL_TAGS
+        text_end = match.start()
+        if kind == 'bullet':
+            # '* ' is a list bullet only when it starts a line (after optional indentation).
+            line_start = text.rfind('\n', 0, text_end) + 1
+            if text[line_start:text_end].strip(' \t'):
+                kind = 'italic'
+            elif not in_literal:
+                text_end = max(line_start, position)
+        emit_text(text[position:text_end])
+        position = match.end()
+
+        if kind == 'tag':
+            name = match.group('name').lower()
+            name = TAG_ALIASES.get(name, name)
+            is_close = match.group('close') is not None
+            if in_literal and name == 'code' and not is_close and stack[-1][0] == 'pre':
+                # <pre><code class="language-python"> is how Telegram takes a code block's language
+                language = _LANGUAGE_RE.search(match.group('attrs') or '')
+                open_tag('code', f'<code class="language-{language.group(1)}">' if language else '<code>')
+            elif in_literal and is_close and name == 'pre' and len(stack) > 1 and stack[-2][0] == 'pre':
+                close_tag('code')
+                close_tag('pre')
+            elif in_literal and not (is_close and name == stack[-1][0]):
+                emit_text(''.join(_ESCAPES.get(c, c) for c in match.group()))
+            elif name == 'br':
+                emit_text('\n')
+            elif name == 'li':
+                if not is_close:
+                    emit_text('\n• ')
+            elif name not in ALLOWED_TAGS:
+                continue  # Unsupported tag (ul, p, div, span, ...): strip it
+            elif is_close:
+                close_tag(name)
+            elif name == 'a':
+                href = _HREF_RE.search(match.group('attrs') or '')
+                if href:
+                    close_tag('a')  # Links cannot nest: a new one ends the previous one
+                    url = next(g for g in href.groups() if g is not None)
+                    open_tag('a', f'<a href="{_escape_attribute(url)}">')
+            elif not any(open_name == name for open_name, _ in stack):
+                open_tag(name, f"<{name}>")
+        elif in_literal:
+            value = match.group()
+            emit_text(value if kind == 'entity' else ''.join(_ESCAPES.get(c, c) for c in value))
+        elif kind == 'bullet':
+            emit_text('• ')
+        elif kind == 'bold':
+            toggle('b')
+        elif kind == 'italic':
+            line_end = text.find('\n', position)
+            if any(open_name == 'i' for open_name, _ in stack) or _LONE_STAR_RE.search(text, position, len(text) if line_end < 0 else line_end):
+                toggle('i')
+                emit_text(match.group()[1:])
+            else:
+                emit_text(match.group())  # No closer on this line: a literal '*' (e.g. "5 * 3")
+        elif kind == 'entity':
+            emit_text(match.group())
+        else:
+            emit_text(_ESCAPES[match.group()])
+    emit_text(text[position:])
+
+    while stack:
+        name, _ = stack.pop()
+        segments.append((CLOSE, name, f"</{name}>"))
+    return segments
 
 def sanitize_for_telegram(text: str) -> str:
     """
     Sanitizes text to be compatible with Telegram's HTML parse mode.
     - Converts basic Markdown.
     - Replaces unsupported HTML tags with safe alternatives.
+    - Balances the remaining tags and escapes stray '<', '>' and '&'.
     """
-    # Convert basic markdown that the AI might still use
-    text = text.replace('**', '<b>').replace('**', '</b>')
-    text = re.sub(r'(?<!<)/?\*(?!<)', '<i>', text, 1)
-    text = text.replace('*', '</i>')
-
-    # Replace <br> tags with newlines for proper line breaks
-    text = re.sub(r'<br\s*/?>', '\n', text, flags=re.IGNORECASE)
-    
-    # Handle list tags gracefully
-    text = re.sub(r'<ul>', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'</ul>', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'<li>', '\n• ', text, flags=re.IGNORECASE)
-    text = re.sub(r'</li>', '', text, flags=re.IGNORECASE)
-
-    # Strip any remaining unsupported tags to prevent errors
-    allowed_tags = ['b', 'i', 'u', 's', 'tg-spoiler', 'a', 'code', 'pre']
-    text = re.sub(r'</?(?!(?:' + '|'.join(allowed_tags) + r'))\b[^>]*>', '', text, flags=re.IGNORECASE)
-    
-    return text.strip()
\ No newline at end of file
+    return ''.join(rendered for _, _, rendered in _tokenize(text)).strip()
+
+
+# --- Chunking ---
+
+_LINE_RE = re.compile(r"\n\n|\n")
+_BREAK_PRIORITY = {'\n\n': 2, '\n': 1}
+_WORD_BREAK = 0
+
+def _units(segments: List[Segment]):
+    """Splits text segments after every paragraph break and newline; lines are only split into words when one overflows."""
+    for kind, name, rendered in segments:
+        if kind != TEXT:
+            yield kind, name, rendered, -1
+            continue
+        position = 0
+        for match in _LINE_RE.finditer(rendered):
+            yield TEXT, '', rendered[position:match.end()], _BREAK_PRIORITY[match.group()]
+            position = match.end()
+        if position < len(rendered):
+            yield TEXT, '', rendered[position:], -1
+
+def _closers(stack) -> str:
+    return ''.join(f"</{name}>" for name, _ in reversed(stack))
+
+def _hard_cut(value: str, limit: int) -> int:
+    """Largest cut position <= limit that does not split an HTML entity."""
+    cut = max(limit, 1)
+    amp = value.rfind('&', max(0, cut - 10), cut)
+    if amp > 0 and ';' not in value[amp:cut]:
+        cut = amp
+    return cut
+
+def split_for_telegram(text: str, max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Sanitizes text and splits it into chunks of at most max_length characters.
+    Chunks end at paragraph breaks where possible, then newlines, then spaces. Tags
+    open at a boundary are closed at the end of one chunk and reopened at the start
+    of the next, so every chunk is valid Telegram HTML on its own.
+    """
+    chunks: List[str] = []
+    units = deque(_units(_tokenize(text)))
+    stack: tuple = ()                    # Open tags at the end of the current chunk
+    closers = 0                          # len(_closers(stack))
+    # Current chunk as (kind, name, rendered, break priority after it, open-tag stack after it)
+    current: List[Tuple[int, str, str, int, tuple]] = []
+    reopened = 0                         # Leading units of `current` that only reopen carried-over tags
+    length = 0
+
+    def flush(upto: int):
+        """Emits current[:upto + 1] as a chunk, starts the next one with the open tags reopened, and requeues the rest."""
+        nonlocal current, stack, closers, reopened, length
+        head, tail = current[:upto + 1], current[upto + 1:]
+        boundary = head[-1][4]
+        chunk = (''.join(unit[2] for unit in head) + _closers(boundary)).strip()
+        if _TAG_ONLY_RE.sub('', chunk).strip():
+            chunks.append(chunk)
+        # Carry tags over only while they leave room for text (long link URLs may not).
+        while boundary and sum(len(rendered) + len(name) + 3 for name, rendered in boundary) > max_length // 2:
+            boundary = boundary[:-1]
+        current = [(OPEN, name, rendered, -1, boundary[:i + 1]) for i, (name, rendered) in enumerate(boundary)]
+        stack, reopened = boundary, len(boundary)
+        closers = len(_closers(boundary))
+        length = sum(len(unit[2]) for unit in current)
+        units.extendleft(unit[:4] for unit in reversed(tail))
+
+    def best_break() -> int | None:
+        """The strongest break past the halfway mark (latest on ties), else the latest break."""
+        offset, latest, strongest = 0, None, None
+        for index, unit in enumerate(current):
+            offset += len(unit[2])
+            if unit[3] < 0:
+                continue
+            latest = index
+            if offset >= max_length // 2 and (strongest is None or unit[3] >= current[strongest][3]):
+                strongest = index
+        return strongest if strongest is not None else latest
+
+    while units:
+        kind, name, rendered, priority = units.popleft()
+        if kind == OPEN:
+            new_stack, new_closers = stack + ((name, rendered),), closers + len(name) + 3
+        elif kind == CLOSE:
+            if not (stack and stack[-1][0] == name):
+                continue  # Its opening tag was not carried into this chunk
+            new_stack, new_closers = stack[:-1], closers - len(name) - 3
+        else:
+            new_stack, new_closers = stack, closers
+        budget = max_length - length - new_closers
+        if len(rendered) <= budget or (kind != TEXT and len(current) == reopened):
+            current.append((kind, name, rendered, priority, new_stack))
+            stack, closers = new_stack, new_closers
+            length += len(rendered)
+            continue
+        cut_at = best_break()
+        if kind == TEXT and budget >= 1:
+            # Break an overflowing line between words, unless a stronger break sits past the halfway mark.
+            space = rendered.rfind(' ', 0, budget)
+            if space >= 0 and (cut_at is None or length + space + 1 >= max_length // 2):
+                current.append((TEXT, '', rendered[:space + 1], _WORD_BREAK, stack))
+                units.appendleft((TEXT, '', rendered[space + 1:], priority))
+                flush(len(current) - 1)
+                continue
+        units.appendleft((kind, name, rendered, priority))
+        if cut_at is not None:
+            flush(cut_at)
+        elif kind != TEXT or budget < 1:
+            # Nothing to break on: end the chunk right before this unit.
+            flush(len(current) - 1)
+        else:
+            # A single unbroken run longer than the budget: hard-cut it.
+            units.popleft()
+            cut = _hard_cut(rendered, budget)
+            current.append((TEXT, '', rendered[:cut], -1, stack))
+            units.appendleft((TEXT, '', rendered[cut:], priority))
+            flush(len(current) - 1)
+    if len(current) > reopened:
+        flush(len(current) - 1)
+    return chunks
+
+if __name__ == '__main__':
+    # --- Self-test and benchmark on a large LLM-style report ---
+    import time
+
+    def legacy_sanitize(text: str) -> str:
+        """The previous multi-pass implementation, kept here for comparison."""
+        text = text.replace('**', '<b>').replace('**', '</b>')
+        text = re.sub(r'(?<!<)/?\*(?!<)', '<i>', text, 1)
+        text = text.replace('*', '</i>')
+        text = re.sub(r'<br\s*/?>', '\n', text, flags=re.IGNORECASE)
+        text = re.sub(r'<ul>', '', text, flags=re.IGNORECASE)
+        text = re.sub(r'</ul>', '', text, flags=re.IGNORECASE)
+        text = re.sub(r'<li>', '\n• ', text, flags=re.IGNORECASE)
+        text = re.sub(r'</li>', '', text, flags=re.IGNORECASE)
+        allowed_tags = ['b', 'i', 'u', 's', 'tg-spoiler', 'a', 'code', 'pre']
+        text = re.sub(r'</?(?!(?:' + '|'.join(allowed_tags) + r'))\b[^>]*>', '', text, flags=re.IGNORECASE)
+        return text.strip()
+
+    def legacy_chunks(text: str, max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> List[str]:
+        chunks, current_chunk = [], ""
+        for paragraph in legacy_sanitize(text).split('\n\n'):
+            if len(current_chunk) + len(paragraph) + 2 > max_length:
+                if current_chunk:
+                    chunks.append(current_chunk)
+                current_chunk = paragraph
+            else:
+                current_chunk = (current_chunk + '\n\n' + paragraph) if current_chunk else paragraph
+        if current_chunk:
+            chunks.append(current_chunk)
+        return chunks
+
+    def unbalanced(chunk: str) -> bool:
+        stack = []
+        for close, name in re.findall(r"<(/?)([a-z-]+)[^>]*>", chunk):
+            if not close:
+                stack.append(name)
+            elif not stack or stack.pop() != name:
+                return True
+        return bool(stack)
+
+    sample = "**Key Ratios** for <strong>TCS</strong> & peers:<br><ul><li>P/E < 30</li><li>*ROCE* > 20%</li></ul>"
+    print("Sanitized:", sanitize_for_telegram(sample))
+
+    section = (
+        "<b>📊 Fundamental Analysis</b>\n\n"
+        "**Valuation:** The stock trades at a P/E of 28.4 & a P/B of 12.1, which is *rich* compared to peers. "
+        "<ul><li>Revenue grew 12% YoY</li><li>OPM held at 26%</li><li>ROCE > 50%</li></ul>\n\n"
+        "<p>Promoters hold 72.4% with <em>no pledging</em>; FIIs trimmed their stake to 12.9%.</p><br>"
+        "<b>Outlook: the long paragraph below keeps the bold tag open across many lines "
+        + "and the chunker has to close and reopen it at the boundary. " * 40 + "</b>\n\n"
+    )
+    report = section * 60
+    runs = 20
+
+    started = time.perf_counter()
+    for _ in range(runs):
+        old = legacy_chunks(report)
+    legacy_ms = (time.perf_counter() - started) * 1000 / runs
+
+    started = time.perf_counter()
+    for _ in range(runs):
+        new = split_for_telegram(report)
+    new_ms = (time.perf_counter() - started) * 1000 / runs
+
+    print(f"Report: {len(report):,} chars")
+    print(f"Legacy sanitize + chunk: {legacy_ms:.2f} ms, {len(old)} chunks, "
+          f"{sum(len(c) > TELEGRAM_MAX_MESSAGE_LENGTH for c in old)} oversize, {sum(map(unbalanced, old))} unbalanced")
+    print(f"Single-pass tokenizer:   {new_ms:.2f} ms, {len(new)} chunks, "
+          f"{sum(len(c) > TELEGRAM_MAX_MESSAGE_LENGTH for c in new)} oversize, {sum(map(unbalanced, new))} unbalanced")
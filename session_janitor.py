@@ -0,0 +1,58 @@
+import asyncio
+import os
+import time
+from datetime import timedelta
+from typing import Optional
+
+from db_manager import run_db, evict_expired_sessions, evict_expired_node_results, evict_old_alerts, SESSION_TTL
+from stock_analyzer.technicals import CHART_OUTPUT_DIR
+
+# --- Configuration ---
+EVICTION_INTERVAL = timedelta(hours=1)
+CHART_MAX_AGE = timedelta(hours=6)   # Must outlive the technicals node cache TTL
+
+
+def remove_stale_charts(max_age: timedelta = CHART_MAX_AGE) -> int:
+    """Deletes chart images older than max_age and returns how many were removed."""
+    cutoff = time.time() - max_age.total_seconds()
+    removed = 0
+    if not os.path.isdir(CHART_OUTPUT_DIR):
+        return removed
+    for entry in os.scandir(CHART_OUTPUT_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError as e:
+            print(f"Error removing stale chart {entry.path}: {e}")
+    return removed
+
+
+class SessionJanitor:
+    """Background task that periodically evicts sessions past their TTL (vacuuming the freed pages), expired node-cache entries, old alert-log rows and stale charts."""
+
+    def __init__(self, ttl: timedelta = SESSION_TTL, interval: timedelta = EVICTION_INTERVAL):
+        self.ttl = ttl
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await run_db(evict_expired_sessions, self.ttl)
+                await run_db(evict_expired_node_results)
+                await run_db(evict_old_alerts)
+                if removed := await asyncio.to_thread(remove_stale_charts):
+                    print(f"Removed {removed} stale chart(s).")
+            except Exception as e:
+                print(f"Session eviction pass failed: {e}")
+            await asyncio.sleep(self.interval.total_seconds())
@@ -0,0 +1,110 @@
+# Startup profiler for the web process.
+#
+#   python startup_profile.py                 # import-time breakdown for main.py
+#   python startup_profile.py graph --top 30  # ...for another module
+#   python startup_profile.py --check         # fail if startup is over budget or imports a heavy library
+#
+# Each run imports the module in a fresh interpreter with `-X importtime`, so nothing
+# cached in this process skews the numbers. `--check` is the startup regression gate:
+# run it in CI or before a deploy.
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# --- Configuration ---
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "2.5"))
+CHECK_RUNS = 3   # The best of several runs, so one slow disk read does not fail the check
+# Libraries only the analysis nodes need; none of them may load at import time.
+HEAVY_MODULES = (
+    "pandas", "pandas_ta", "numpy", "scipy", "yfinance", "matplotlib", "mplfinance",
+    "reportlab", "bs4", "requests", "google.generativeai",
+)
+# main.py refuses to import without these; the profile never talks to Telegram.
+PLACEHOLDER_ENV = {"TELEGRAM_BOT_TOKEN": "0:startup-profile", "WEBHOOK_URL": "https://localhost/webhook"}
+
+_PROBE = """
+import sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(f"{{elapsed:.6f}}|{{','.join(heavy)}}")
+"""
+
+
+def profile_import(module: str) -> Tuple[float, List[str], List[Tuple[int, int, str]]]:
+    """
+    Imports `module` in a child interpreter. Returns the wall time, the heavy modules
+    it loaded, and the importtime rows as (self_us, cumulative_us, dotted name with indent).
+    """
+    env = {**os.environ, **{key: value for key, value in PLACEHOLDER_ENV.items() if not os.getenv(key)}}
+    probe = _PROBE.format(module=module, heavy=HEAVY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(self_us), int(cumulative_us), name[1:].rstrip()))
+    elapsed, heavy = result.stdout.strip().splitlines()[-1].split("|")
+    return float(elapsed), [name for name in heavy.split(",") if name], rows
+
+def by_package(rows: List[Tuple[int, int, str]]) -> Dict[str, int]:
+    """Self time in microseconds summed by top-level package."""
+    totals: Dict[str, int] = defaultdict(int)
+    for self_us, _, name in rows:
+        totals[name.strip().split(".")[0]] += self_us
+    return totals
+
+def print_report(module: str, top: int):
+    elapsed, heavy, rows = profile_import(module)
+    print(f"import {module}: {elapsed * 1000:.0f} ms ({len(rows)} modules)")
+
+    print(f"\nTop {top} packages by self time:")
+    for package, self_us in sorted(by_package(rows).items(), key=lambda item: -item[1])[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {package}")
+
+    print(f"\nTop {top} imports by cumulative time:")
+    for _, cumulative_us, name in sorted(rows, key=lambda row: -row[1])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    if heavy:
+        print(f"\nHeavy modules loaded at import time: {', '.join(heavy)}")
+
+def check_budget(module: str, budget: float) -> bool:
+    """The startup regression gate: within budget and no heavy library imported eagerly."""
+    runs = [profile_import(module) for _ in range(CHECK_RUNS)]
+    best = min(elapsed for elapsed, _, _ in runs)
+    heavy = sorted({name for _, names, _ in runs for name in names})
+    ok = best <= budget and not heavy
+    print(f"import {module}: best of {CHECK_RUNS} = {best * 1000:.0f} ms (budget {budget * 1000:.0f} ms)")
+    if heavy:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(heavy)}")
+    elif best > budget:
+        print("FAIL: startup is over budget. Run without --check for the breakdown.")
+    else:
+        print("OK")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time breakdown and startup budget check.")
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--check", action="store_true", help="exit non-zero if over budget or a heavy module loads")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_SECONDS, help="seconds")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_budget(args.module, args.budget) else 1)
+    print_report(args.module, args.top)
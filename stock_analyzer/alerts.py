@@ -0,0 +1,214 @@
+# In stock_analyzer/alerts.py
+#
+# Watchlist alerts. Each cycle works per distinct ticker, not per watch entry:
+# - Daily closes for every watched ticker come from one batched yfinance download
+#   (only tickers whose cached prices are stale are fetched).
+# - RSI and MACD are computed for all tickers at once on a dates x tickers frame.
+# - Crossings are found between the last two bars. Support/resistance levels come
+#   from _find_support_resistance on the bars before the last one.
+# - Each signal is logged once per ticker and bar, then fanned out to every chat
+#   watching that ticker.
+
+from __future__ import annotations   # Annotations below must not touch the lazy pandas module
+
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from db_manager import aload_watchers, arecord_alerts
+from stock_analyzer.lazy import lazy_module
+from stock_analyzer.technicals import DATA_INTERVAL, DATA_PERIOD, _find_support_resistance
+
+yf = lazy_module("yfinance")
+pd = lazy_module("pandas")
+
+# --- Configuration ---
+ALERTS_ENABLED = os.getenv("ALERTS_ENABLED", "true").lower() == "true"
+ALERT_INTERVAL = timedelta(minutes=int(os.getenv("ALERT_INTERVAL_MINUTES", "15")))
+PRICE_TTL = timedelta(minutes=10)     # Closes younger than this are reused rather than downloaded again
+DOWNLOAD_BATCH_SIZE = 200             # Tickers per yfinance request
+ALERT_SENDS_PER_SECOND = 25           # Below Telegram's ~30 messages/second bot-wide limit
+RSI_LENGTH = 14
+RSI_OVERSOLD, RSI_OVERBOUGHT = 30, 70
+SR_WINDOW = 120                       # Bars searched for support/resistance, as in the technicals node
+
+
+@dataclass(frozen=True)
+class Alert:
+    stock_ticker: str
+    rule: str
+    bar_date: str
+    message: str
+
+
+def normalize_ticker(text: str) -> Optional[str]:
+    """'tcs' -> 'TCS.NS'; symbols are NSE unless they already carry an exchange suffix."""
+    symbol = text.strip().upper()
+    if not symbol or not all(c.isalnum() or c in "&-." for c in symbol):
+        return None
+    return symbol if symbol.endswith((".NS", ".BO")) else f"{symbol}.NS"
+
+
+# --- Prices ---
+
+_prices: Dict[str, tuple] = {}        # ticker -> (fetched_at, Series of closes)
+_prices_lock = threading.Lock()
+
+def _download_closes(tickers: List[str]) -> Dict[str, "pd.Series"]:
+    closes = {}
+    for start in range(0, len(tickers), DOWNLOAD_BATCH_SIZE):
+        batch = tickers[start:start + DOWNLOAD_BATCH_SIZE]
+        try:
+            data = yf.download(batch, period=DATA_PERIOD, interval=DATA_INTERVAL, progress=False,
+                               auto_adjust=True, actions=False, threads=True)
+        except Exception as e:
+            print(f"Price download failed for {len(batch)} ticker(s): {e}")
+            continue
+        if data is None or data.empty:
+            continue
+        frame = data["Close"]
+        if isinstance(frame, pd.Series):
+            frame = frame.to_frame(batch[0])
+        for ticker in frame.columns:
+            series = frame[ticker].dropna()
+            if not series.empty:
+                closes[ticker] = series
+    return closes
+
+def load_closes(tickers: Iterable[str]) -> "pd.DataFrame":
+    """Daily closes for the tickers as a dates x tickers frame, downloading only what is stale. Blocking."""
+    tickers = sorted(set(tickers))
+    now = time.time()
+    with _prices_lock:
+        stale = [t for t in tickers if t not in _prices or now - _prices[t][0] > PRICE_TTL.total_seconds()]
+    if stale:
+        downloaded = _download_closes(stale)
+        with _prices_lock:
+            for ticker, series in downloaded.items():
+                _prices[ticker] = (now, series)
+        print(f"Alert prices: downloaded {len(downloaded)}/{len(stale)} stale ticker(s), {len(tickers) - len(stale)} cached.")
+    with _prices_lock:
+        available = {t: _prices[t][1] for t in tickers if t in _prices}
+    return pd.DataFrame(available) if available else pd.DataFrame()
+
+
+# --- Rules ---
+
+def _rsi(closes: "pd.DataFrame", length: int = RSI_LENGTH) -> "pd.DataFrame":
+    """Wilder's RSI for every column at once (the same smoothing pandas_ta uses)."""
+    delta = closes.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / length, adjust=False).mean()
+    loss = (-delta.clip(upper=0)).ewm(alpha=1 / length, adjust=False).mean()
+    return 100 - 100 / (1 + gain / loss)
+
+def _macd(closes: "pd.DataFrame") -> tuple:
+    macd = closes.ewm(span=12, adjust=False).mean() - closes.ewm(span=26, adjust=False).mean()
+    return macd, macd.ewm(span=9, adjust=False).mean()
+
+def _crossed(previous: "pd.Series", latest: "pd.Series", level) -> tuple:
+    """(crossed up, crossed down) masks between the last two bars; level is a scalar or per-ticker Series."""
+    return (previous <= level) & (latest > level), (previous >= level) & (latest < level)
+
+def evaluate(closes: "pd.DataFrame") -> List[Alert]:
+    """Every rule for every ticker, on the latest bar of each. CPU-bound; cost grows with distinct tickers."""
+    if closes.empty or len(closes) < 3:
+        return []
+    alerts: List[Alert] = []
+    # Forward-filled, so a ticker without the latest bar (e.g. suspended) shows no crossing rather than NaNs
+    closes = closes.sort_index()
+    last_dates = closes.apply(lambda column: column.last_valid_index())
+    filled = closes.ffill()
+
+    def add(mask: "pd.Series", rule: str, text: str):
+        for ticker in mask.index[mask.fillna(False).astype(bool).values]:
+            alerts.append(Alert(ticker, rule, str(last_dates[ticker].date()), text.format(ticker=ticker.replace(".NS", ""))))
+
+    rsi = _rsi(filled)
+    up, _ = _crossed(rsi.iloc[-2], rsi.iloc[-1], RSI_OVERBOUGHT)
+    add(up, "rsi_overbought", f"📈 <b>{{ticker}}</b>: RSI crossed above {RSI_OVERBOUGHT} (overbought).")
+    _, down = _crossed(rsi.iloc[-2], rsi.iloc[-1], RSI_OVERSOLD)
+    add(down, "rsi_oversold", f"📉 <b>{{ticker}}</b>: RSI crossed below {RSI_OVERSOLD} (oversold).")
+
+    macd, signal = _macd(filled)
+    spread = macd - signal
+    up, down = _crossed(spread.iloc[-2], spread.iloc[-1], 0)
+    add(up, "macd_bullish", "📈 <b>{ticker}</b>: MACD crossed above its signal line (bullish).")
+    add(down, "macd_bearish", "📉 <b>{ticker}</b>: MACD crossed below its signal line (bearish).")
+
+    previous_close, latest_close = filled.iloc[-2], filled.iloc[-1]
+    for ticker in filled.columns:
+        history = closes[ticker].dropna()
+        if len(history) < 12:
+            continue
+        supports, resistances = _find_support_resistance(history.iloc[:-1].tail(SR_WINDOW), order=5)
+        broken_support = next((level for level in supports if previous_close[ticker] >= level > latest_close[ticker]), None)
+        if broken_support is not None:
+            alerts.append(Alert(ticker, "support_break", str(last_dates[ticker].date()),
+                                f"⚠️ <b>{ticker.replace('.NS', '')}</b>: closed at {latest_close[ticker]:.2f}, below support at {broken_support:.2f}."))
+        broken_resistance = next((level for level in resistances if previous_close[ticker] <= level < latest_close[ticker]), None)
+        if broken_resistance is not None:
+            alerts.append(Alert(ticker, "resistance_break", str(last_dates[ticker].date()),
+                                f"🚀 <b>{ticker.replace('.NS', '')}</b>: closed at {latest_close[ticker]:.2f}, above resistance at {broken_resistance:.2f}."))
+    return alerts
+
+
+# --- Scheduler ---
+
+async def run_alert_cycle(send) -> Dict[str, int]:
+    """
+    One pass over every watchlist: `send(chat_id, text)` is awaited once per chat and alert.
+    Returns counts for logging.
+    """
+    started = time.perf_counter()
+    watchers = await aload_watchers()
+    if not watchers:
+        return {"tickers": 0, "watch_entries": 0, "alerts": 0, "sent": 0}
+    closes = await asyncio.to_thread(load_closes, watchers)
+    alerts = await asyncio.to_thread(evaluate, closes)
+    by_key = {(a.stock_ticker, a.rule, a.bar_date): a for a in alerts}
+    new_alerts = [by_key[key] for key in await arecord_alerts(list(by_key))]
+
+    sent = 0
+    for alert in new_alerts:
+        for chat_id in watchers.get(alert.stock_ticker, []):
+            try:
+                await send(chat_id, alert.message)
+                sent += 1
+            except Exception as e:
+                print(f"Error sending {alert.rule} alert for {alert.stock_ticker} to chat_id {chat_id}: {e}")
+            await asyncio.sleep(1 / ALERT_SENDS_PER_SECOND)
+    stats = {"tickers": len(watchers), "watch_entries": sum(len(chats) for chats in watchers.values()),
+             "alerts": len(new_alerts), "sent": sent}
+    print(f"Alert cycle: {stats} in {time.perf_counter() - started:.2f}s.")
+    return stats
+
+
+class AlertScheduler:
+    """Background task that runs the alert cycle every ALERT_INTERVAL, like SessionJanitor."""
+
+    def __init__(self, send, interval: timedelta = ALERT_INTERVAL):
+        self.send = send
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if ALERTS_ENABLED:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval.total_seconds())
+            try:
+                await run_alert_cycle(self.send)
+            except Exception as e:
+                print(f"Alert cycle failed: {e}")
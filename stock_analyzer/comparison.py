@@ -0,0 +1,172 @@
+# In stock_analyzer/comparison.py
+#
+# "Compare TCS vs INFY vs WIPRO": the per-ticker data is fetched concurrently by the
+# graph (see fetch_comparison_data in graph.py). This module turns it into one
+# side-by-side table, one rebased price-performance chart and one comparative Gemini
+# report. The prompt carries the table and short per-company summaries rather than
+# each company's full Screener dump, so it grows slowly with the number of tickers.
+
+from __future__ import annotations   # Annotations below must not touch the lazy pandas module
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from stock_analyzer import llm
+from stock_analyzer.lazy import lazy_module, use_agg_backend
+from stock_analyzer.technicals import CHART_OUTPUT_DIR
+
+pd = lazy_module("pandas")
+plt = lazy_module("matplotlib.pyplot", setup=use_agg_backend)
+
+# --- Configuration ---
+MAX_COMPARE_TICKERS = 5
+TABLE_RATIOS = ["Market Cap", "Current Price", "Stock P/E", "Book Value", "Dividend Yield", "ROCE", "ROE"]
+TABLE_TECHNICALS = ["Trend Bias", "RSI (14)"]
+HEADLINES_PER_COMPANY = 3
+
+
+def company_label(company: Dict[str, Any]) -> str:
+    return company["stock_ticker"].replace(".NS", "").replace(".BO", "")
+
+def _latest(table: Dict[str, Any], metric: str) -> Optional[str]:
+    for row in (table or {}).get("rows", []):
+        if row.get("metric", "").replace(" ", "").lower() == metric and row.get("values"):
+            return row["values"][-1]
+    return None
+
+def build_comparison_table(companies: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One row per metric, one column per company, in the {"headers", "rows"} shape of the Screener tables."""
+    rows = []
+    for ratio in TABLE_RATIOS:
+        rows.append({"metric": ratio, "values": [str((c.get("screener_data") or {}).get("key_ratios", {}).get(ratio, "-")) for c in companies]})
+    for metric, label in (("sales", "Sales (latest qtr)"), ("netprofit", "Net Profit (latest qtr)")):
+        rows.append({"metric": label, "values": [_latest((c.get("screener_data") or {}).get("quarterly_results"), metric) or "-" for c in companies]})
+    rows.append({"metric": "1Y Return", "values": [f"{c['one_year_return']:+.1f}%" if c.get("one_year_return") is not None else "-" for c in companies]})
+    for name in TABLE_TECHNICALS:
+        rows.append({"metric": name, "values": [str((c.get("technical_summary") or {}).get(name, "-")) for c in companies]})
+    # Rows nobody has data for only add noise
+    rows = [row for row in rows if any(value != "-" for value in row["values"])]
+    return {"headers": [company_label(c) for c in companies], "rows": rows}
+
+def format_comparison_card(table: Dict[str, Any]) -> str:
+    """The table as a monospaced Telegram message, sent before the written comparison."""
+    width = max([len(row["metric"]) for row in table["rows"]] + [6])
+    columns = [max([len(header)] + [len(row["values"][i]) for row in table["rows"]]) for i, header in enumerate(table["headers"])]
+    lines = [" " * width + "  " + "  ".join(h.rjust(w) for h, w in zip(table["headers"], columns))]
+    for row in table["rows"]:
+        lines.append(row["metric"].ljust(width) + "  " + "  ".join(v.rjust(w) for v, w in zip(row["values"], columns)))
+    body = "\n".join(lines).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return f"<b>⚖️ Side by side: {' vs '.join(table['headers'])}</b>\n<pre>{body}</pre>\n<i>Full comparison on the way...</i>"
+
+
+# --- Chart ---
+
+def one_year_returns(closes: Dict[str, pd.Series]) -> Dict[str, Optional[float]]:
+    return {ticker: (float(series.iloc[-1] / series.iloc[0] * 100 - 100) if len(series) > 1 else None)
+            for ticker, series in closes.items()}
+
+def render_comparison_chart(closes: Dict[str, pd.Series]) -> Optional[str]:
+    """Every company's closing price rebased to 100 at the start of the common period, on one chart."""
+    if len(closes) < 2:
+        return None
+    prices = pd.concat(closes, axis=1).sort_index().ffill().dropna()
+    if prices.empty:
+        return None
+    rebased = prices.div(prices.iloc[0]).mul(100)
+    os.makedirs(CHART_OUTPUT_DIR, exist_ok=True)
+    chart_path = os.path.join(CHART_OUTPUT_DIR, f"compare_{'_'.join(t.split('.')[0] for t in closes)}_chart.png")
+    fig, ax = plt.subplots(figsize=(12, 6))
+    try:
+        rebased.rename(columns=lambda t: t.split(".")[0]).plot(ax=ax, linewidth=1.4)
+        ax.axhline(100, color="grey", linewidth=0.8, linestyle="--")
+        ax.set_title("Relative performance (rebased to 100)")
+        ax.set_ylabel("Rebased price")
+        ax.set_xlabel("")
+        ax.grid(alpha=0.3)
+        fig.savefig(chart_path, bbox_inches="tight")
+    finally:
+        plt.close(fig)
+    print(f"Comparison chart saved to: {chart_path}")
+    return chart_path
+
+
+# --- Report ---
+
+def _company_brief(company: Dict[str, Any]) -> Dict[str, Any]:
+    screener_data = company.get("screener_data") or {}
+    return {
+        "company": company.get("company_name") or company["stock_ticker"],
+        "ticker": company["stock_ticker"],
+        "sector": screener_data.get("sector"),
+        "pros": (screener_data.get("analysis") or {}).get("pros", [])[:3],
+        "cons": (screener_data.get("analysis") or {}).get("cons", [])[:3],
+        "headlines": [article.get("title") for article in (company.get("news_articles") or [])[:HEADLINES_PER_COMPANY]],
+    }
+
+def _comparison_prompt(comparison: Dict[str, Any], market_context_articles: List[Dict[str, Any]]) -> str:
+    table = comparison["table"]
+    names = " vs ".join(table["headers"])
+    table_text = "\n".join(f"{row['metric']}: " + " | ".join(f"{h} {v}" for h, v in zip(table["headers"], row["values"])) for row in table["rows"])
+    briefs = json.dumps([_company_brief(c) for c in comparison["companies"]], indent=1)
+    market = json.dumps([article.get("title") for article in market_context_articles or []])
+    return f"""
+    You are EquiSage, an expert AI stock market analyst for the Indian market.
+    Write ONE comparative report on **{names}**. Compare the companies against each other; do not write a separate report per company.
+
+    **CRITICAL FORMATTING RULES:**
+    - **MUST** use Telegram-compatible HTML tags: `<b>`, `<i>`. **DO NOT USE MARKDOWN.**
+    - Use bullet points with an emoji, like `📈 <b>Metric:</b> ...`.
+
+    **DATA FOR COMPARISON:**
+    - Side-by-side numbers:
+    {table_text}
+    - Company notes (pros, cons, recent headlines): {briefs}
+    - Market context headlines (shared by all): {market}
+
+    **REQUIRED OUTPUT STRUCTURE:**
+
+    <b>⚖️ EquiSage Comparison: {names}</b>
+    --------------------------------------
+
+    <b>Valuation</b>
+    [Who is cheaper or richer on P/E, book value and yield, and whether the gap looks justified.]
+
+    <b>Profitability & Growth</b>
+    [ROCE, ROE and the latest quarter's sales and profit, compared.]
+
+    <b>Momentum</b>
+    [1-year return and the technical picture, compared. A relative performance chart is sent separately.]
+
+    <b>Risks & Catalysts</b>
+    [The key differentiators from the notes and the headlines.]
+
+    <b>EquiSage Verdict</b>
+    [Which company looks best placed and for what kind of investor, with the main caveat for each.]
+
+    --------------------------------------
+    <i>Disclaimer: AI-generated analysis. Not financial advice. DYOR.</i>
+    """
+
+def build_fallback_comparison(comparison: Dict[str, Any]) -> str:
+    """The table as the whole reply, when the AI write-up is unavailable or too slow."""
+    table = comparison.get("table") or {"headers": [], "rows": []}
+    if not table["headers"]:
+        return "I could not fetch data for any of those companies. Please check the names and try again."
+    lines = [f"<b>⚖️ EquiSage Comparison: {' vs '.join(table['headers'])}</b>", "--------------------------------------",
+             "<i>The full AI comparison is unavailable, so here are the key numbers.</i>", ""]
+    for row in table["rows"]:
+        lines.append(f"📈 <b>{row['metric']}:</b> " + " | ".join(f"{h} {v}" for h, v in zip(table["headers"], row["values"])))
+    lines += ["", "<i>Disclaimer: AI-generated analysis. Not financial advice. DYOR.</i>"]
+    return "\n".join(lines)
+
+async def agenerate_comparison_report(comparison: Dict[str, Any], market_context_articles: List[Dict[str, Any]]) -> str:
+    """One Gemini call for the whole comparison."""
+    if len(comparison.get("companies") or []) < 2 or not llm.get_model(llm.REPORT_MODEL):
+        return build_fallback_comparison(comparison)
+    try:
+        return await llm.generate("generate_comparison", _comparison_prompt(comparison, market_context_articles),
+                                  model=llm.REPORT_MODEL, priority=llm.PRIORITY_REPORT)
+    except Exception as e:
+        print(f"An error occurred while generating the comparison: {e}")
+        return build_fallback_comparison(comparison)
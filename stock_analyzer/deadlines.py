@@ -0,0 +1,98 @@
+# In stock_analyzer/deadlines.py
+#
+# Latency budget for one analysis run. Each graph node gets a deadline, capped by
+# what is left of the run's overall budget. A node that overruns is cancelled and
+# the graph carries on with the node's fallback output, recording the section as
+# missing.
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+# --- Configuration ---
+RUN_BUDGET = float(os.getenv("ANALYSIS_BUDGET_SECONDS", "90"))
+DELIVERY_HEADROOM = 5.0          # Left over at the end of the slowest path for sending the results
+# Seconds each node may take. The parallel fetches share the window after the screener,
+# so no fetch may take longer than fetch_technicals. The slowest path sums to
+# 8 + 10 + 15 + 32 + 20 = 85 s, which is RUN_BUDGET minus DELIVERY_HEADROOM.
+SLOWEST_PATH = ("router", "fetch_screener", "fetch_technicals", "generate_report", "generate_pdf")
+NODE_DEADLINES = {
+    "router": 8.0,
+    "answer_follow_up": 30.0,
+    "fetch_screener": 10.0,
+    "fetch_technicals": 15.0,
+    "fetch_stock_news": 12.0,
+    "fetch_market_news": 15.0,
+    "generate_report": 32.0,
+    "generate_pdf": 20.0,
+    # Per-ticker fetches inside run concurrently under their own deadlines above
+    "fetch_comparison": 25.0,
+    "generate_comparison": 40.0,
+}
+
+# Timeouts for the calls inside the nodes; work offloaded to threads cannot be cancelled, only bounded
+LLM_REQUEST_TIMEOUT = 45         # Gemini request_options timeout
+YFINANCE_TIMEOUT = 15
+SCREENER_TIMEOUT = (5, 10)       # (connect, read) for requests
+
+if sum(NODE_DEADLINES[name] for name in SLOWEST_PATH) > RUN_BUDGET - DELIVERY_HEADROOM:
+    # A lower ANALYSIS_BUDGET_SECONDS makes the last nodes (the PDF first) run on what is left
+    print(f"Warning: node deadlines on the slowest path exceed the {RUN_BUDGET:.0f}s run budget; later sections may be cut short.")
+
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(name: str, timed_out: bool):
+    with _stats_lock:
+        counters = _stats.setdefault(name, {"runs": 0, "timeouts": 0})
+        counters["runs"] += 1
+        counters["timeouts"] += int(timed_out)
+
+def node_timeout_stats() -> Dict[str, Dict[str, float]]:
+    """Runs, timeouts and timeout rate per node since startup, for tuning the budget."""
+    with _stats_lock:
+        return {
+            name: {**counters, "timeout_rate": round(counters["timeouts"] / counters["runs"], 3)}
+            for name, counters in _stats.items()
+        }
+
+def with_deadline(name: str, node: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]], section: str,
+                  fallback: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]:
+    """
+    Wraps an async graph node so it returns fallback(state) once its deadline or the
+    run's budget runs out; the overrunning node is cancelled. The missing `section` is
+    added to the state's missing_sections, and degraded_reason says whether the node
+    timed out or failed. The budget clock starts when the job is dequeued (run_deadline
+    in the initial state), or else at the first wrapped node.
+    """
+    async def run_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        run_deadline = state.get("run_deadline")
+        updates: Dict[str, Any] = {}
+        if run_deadline is None:
+            run_deadline = time.time() + RUN_BUDGET
+            updates["run_deadline"] = run_deadline
+        timeout = max(0.0, min(NODE_DEADLINES[name], run_deadline - time.time()))
+
+        started = time.perf_counter()
+        reason = "timeout"
+        try:
+            if timeout <= 0:
+                raise asyncio.TimeoutError()  # Budget already spent: do not start work that will be discarded
+            result = await asyncio.wait_for(node(state), timeout=timeout)
+            _record(name, False)
+            return {**result, **updates}
+        except asyncio.TimeoutError:
+            _record(name, True)
+            print(f"Node '{name}' missed its {timeout:.1f}s deadline; continuing without {section}.")
+        except Exception as e:
+            # A crashing node degrades the same way as a slow one.
+            _record(name, False)
+            reason = "error"
+            print(f"Node '{name}' failed after {time.perf_counter() - started:.1f}s: {e}")
+        # degraded_reason is for the metrics wrapper, which strips it before the graph sees it
+        return {**fallback(state), **updates, "missing_sections": [section], "degraded_reason": reason}
+    run_node.__name__ = getattr(node, "__name__", name)
+    return run_node
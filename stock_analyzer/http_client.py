@@ -0,0 +1,44 @@
+# In stock_analyzer/http_client.py
+#
+# One shared async HTTP client for every fetch node, so concurrent analyses reuse
+# pooled connections instead of each opening its own.
+
+from typing import Optional
+
+import httpx
+
+# --- Configuration ---
+MAX_CONNECTIONS = 200
+MAX_KEEPALIVE_CONNECTIONS = 50
+DEFAULT_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36'
+
+_client: Optional[httpx.AsyncClient] = None
+_transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={'User-Agent': USER_AGENT},
+            timeout=DEFAULT_TIMEOUT,
+            follow_redirects=True,
+            transport=_transport,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS),
+        )
+    return _client
+
+def use_transport(transport: Optional[httpx.AsyncBaseTransport]):
+    """Sends every later request through `transport` (the benchmarks' record/replay transports); None restores the network."""
+    global _client, _transport
+    _transport = transport
+    _client = None  # The next get_http_client() builds a client on the new transport
+
+async def close_http_client():
+    """Closes the shared client; call on application shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
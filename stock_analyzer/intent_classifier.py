@@ -1,41 +1,22 @@
 # In stock_analyzer/intent_classifier.py
 
-import os
 import json
 import re
 from typing import Dict, Any, Optional
-import google.generativeai as genai
-from dotenv import load_dotenv
 
-load_dotenv()
+from stock_analyzer import llm
+from stock_analyzer.comparison import MAX_COMPARE_TICKERS
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-MODEL = genai.GenerativeModel('gemini-2.0-flash')
 
-def classify_intent(state: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Classifies user intent using a fully AI-powered approach for all messages.
-    """
-    print("---NODE: Classifying Intent (Full AI V6)---")
-    
-    messages = state.get("messages", [])
-    if not messages:
-        # This case is for safety, should rarely be hit.
-        return {**state, "intent": "off_topic", "stock_ticker": None}
-    
-    user_message = messages[-1].content
-    print(f"Processing user message: '{user_message}'")
-
-    # Every message now goes to Gemini for classification.
-    print("Using Gemini for universal intent classification...")
-    
-    prompt = f"""
+def _intent_prompt(user_message: str) -> str:
+    return f"""
     You are an expert intent classifier for EquiSage, an AI Indian stock market analyst.
     Your task is to analyze the user's message and determine their primary intent.
-    Respond ONLY with a single, clean JSON object with two keys: "intent" and "stock_ticker".
+    Respond ONLY with a single, clean JSON object with three keys: "intent", "stock_ticker" and "stock_tickers".
 
-    1. **"intent"**: Classify the user's intent into one of these four categories:
+    1. **"intent"**: Classify the user's intent into one of these five categories:
        * "stock_analysis": The user is asking about or mentioning a specific Indian company.
+       * "comparison": The user wants two or more specific Indian companies compared (e.g., "compare TCS vs INFY vs WIPRO", "HDFC Bank or ICICI Bank?").
        * "greeting": The user is saying hello or making a social pleasantry (e.g., "hi", "good morning", "how are you?").
        * "help": The user is asking for instructions or help (e.g., "what can you do?", "help me", "instructions").
        * "off_topic": The user is asking about anything else.
@@ -44,36 +25,62 @@ def classify_intent(state: Dict[str, Any]) -> Dict[str, Any]:
        - If the intent is "stock_analysis", you MUST provide the official NSE latest stock ticker ending in ".NS".
          Use your knowledge to map company names, common abbreviations, or even misspelled names to the correct ticker.
          Examples: "reliance" -> "RELIANCE.NS", "sbi bank" -> "SBIN.NS", "infy" -> "INFY.NS".
+       - If the intent is "comparison", give the ticker of the first company mentioned.
        - For ANY OTHER intent ("greeting", "help", "off_topic"), this key MUST be null.
 
+    3. **"stock_tickers"**:
+       - If the intent is "comparison", a JSON list of the NSE tickers of every company to compare, in the order mentioned.
+       - For ANY OTHER intent, this key MUST be null.
+
     **User Message:** "{user_message}"
 
     **JSON Response:**
     """
-    
+
+def _parse_intent(state: Dict[str, Any], response_text: str) -> Dict[str, Any]:
+    # Robustly find the JSON blob in the response
+    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    if json_match:
+        result = json.loads(json_match.group())
+        intent = result.get("intent", "off_topic")
+        ticker = result.get("stock_ticker")
+        tickers = None
+
+        if intent == "comparison":
+            tickers = list(dict.fromkeys(t.upper() for t in (result.get("stock_tickers") or []) if t))[:MAX_COMPARE_TICKERS]
+            if len(tickers) < 2:
+                # One company is a plain analysis
+                print(f"Gemini suggested 'comparison' with tickers {tickers}. Reclassifying as stock_analysis.")
+                intent, ticker, tickers = "stock_analysis", (tickers[0] if tickers else ticker), None
+            else:
+                ticker = tickers[0]
+        
+        # Final validation: if intent is analysis, ticker must not be null.
+        if intent == "stock_analysis" and not ticker:
+            print("Gemini suggested 'stock_analysis' but found no ticker. Reclassifying as off_topic.")
+            intent = "off_topic"
+        
+        print(f"Parsed result: intent='{intent}', ticker='{ticker}'" + (f", tickers={tickers}" if tickers else ""))
+        return {**state, "intent": intent, "stock_ticker": ticker, "stock_tickers": tickers}
+    else:
+        # If Gemini fails to return JSON, it's an off-topic query.
+        raise ValueError("Could not parse JSON from Gemini response")
+
+async def aclassify_intent(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Classifies user intent using a fully AI-powered approach for all messages.
+    """
+    messages = state.get("messages", [])
+    if not messages:
+        return {**state, "intent": "off_topic", "stock_ticker": None}
+
+    user_message = messages[-1].content
+    print(f"Classifying intent for: '{user_message}'")
     try:
-        response = MODEL.generate_content(prompt)
-        response_text = response.text.strip()
+        response_text = (await llm.generate("classify_intent", _intent_prompt(user_message), priority=llm.PRIORITY_ROUTING)).strip()
         print(f"Gemini response: {response_text}")
-        
-        # Robustly find the JSON blob in the response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group())
-            intent = result.get("intent", "off_topic")
-            ticker = result.get("stock_ticker")
-            
-            # Final validation: if intent is analysis, ticker must not be null.
-            if intent == "stock_analysis" and not ticker:
-                print("Gemini suggested 'stock_analysis' but found no ticker. Reclassifying as off_topic.")
-                intent = "off_topic"
-            
-            print(f"Parsed result: intent='{intent}', ticker='{ticker}'")
-            return {**state, "intent": intent, "stock_ticker": ticker}
-        else:
-            # If Gemini fails to return JSON, it's an off-topic query.
-            raise ValueError("Could not parse JSON from Gemini response")
-            
+        return _parse_intent(state, response_text)
+
     except Exception as e:
         print(f"Error during Gemini intent resolution: {e}. Defaulting to off_topic.")
-        return {**state, "intent": "off_topic", "stock_ticker": None}
\ No newline at end of file
+        return {**state, "intent": "off_topic", "stock_ticker": None}
@@ -0,0 +1,62 @@
+# In stock_analyzer/lazy.py
+#
+# Deferred imports for heavy optional-at-startup dependencies (pandas, matplotlib,
+# reportlab, ...). `pd = lazy_module("pandas")` binds a stand-in that imports the real
+# module on first attribute access, so the web process starts without paying for
+# libraries only the analysis nodes use.
+
+import importlib
+import threading
+from types import ModuleType
+from typing import Callable, List, Optional
+
+_import_lock = threading.Lock()
+_registry: List["LazyModule"] = []
+
+
+class LazyModule:
+    """Proxy for a module that is imported the first time one of its attributes is used."""
+
+    def __init__(self, name: str, setup: Optional[Callable[[], None]] = None):
+        self._name = name
+        self._setup = setup   # Runs once, just before the import (e.g. choosing a matplotlib backend)
+        self._module: Optional[ModuleType] = None
+
+    def load(self) -> ModuleType:
+        """Imports the module now; for modules used only for their import side effects."""
+        if self._module is None:
+            with _import_lock:
+                if self._module is None:
+                    if self._setup:
+                        self._setup()
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name: str, setup: Optional[Callable[[], None]] = None) -> LazyModule:
+    module = LazyModule(name, setup)
+    _registry.append(module)
+    return module
+
+def preload_lazy_modules():
+    """
+    Imports every registered lazy module. Blocking: run it in a thread once the server
+    is up, so the first analysis does not pay for the imports either.
+    """
+    for module in list(_registry):
+        try:
+            module.load()
+        except Exception as e:
+            print(f"Preloading {module._name} failed: {e}")
+
+def use_agg_backend():
+    """Non-interactive matplotlib backend; must be chosen before pyplot/mplfinance are imported."""
+    import matplotlib
+    matplotlib.use('Agg')
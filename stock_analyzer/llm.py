@@ -0,0 +1,314 @@
+# In stock_analyzer/llm.py
+#
+# The one Gemini client for the whole process, and the gateway every call goes
+# through. The SDK is configured once, on first use, and each model object is shared.
+# The gateway enforces a global concurrency cap and QPS token bucket, serves waiting
+# calls by priority (routing before follow-ups before reports), hedges calls that run
+# past the model's observed p95, retries failures on a fallback model, and keeps
+# latency/token counters per caller.
+
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from stock_analyzer.deadlines import LLM_REQUEST_TIMEOUT
+from stock_analyzer.lazy import lazy_module
+from stock_analyzer.metrics import track_call, LLM_TOKENS
+
+load_dotenv()
+
+genai = lazy_module("google.generativeai")
+
+# --- Configuration ---
+CHAT_MODEL = os.getenv("GEMINI_CHAT_MODEL", "gemini-2.0-flash")            # Routing, intent, follow-ups
+REPORT_MODEL = os.getenv("GEMINI_REPORT_MODEL", "gemini-1.5-flash-latest")  # Report and PDF write-ups
+FALLBACK_MODEL = os.getenv("GEMINI_FALLBACK_MODEL", "gemini-1.5-flash")     # Retried once when the primary fails; empty disables
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QPS = float(os.getenv("LLM_QPS", "4"))
+LLM_BURST = int(os.getenv("LLM_BURST", "8"))
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "true").lower() == "true"
+HEDGE_MIN_SAMPLES = 20      # Latencies a model needs before its p95 is trusted
+LATENCY_WINDOW = 200        # Recent latencies kept per model and per caller
+
+# Lower runs first. Routing is short and gates everything after it; reports are long.
+PRIORITY_ROUTING = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_REPORT = 2
+
+_models: Dict[str, Any] = {}
+_lock = threading.Lock()
+_configured = False
+
+
+def get_model(name: str = CHAT_MODEL) -> Optional[Any]:
+    """The shared GenerativeModel for `name`, or None if Gemini cannot be configured."""
+    global _configured
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _lock:
+        if name in _models:
+            return _models[name]
+        try:
+            if not _configured:
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                _configured = True
+                print("Gemini API configured successfully.")
+            model = _models[name] = genai.GenerativeModel(name)
+        except Exception as e:
+            print(f"CRITICAL WARNING: Gemini API key not found or invalid ({name}). {e}")
+            return None
+    return model
+
+def install_model(name: str, model: Any):
+    """Uses `model` for `name` instead of a GenerativeModel (the benchmarks install recording and replaying stand-ins)."""
+    with _lock:
+        _models[name] = model
+
+def require_model(name: str = CHAT_MODEL) -> Any:
+    """get_model for callers that cannot do without Gemini; raises instead of returning None."""
+    model = get_model(name)
+    if model is None:
+        raise RuntimeError("The Gemini API is not configured.")
+    return model
+
+
+# --- Admission: priority gate and token bucket ---
+
+class _PriorityGate:
+    """
+    Concurrency cap whose waiters are admitted lowest priority first (FIFO within a
+    priority). Holds no loop-bound primitives, so it survives across event loops.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def try_acquire(self) -> bool:
+        """Takes a free slot without queueing (used for hedges, which must never delay queued calls)."""
+        if self.active < self.limit and not self.waiting():
+            self.active += 1
+            return True
+        return False
+
+    async def acquire(self, priority: int):
+        if self.try_acquire():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # A slot was handed over just as we were cancelled
+            else:
+                future.cancel()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # The slot passes straight to the next waiter
+                return
+        self.active -= 1
+
+
+class _TokenBucket:
+    """QPS limit shared by every call. Tokens are reserved, so waiters are served in order."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, block: bool = True) -> Optional[float]:
+        """Takes a token and returns how long to wait for it; with block=False, None if one is not free now."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if not block and self._tokens < 1:
+                return None
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def try_take(self) -> bool:
+        return self._reserve(block=False) is not None
+
+    async def acquire(self):
+        if (wait := self._reserve()) > 0:
+            await asyncio.sleep(wait)
+
+
+_gate = _PriorityGate(LLM_MAX_CONCURRENCY)
+_bucket = _TokenBucket(LLM_QPS, LLM_BURST)
+
+
+# --- Metrics ---
+
+_model_latencies: Dict[str, Deque[float]] = {}
+_caller_stats: Dict[str, Dict[str, Any]] = {}
+_stats_lock = threading.Lock()
+
+
+def _percentile(samples, fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _hedge_delay(model_name: str) -> Optional[float]:
+    """Seconds after which a call to this model is hedged: its observed p95, once there are enough samples."""
+    samples = _model_latencies.get(model_name)
+    if not HEDGE_ENABLED or not samples or len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return _percentile(samples, 0.95)
+
+def _caller(caller: str) -> Dict[str, Any]:
+    return _caller_stats.setdefault(caller, {
+        "calls": 0, "errors": 0, "fallbacks": 0, "hedges": 0, "hedge_wins": 0,
+        "prompt_tokens": 0, "output_tokens": 0,
+        "latencies": deque(maxlen=LATENCY_WINDOW), "queue_waits": deque(maxlen=LATENCY_WINDOW),
+    })
+
+def _record_attempt(model_name: str, latency: float):
+    with _stats_lock:
+        _model_latencies.setdefault(model_name, deque(maxlen=LATENCY_WINDOW)).append(latency)
+
+def _record_counts(caller: str, **counts: int):
+    with _stats_lock:
+        stats = _caller(caller)
+        for name, value in counts.items():
+            stats[name] += value
+
+def _record_call(caller: str, latency: float, queue_wait: float, response: Any = None, **counts: int):
+    with _stats_lock:
+        stats = _caller(caller)
+        stats["calls"] += 1
+        stats["latencies"].append(latency)
+        stats["queue_waits"].append(queue_wait)
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        stats["prompt_tokens"] += prompt_tokens
+        stats["output_tokens"] += output_tokens
+        for name, value in counts.items():
+            stats[name] += value
+    if response is not None:
+        LLM_TOKENS.inc(prompt_tokens, caller=caller, kind="prompt")
+        LLM_TOKENS.inc(output_tokens, caller=caller, kind="output")
+
+def llm_stats() -> Dict[str, Any]:
+    """Per-caller counters with p50/p95 latency and queue wait, plus the gateway's current load."""
+    with _stats_lock:
+        callers = {}
+        for caller, stats in _caller_stats.items():
+            summary = {key: value for key, value in stats.items() if not isinstance(value, deque)}
+            for label, samples in (("latency", stats["latencies"]), ("queue_wait", stats["queue_waits"])):
+                for name, fraction in (("p50", 0.5), ("p95", 0.95)):
+                    value = _percentile(samples, fraction)
+                    summary[f"{label}_{name}"] = round(value, 3) if value is not None else None
+            callers[caller] = summary
+    return {"in_flight": _gate.active, "queued": _gate.waiting(), "callers": callers}
+
+
+# --- Gateway ---
+
+async def _attempt(model_name: str, prompt: str, timeout: float) -> Tuple[str, Any]:
+    """One request; returns (text, response). Reading .text raises for blocked responses, which counts as a failure."""
+    model = require_model(model_name)
+    started = time.monotonic()
+    with track_call("gemini"):
+        response = await model.generate_content_async(prompt, request_options={"timeout": timeout})
+        text = response.text
+    _record_attempt(model_name, time.monotonic() - started)
+    return text, response
+
+async def _hedged_attempt(caller: str, model_name: str, prompt: str, timeout: float) -> Tuple[str, Any]:
+    """
+    Sends the request, and if it is still running after the model's p95 sends a
+    duplicate (when a slot and a token are free). The first success wins; the other
+    is cancelled.
+    """
+    primary = asyncio.create_task(_attempt(model_name, prompt, timeout))
+    hedge: Optional[asyncio.Task] = None
+    delay = _hedge_delay(model_name)
+    try:
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not _gate.try_acquire():
+            return await primary
+        if not _bucket.try_take():
+            _gate.release()
+            return await primary
+
+        print(f"LLM call for '{caller}' passed p95 ({delay:.1f}s); sending a hedged request.")
+        _record_counts(caller, hedges=1)
+        hedge = asyncio.create_task(_attempt(model_name, prompt, timeout))
+        hedge.add_done_callback(lambda _: _gate.release())
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if task is hedge:
+                        _record_counts(caller, hedge_wins=1)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in (primary, hedge):
+            if task is not None:
+                task.cancel()
+
+async def generate(caller: str, prompt: str, model: str = CHAT_MODEL, priority: int = PRIORITY_INTERACTIVE,
+                   timeout: float = LLM_REQUEST_TIMEOUT) -> str:
+    """
+    Sends a prompt through the gateway and returns the response text. `caller` names
+    the call site in llm_stats(). Raises if both the model and the fallback fail.
+    """
+    queued = time.monotonic()
+    await _gate.acquire(priority)
+    try:
+        await _bucket.acquire()
+        started = time.monotonic()
+        queue_wait = started - queued
+        try:
+            text, response = await _hedged_attempt(caller, model, prompt, timeout)
+            _record_call(caller, time.monotonic() - started, queue_wait, response)
+            return text
+        except Exception as e:
+            if not FALLBACK_MODEL or FALLBACK_MODEL == model:
+                _record_call(caller, time.monotonic() - started, queue_wait, errors=1)
+                raise
+            print(f"LLM call for '{caller}' failed on {model} ({e}); retrying on {FALLBACK_MODEL}.")
+        await _bucket.acquire()
+        try:
+            text, response = await _attempt(FALLBACK_MODEL, prompt, timeout)
+        except Exception:
+            _record_call(caller, time.monotonic() - started, queue_wait, fallbacks=1, errors=1)
+            raise
+        _record_call(caller, time.monotonic() - started, queue_wait, response, fallbacks=1)
+        return text
+    finally:
+        _gate.release()
@@ -1,9 +1,11 @@
 # In stock_analyzer/market_news.py
 
-from gnews import GNews
+import asyncio
 from typing import List, Dict, Any, Set
 import pprint
 
+from stock_analyzer.news import agoogle_news
+
 # --- Configuration ---
 # These are the broad topics we'll search for. This list is the "secret sauce"
 # and can be refined over time to improve relevance for the Indian market.
@@ -25,68 +27,46 @@ ARTICLES_PER_TOPIC = 1
 NEWS_TIME_WINDOW = "7d"  # 7-day window for macro news is usually sufficient
 MAX_TOTAL_ARTICLES = 9   # A hard cap to keep the context for the LLM concise
 
-def fetch_market_context_news(state: Dict[str, Any]) -> Dict[str, List[Dict[str, str]]]:
+def _add_articles(all_articles: List[Dict[str, str]], seen_urls: Set[str], topic: str, articles: List[Dict[str, Any]]):
+    for article in articles:
+        url = article.get("url")
+        # Check if we have already added this article from another search
+        if url and url not in seen_urls:
+            formatted_article = {
+                "topic": topic, # Add the topic to know why this news was pulled
+                "title": article["title"],
+                "url": url,
+                "published_date": article.get("published date", "N/A"),
+                "source": article["publisher"]["title"],
+                "summary": article.get("description", "No summary available.")
+            }
+            all_articles.append(formatted_article)
+            seen_urls.add(url)
+
+async def afetch_market_context_news(state: Dict[str, Any]) -> Dict[str, List[Dict[str, str]]]:
     """
-    Fetches broad, market-moving news relevant to the Indian economy.
-
-    This function is designed to be a node in a LangGraph. It does not require
-    any specific input from the state but provides crucial context for the overall analysis.
-    It fetches the top news for a curated list of macroeconomic topics.
-
-    Args:
-        state (Dict[str, Any]): The current state of the LangGraph (not used in this node).
-
-    Returns:
-        Dict[str, List[Dict[str, str]]]: A dictionary containing a list of
-                                         market context news articles.
-                                         The key is 'market_context_articles'.
+    Fetches broad, market-moving news relevant to the Indian economy: the top news for
+    each curated macroeconomic topic. The node needs nothing from the state.
+    All topics are searched concurrently; results are merged in topic order.
     """
     print("---NODE: Fetching General Market Context News---")
-
-    google_news = GNews(
-        period=NEWS_TIME_WINDOW,
-        max_results=ARTICLES_PER_TOPIC,
-        country='IN',
-        language='en'
+    results = await asyncio.gather(
+        *(agoogle_news(topic, NEWS_TIME_WINDOW, ARTICLES_PER_TOPIC) for topic in MACRO_SEARCH_TOPICS),
+        return_exceptions=True,
     )
 
     all_articles: List[Dict[str, str]] = []
-    seen_urls: Set[str] = set() # To avoid duplicate articles from different search terms
-
-    try:
-        for topic in MACRO_SEARCH_TOPICS:
-            if len(all_articles) >= MAX_TOTAL_ARTICLES:
-                print(f"Reached max article limit of {MAX_TOTAL_ARTICLES}. Stopping search.")
-                break
-
-            print(f"Searching for macro topic: '{topic}'...")
-            articles = google_news.get_news(topic)
-
-            for article in articles:
-                url = article.get("url")
-                # Check if we have already added this article from another search
-                if url and url not in seen_urls:
-                    formatted_article = {
-                        "topic": topic, # Add the topic to know why this news was pulled
-                        "title": article["title"],
-                        "url": url,
-                        "published_date": article.get("published date", "N/A"),
-                        "source": article["publisher"]["title"],
-                        "summary": article.get("description", "No summary available.")
-                    }
-                    all_articles.append(formatted_article)
-                    seen_urls.add(url)
-        
-        if not all_articles:
-            print("No significant market context news found.")
-            return {"market_context_articles": []}
-        
-        print(f"Successfully fetched {len(all_articles)} macro-economic/market articles.")
-        return {"market_context_articles": all_articles}
-
-    except Exception as e:
-        print(f"An error occurred while fetching market context news: {e}")
-        return {"market_context_articles": []}
+    seen_urls: Set[str] = set()
+    for topic, articles in zip(MACRO_SEARCH_TOPICS, results):
+        if isinstance(articles, Exception):
+            print(f"Macro topic '{topic}' failed: {articles}")
+            continue
+        if len(all_articles) >= MAX_TOTAL_ARTICLES:
+            break
+        _add_articles(all_articles, seen_urls, topic, articles)
+
+    print(f"Successfully fetched {len(all_articles)} macro-economic/market articles.")
+    return {"market_context_articles": all_articles}
 
 # --- Self-testing block ---
 # This allows you to run this file directly to test its functionality
@@ -94,7 +74,7 @@ if __name__ == '__main__':
     print("---Testing Market Context News Fetching Module---")
 
     # This function doesn't need any input state, so we pass an empty dict
-    market_data = fetch_market_context_news({})
+    market_data = asyncio.run(afetch_market_context_news({}))
 
     print("\n--- Results ---")
     if market_data['market_context_articles']:
@@ -0,0 +1,220 @@
+# In stock_analyzer/metrics.py
+#
+# Minimal Prometheus-compatible metrics: counters, gauges and histograms with labels,
+# rendered in the text exposition format for the /metrics endpoint. Recording is a
+# lock, a dict lookup and (for histograms) a bisect, so it is cheap enough to call
+# on every node run and external request.
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from stock_analyzer import tracing
+
+# Seconds; spans a cache hit (ms) to a slow Gemini report (~a minute)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+_registry: List["_Metric"] = []
+
+
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, Any]) -> Tuple[str, ...]:
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self._samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """A settable value, or one read from `function` at scrape time (e.g. queue depth)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def set(self, value: float, **labels: Any):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(self._function())}"]
+            except Exception as e:
+                print(f"Metric {self.name} could not be read: {e}")
+                return []
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (non-cumulative, last is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels: Any):
+        """Observes the duration of the `with` block, including when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# --- Application metrics ---
+
+NODE_DURATION = Histogram("equisage_node_duration_seconds", "Time spent in each graph node.", ("node",))
+NODE_RUNS = Counter("equisage_node_runs_total", "Graph node runs by outcome (ok, error, timeout).", ("node", "outcome"))
+EXTERNAL_CALL_DURATION = Histogram("equisage_external_call_duration_seconds",
+                                   "Latency of calls to external services.", ("service", "outcome"))
+ANALYSIS_DURATION = Histogram("equisage_analysis_duration_seconds",
+                              "End-to-end time from dequeue to the last reply, by intent.", ("intent",))
+ANALYSIS_ERRORS = Counter("equisage_analysis_errors_total", "Analyses that failed with an unhandled error.")
+ANALYSES_IN_FLIGHT = Gauge("equisage_analyses_in_flight", "Analyses currently being processed.")
+QUEUE_DEPTH = Gauge("equisage_job_queue_depth", "Jobs waiting for a worker.")
+DUPLICATE_UPDATES = Counter("equisage_duplicate_updates_total", "Telegram webhook redeliveries suppressed.")
+CACHE_LOOKUPS = Counter("equisage_cache_lookups_total", "Cache lookups by cache (session or node name) and result.", ("cache", "result"))
+LLM_TOKENS = Counter("equisage_llm_tokens_total", "Gemini tokens by caller and kind (prompt or output).", ("caller", "kind"))
+
+
+@contextmanager
+def track_call(service: str):
+    """Times an external call into EXTERNAL_CALL_DURATION, labelled ok or error, inside a trace span."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        with tracing.span(f"call:{service}", service=service):
+            yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_CALL_DURATION.observe(time.perf_counter() - started, service=service, outcome=outcome)
+
+def _node_outcome(output: Any) -> str:
+    if not isinstance(output, dict):
+        return "ok"
+    if output.get("degraded_reason"):
+        return output["degraded_reason"]   # "timeout" or "error", set by with_deadline
+    if output.get("error") or any(isinstance(value, dict) and value.get("error") for value in output.values()):
+        return "error"
+    return "ok"
+
+def instrumented(name: str, node: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]:
+    """Wraps an async graph node so its duration and outcome are recorded and traced; used for every node in the graph."""
+    async def run_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with tracing.span(f"node:{name}", node=name) as node_span:
+                output = await node(state)
+                outcome = _node_outcome(output)
+                if isinstance(output, dict):
+                    output.pop("degraded_reason", None)   # Not a state key
+                if node_span is not None:
+                    node_span.set("outcome", outcome)
+            return output
+        finally:
+            NODE_DURATION.observe(time.perf_counter() - started, node=name)
+            NODE_RUNS.inc(node=name, outcome=outcome)
+    run_node.__name__ = getattr(node, "__name__", name)
+    return run_node
@@ -0,0 +1,171 @@
+# In stock_analyzer/node_cache.py
+#
+# Memoization for graph nodes. A node's output is cached under the state fields it
+# depends on (e.g. the ticker) plus an optional date bucket, for a per-node TTL.
+# Lookups hit an in-process LRU first, then the node_cache table in SQLite, which
+# survives restarts and is shared by every worker on the same database.
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from db_manager import run_db, load_node_result, store_node_result
+from stock_analyzer.metrics import CACHE_LOOKUPS
+
+# --- Configuration ---
+NODE_CACHE_ENABLED = os.getenv("NODE_CACHE", "true").lower() == "true"
+# Comma-separated node names to opt out of caching without a code change
+NODE_CACHE_DISABLED = {name.strip() for name in os.getenv("NODE_CACHE_DISABLED", "").split(",") if name.strip()}
+MEMORY_CACHE_SIZE = 512
+IST = timezone(timedelta(hours=5, minutes=30))   # Date buckets follow the Indian trading day
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    ttl: timedelta
+    key_fields: Tuple[str, ...] = ()         # State fields the output depends on
+    date_bucket: Optional[str] = None        # strftime format; entries never outlive their bucket
+    enabled: bool = True
+    # Checked on every hit; False drops the entry (e.g. a cached chart file was deleted)
+    is_valid: Optional[Callable[[Dict[str, Any]], bool]] = None
+
+
+def _chart_exists(output: Dict[str, Any]) -> bool:
+    chart_path = (output.get("technical_analysis") or {}).get("chart_path")
+    return not chart_path or os.path.exists(chart_path)
+
+
+NODE_CACHE_POLICIES: Dict[str, CachePolicy] = {
+    # Ratios and quarterly numbers change at most daily
+    "fetch_screener": CachePolicy(ttl=timedelta(hours=6), key_fields=("stock_ticker",), date_bucket="%Y-%m-%d"),
+    # Daily candles: the latest one moves intraday, so keep the TTL short
+    "fetch_technicals": CachePolicy(ttl=timedelta(minutes=30), key_fields=("stock_ticker",), date_bucket="%Y-%m-%d",
+                                    is_valid=_chart_exists),
+    "fetch_stock_news": CachePolicy(ttl=timedelta(minutes=20), key_fields=("stock_ticker",)),
+    # Market news does not depend on the stock, so every analysis shares one entry
+    "fetch_market_news": CachePolicy(ttl=timedelta(minutes=30)),
+}
+
+
+class _MemoryCache:
+    """Thread-safe LRU of (expires_at, output)."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, Tuple[float, Dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, expires_at: float, output: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (expires_at, output)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_memory = _MemoryCache(MEMORY_CACHE_SIZE)
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _count(name: str, outcome: str):
+    counters = _stats.setdefault(name, {"memory_hits": 0, "db_hits": 0, "misses": 0})
+    counters[outcome] += 1
+    CACHE_LOOKUPS.inc(cache=name, result=outcome[:-1])   # memory_hit, db_hit or miss
+
+def node_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counters per node since startup."""
+    return {name: dict(counters) for name, counters in _stats.items()}
+
+def policy_for(name: str) -> Optional[CachePolicy]:
+    """The node's policy, or None if it is not cached (no policy, opted out, or caching off)."""
+    policy = NODE_CACHE_POLICIES.get(name)
+    if not NODE_CACHE_ENABLED or policy is None or not policy.enabled or name in NODE_CACHE_DISABLED:
+        return None
+    return policy
+
+def cache_key(name: str, policy: CachePolicy, state: Dict[str, Any]) -> Optional[str]:
+    """Key for a node run, or None if a key field is missing from the state."""
+    parts = [name]
+    for field in policy.key_fields:
+        value = state.get(field)
+        if value is None:
+            return None
+        parts.append(str(value).upper())
+    if policy.date_bucket:
+        parts.append(datetime.now(IST).strftime(policy.date_bucket))
+    return "|".join(parts)
+
+def _is_cacheable(output: Dict[str, Any]) -> bool:
+    """Errors and deadline fallbacks are not cached."""
+    if output.get("missing_sections"):
+        return False
+    return not any(isinstance(value, dict) and value.get("error") for value in output.values())
+
+async def lookup(name: str, state: Dict[str, Any], count: bool = True) -> Optional[Dict[str, Any]]:
+    """A fresh cached output for this node and state, if there is one."""
+    policy = policy_for(name)
+    key = cache_key(name, policy, state) if policy else None
+    if key is None:
+        return None
+    outcome, output = "memory_hits", _memory.get(key)
+    if output is None:
+        row = await run_db(load_node_result, key)
+        if row is not None:
+            output, expires_at = row
+            _memory.put(key, expires_at, output)
+            outcome = "db_hits"
+    if output is not None and policy.is_valid and not policy.is_valid(output):
+        output = None
+    if count:
+        _count(name, outcome if output is not None else "misses")
+    # Callers get their own copy; the cached one is shared by every later run.
+    return copy.deepcopy(output) if output is not None else None
+
+async def is_cached(name: str, state: Dict[str, Any]) -> bool:
+    """Whether the node would be served from cache for this state (does not count as a hit)."""
+    return await lookup(name, state, count=False) is not None
+
+async def store(name: str, state: Dict[str, Any], output: Dict[str, Any]):
+    policy = policy_for(name)
+    key = cache_key(name, policy, state) if policy else None
+    if key is None or not _is_cacheable(output):
+        return
+    expires_at = time.time() + policy.ttl.total_seconds()
+    _memory.put(key, expires_at, copy.deepcopy(output))
+    await run_db(store_node_result, key, name, output, expires_at)
+
+def memoized(name: str, node: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]:
+    """
+    Wraps an async graph node with the cache policy registered under `name`.
+    Nodes without a policy (or opted out) are returned unchanged, so it is safe to
+    wrap every node when building the StateGraph.
+    """
+    if policy_for(name) is None:
+        return node
+
+    async def run_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        cached = await lookup(name, state)
+        if cached is not None:
+            print(f"Node '{name}' served from cache.")
+            return cached
+        output = await node(state)
+        await store(name, state, output)
+        return output
+    run_node.__name__ = getattr(node, "__name__", name)
+    return run_node
@@ -0,0 +1,131 @@
+# In stock_analyzer/profiler.py
+#
+# On-demand sampling CPU profiler. An admin arms it for the next N analyses; while
+# any of them is running, a background thread samples every thread's stack (chart
+# drawing, PDF building and HTML parsing run in worker threads, not on the loop) and
+# the result is written as folded stacks, the input format of flamegraph.pl and
+# speedscope. Idle threads (blocked in wait/select/queue get) are skipped.
+# Samples cover the whole process, so analyses running alongside the profiled ones
+# show up too.
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# --- Configuration ---
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+MAX_ANALYSES = 20
+_IDLE_LEAVES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"), ("thread.py", "_worker")}
+
+
+class _Capture:
+    """One armed profile: samples while its analyses run, then writes the folded stacks."""
+
+    def __init__(self, analyses: int):
+        self.analyses = analyses
+        self.started = 0
+        self.finished = 0
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.path = os.path.join(PROFILE_DIR, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+        self._active = 0
+        self._wake = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(target=self._sample, name="cpu-profiler", daemon=True)
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._done:
+            self._wake.wait()
+            if self._done:
+                break
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                if leaf in _IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+                self.sample_count += 1
+            time.sleep(SAMPLE_INTERVAL)
+        self._write()  # Here rather than in analysis_finished, which runs on the event loop
+
+    def analysis_started(self) -> bool:
+        """Counts the analysis in if the capture still wants one; starts sampling on the first."""
+        if self.started >= self.analyses:
+            return False
+        self.started += 1
+        self._active += 1
+        if not self._thread.is_alive():
+            self._thread.start()
+        self._wake.set()
+        return True
+
+    def analysis_finished(self) -> bool:
+        """Returns True once the last profiled analysis has finished; the sampler then writes the profile."""
+        self.finished += 1
+        self._active -= 1
+        if self._active == 0:
+            self._wake.clear()  # Only sample while a profiled analysis is running
+        if self.finished < self.analyses:
+            return False
+        self._done = True
+        self._wake.set()
+        return True
+
+    def _write(self):
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as profile_file:
+                for stack, count in self.samples.most_common():
+                    profile_file.write(f"{stack} {count}\n")
+        except OSError as e:
+            print(f"Could not write CPU profile {self.path}: {e}")
+            return
+        print(f"CPU profile of {self.analyses} analyses written to {self.path} ({self.sample_count} samples).")
+
+    def status(self) -> Dict[str, Any]:
+        return {"analyses": self.analyses, "started": self.started, "finished": self.finished,
+                "samples": self.sample_count, "path": self.path}
+
+
+_capture: Optional[_Capture] = None
+_last_path: Optional[str] = None
+
+
+def request_capture(analyses: int) -> Dict[str, Any]:
+    """Arms the profiler for the next `analyses` analyses (replacing a capture that has not started)."""
+    global _capture
+    if _capture is not None and _capture.started:
+        raise RuntimeError("A profile capture is already running.")
+    _capture = _Capture(max(1, min(analyses, MAX_ANALYSES)))
+    print(f"CPU profiling armed for the next {_capture.analyses} analyses.")
+    return _capture.status()
+
+def capture_status() -> Dict[str, Any]:
+    return {"capturing": _capture.status() if _capture else None, "last_profile": _last_path}
+
+def analysis_started() -> bool:
+    """Called as each analysis starts; True if this one is being profiled."""
+    return _capture is not None and _capture.analysis_started()
+
+def analysis_finished():
+    """Called as a profiled analysis ends."""
+    global _capture, _last_path
+    if _capture is not None and _capture.analysis_finished():
+        _last_path = _capture.path
+        _capture = None
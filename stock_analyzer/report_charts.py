@@ -0,0 +1,233 @@
+# In stock_analyzer/report_charts.py
+#
+# Charts for the PDF report.
+#
+# The technical chart is rendered once by the technicals node. Its PNG is kept in
+# memory here, already downsampled for print, so the PDF embeds it without reading
+# the file back. The fundamentals charts (quarterly sales/profit and shareholding
+# trend) are reportlab vector drawings, not images: a few KB each at any zoom. They
+# are built once per (ticker, latest quarter) and cached, since the numbers only
+# change when a new quarter is reported.
+
+import copy
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from stock_analyzer.lazy import lazy_module
+
+PILImage = lazy_module("PIL.Image")
+shapes = lazy_module("reportlab.graphics.shapes")
+barcharts = lazy_module("reportlab.graphics.charts.barcharts")
+linecharts = lazy_module("reportlab.graphics.charts.linecharts")
+legends = lazy_module("reportlab.graphics.charts.legends")
+markers = lazy_module("reportlab.graphics.widgets.markers")
+
+# --- Configuration ---
+CHART_PRINT_WIDTH_PX = 975        # 6.5in of page width at 150 dpi; wider images only add bytes
+CHART_PALETTE_COLORS = 128        # Charts are flat colours; a palette PNG is a fraction of the RGBA size
+MAX_CACHED_CHARTS = 64
+QUARTERS_SHOWN = 8
+DRAWING_WIDTH, DRAWING_HEIGHT = 468, 200   # Points: the 6.5in text width of the report
+
+_SALES_METRICS = ("sales", "revenue")
+_PROFIT_METRICS = ("netprofit",)
+_HOLDER_NAMES = {"promoters": "Promoters", "fiis": "FIIs", "diis": "DIIs", "government": "Government", "public": "Public"}
+
+
+class _LRU:
+    """Small thread-safe LRU; report builds run in worker threads."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_technical_charts = _LRU(MAX_CACHED_CHARTS)   # chart_path -> (file mtime_ns, (png, width_px, height_px))
+_fundamental_charts = _LRU(MAX_CACHED_CHARTS)  # (kind, ticker, latest quarter) -> Drawing
+
+
+# --- Technical chart (raster, rendered by the technicals node) ---
+
+def downsample_png(png: bytes, max_width: int = CHART_PRINT_WIDTH_PX) -> Tuple[bytes, int, int]:
+    """The image scaled down to max_width and palette-quantized, with its pixel size."""
+    with PILImage.open(io.BytesIO(png)) as image:
+        image.load()
+        if image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), PILImage.LANCZOS)
+        image = image.convert("RGB").quantize(colors=CHART_PALETTE_COLORS)
+        out = io.BytesIO()
+        image.save(out, format="PNG", optimize=True)
+        smaller = out.getvalue()
+        return (smaller if len(smaller) < len(png) else png), image.width, image.height
+
+def remember_chart(chart_path: str, png: bytes, mtime_ns: int):
+    """Called where the chart is rendered; keeps the print-size copy of that version of the file for the PDF."""
+    try:
+        _technical_charts.put(chart_path, (mtime_ns, downsample_png(png)))
+    except Exception as e:
+        print(f"Could not keep chart {chart_path} for the PDF: {e}")
+
+def technical_chart(chart_path: Optional[str]) -> Optional[Tuple[bytes, int, int]]:
+    """
+    The print-size PNG for a rendered chart. The file is re-read when it is newer than the
+    cached copy (re-rendered by another run or worker), or when this process never rendered it.
+    """
+    if not chart_path:
+        return None
+    cached = _technical_charts.get(chart_path)
+    try:
+        mtime_ns = os.stat(chart_path).st_mtime_ns
+    except OSError:
+        return cached[1] if cached else None
+    if cached is None or cached[0] != mtime_ns:
+        try:
+            with open(chart_path, "rb") as f:
+                remember_chart(chart_path, f.read(), mtime_ns)
+        except OSError:
+            return None
+        cached = _technical_charts.get(chart_path)
+    return cached[1] if cached else None
+
+
+# --- Fundamentals charts (vector, built from the Screener tables) ---
+
+def _metric_key(name: str) -> str:
+    return re.sub(r"[^a-z]", "", name.lower())
+
+def _to_number(value: Any) -> Optional[float]:
+    try:
+        return float(re.sub(r"[^0-9.\-]", "", str(value)))
+    except ValueError:
+        return None
+
+def _series(table: Dict[str, Any], names: Sequence[str]) -> Dict[str, List[Optional[float]]]:
+    """The last QUARTERS_SHOWN values of each row whose metric is in names, as numbers."""
+    found = {}
+    for row in table.get("rows", []):
+        key = _metric_key(row.get("metric", ""))
+        if key in names and key not in found:
+            found[key] = [_to_number(value) for value in row.get("values", [])][-QUARTERS_SHOWN:]
+    return found
+
+def _cache_key(kind: str, ticker: str, table: Dict[str, Any]) -> Optional[Tuple[str, str, str]]:
+    headers = table.get("headers") or []
+    return (kind, ticker.upper(), headers[-1]) if headers else None
+
+def _titled_drawing(title: str, title_color) -> Any:
+    drawing = shapes.Drawing(DRAWING_WIDTH, DRAWING_HEIGHT)
+    drawing.add(shapes.String(0, DRAWING_HEIGHT - 12, title, fontName="Helvetica-Bold", fontSize=10, fillColor=title_color))
+    drawing.hAlign = "CENTER"
+    return drawing
+
+def _legend(drawing, pairs, x: float):
+    legend = legends.Legend()
+    legend.x, legend.y = x, DRAWING_HEIGHT - 4
+    legend.boxAnchor = "ne"
+    legend.alignment = "right"
+    legend.columnMaximum = 1
+    legend.deltax = 70
+    legend.dx = legend.dy = 6
+    legend.fontSize = 7
+    legend.colorNamePairs = pairs
+    drawing.add(legend)
+
+def _build_quarterly_chart(table: Dict[str, Any], palette: Sequence) -> Optional[Any]:
+    series = _series(table, _SALES_METRICS + _PROFIT_METRICS)
+    sales = next((series[name] for name in _SALES_METRICS if name in series), None)
+    profit = series.get(_PROFIT_METRICS[0])
+    if not sales or not profit:
+        return None
+    quarters = (table.get("headers") or [])[-len(sales):]
+    drawing = _titled_drawing("Quarterly Sales and Net Profit (Rs. Cr.)", palette[0])
+    chart = barcharts.VerticalBarChart()
+    chart.x, chart.y, chart.width, chart.height = 45, 30, DRAWING_WIDTH - 55, DRAWING_HEIGHT - 60
+    chart.data = [[value or 0 for value in sales], [value or 0 for value in profit[-len(sales):]]]
+    chart.categoryAxis.categoryNames = quarters
+    chart.categoryAxis.labels.fontSize = 7
+    chart.categoryAxis.labels.angle = 30
+    chart.categoryAxis.labels.boxAnchor = "ne"
+    chart.valueAxis.labels.fontSize = 7
+    chart.valueAxis.valueMin = min(0, *chart.data[0], *chart.data[1])
+    chart.barSpacing = 1
+    chart.groupSpacing = 8
+    chart.bars[0].fillColor, chart.bars[1].fillColor = palette[0], palette[1]
+    chart.bars.strokeColor = None
+    drawing.add(chart)
+    _legend(drawing, [(palette[0], "Sales"), (palette[1], "Net Profit")], DRAWING_WIDTH)
+    return drawing
+
+def _build_shareholding_chart(table: Dict[str, Any], palette: Sequence) -> Optional[Any]:
+    series = _series(table, tuple(_HOLDER_NAMES))
+    # Holders with a gap in the data are left out rather than drawn as a drop to zero
+    holders = [(name, values) for name, values in series.items() if values and None not in values]
+    if not holders:
+        return None
+    count = min(len(values) for _, values in holders)
+    quarters = (table.get("headers") or [])[-count:]
+    drawing = _titled_drawing("Shareholding Pattern (%)", palette[0])
+    chart = linecharts.HorizontalLineChart()
+    chart.x, chart.y, chart.width, chart.height = 45, 30, DRAWING_WIDTH - 55, DRAWING_HEIGHT - 60
+    chart.data = [values[-count:] for _, values in holders]
+    chart.joinedLines = 1
+    chart.categoryAxis.categoryNames = quarters
+    chart.categoryAxis.labels.fontSize = 7
+    chart.categoryAxis.labels.angle = 30
+    chart.categoryAxis.labels.boxAnchor = "ne"
+    chart.valueAxis.valueMin, chart.valueAxis.valueMax, chart.valueAxis.valueStep = 0, 100, 20
+    chart.valueAxis.labels.fontSize = 7
+    pairs = []
+    for i, (name, _) in enumerate(holders):
+        color = palette[i % len(palette)]
+        chart.lines[i].strokeColor = color
+        chart.lines[i].strokeWidth = 1.5
+        chart.lines[i].symbol = markers.makeMarker("FilledCircle", size=3, fillColor=color)
+        pairs.append((color, _HOLDER_NAMES[name]))
+    drawing.add(chart)
+    _legend(drawing, pairs, DRAWING_WIDTH)
+    return drawing
+
+_BUILDERS = {"quarterly": ("quarterly_results", _build_quarterly_chart),
+             "shareholding": ("shareholding_pattern", _build_shareholding_chart)}
+
+def fundamentals_charts(ticker: str, screener_data: Dict[str, Any], palette: Sequence) -> List[Any]:
+    """
+    Drawings for the quarterly results and shareholding tables that have enough data.
+    Each report gets its own shallow copy, as with the report template's flowables.
+    """
+    drawings = []
+    for kind, (field, build) in _BUILDERS.items():
+        table = screener_data.get(field) or {}
+        key = _cache_key(kind, ticker or "", table)
+        if key is None:
+            continue
+        drawing = _fundamental_charts.get(key)
+        if drawing is None:
+            try:
+                drawing = build(table, palette)
+            except Exception as e:
+                print(f"Could not build the {kind} chart for {ticker}: {e}")
+                continue
+            if drawing is None:
+                continue
+            _fundamental_charts.put(key, drawing)
+        drawings.append(copy.copy(drawing))
+    return drawings
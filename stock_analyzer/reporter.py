@@ -1,41 +1,42 @@
-import os
 import json
-from typing import Dict, Any
-from dotenv import load_dotenv
-import google.generativeai as genai
+from typing import Dict, Any, Optional
 
-load_dotenv()
+from stock_analyzer import llm
 
-try:
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-    MODEL = genai.GenerativeModel('gemini-1.5-flash-latest')
-    print("Gemini API configured successfully.")
-except Exception as e:
-    MODEL = None
-    print(f"CRITICAL WARNING: Gemini API key not found or invalid. Reporter will fail. {e}")
 
 def _format_data_for_prompt(data: Any, indent=2) -> str:
     if not data:
         return "Not available."
     return json.dumps(data, indent=indent)
 
-def generate_report(state: Dict[str, Any]) -> Dict[str, str]:
-    print("---NODE: Generating Final Report (with real Gemini API call)---")
-
-    if not MODEL:
+def _report_precheck(state: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """The final_report to return without calling Gemini, if the report cannot be generated."""
+    if not llm.get_model(llm.REPORT_MODEL):
         return {"final_report": "Report generation failed: The Gemini API is not configured."}
 
+    company_name = state.get("company_name", "the company")
+    screener_data = state.get("screener_data")
+    missing_sections = state.get("missing_sections") or []
+    
+    if (not screener_data and "fundamentals" not in missing_sections) or (screener_data or {}).get("error"):
+        return {"final_report": f"Could not generate a report for {company_name} due to missing fundamental data."}
+    return None
+
+def _report_prompt(state: Dict[str, Any]) -> str:
     company_name = state.get("company_name", "the company")
     stock_ticker = state.get("stock_ticker", "N/A")
     screener_data = state.get("screener_data")
     technical_analysis = state.get("technical_analysis")
     news_articles = state.get("news_articles")
     market_context_articles = state.get("market_context_articles")
+    missing_sections = state.get("missing_sections") or []
     
-    if not screener_data or screener_data.get("error"):
-        return {"final_report": f"Could not generate a report for {company_name} due to missing fundamental data."}
+    missing_note = ""
+    if missing_sections:
+        missing_note = (f"\n    - **Unavailable (timed out):** {', '.join(missing_sections)}. Keep the matching headings but write "
+                        f"`<i>Data unavailable: the source did not respond in time.</i>` under them instead of analysis.")
 
-    prompt = f"""
+    return f"""
     You are EquiSage, an expert AI stock market analyst for the Indian market.
     Your task is to generate a well-structured report for **{company_name} ({stock_ticker})**.
 
@@ -49,9 +50,9 @@ def generate_report(state: Dict[str, Any]) -> Dict[str, str]:
 
     **DATA FOR ANALYSIS:**
     - Fundamental Data: {_format_data_for_prompt(screener_data)}
-    - Technical Summary: {_format_data_for_prompt(technical_analysis.get('summary'))}
+    - Technical Summary: {_format_data_for_prompt((technical_analysis or {}).get('summary'))}
     - Company News: {_format_data_for_prompt(news_articles)}
-    - Market Context: {_format_data_for_prompt(market_context_articles)}
+    - Market Context: {_format_data_for_prompt(market_context_articles)}{missing_note}
 
     ---
     **REQUIRED OUTPUT STRUCTURE (FOLLOW THIS TEMPLATE EXACTLY):**
@@ -78,14 +79,58 @@ def generate_report(state: Dict[str, Any]) -> Dict[str, str]:
     <i>Disclaimer: AI-generated analysis. Not financial advice. DYOR.</i>
     """
 
+async def agenerate_report(state: Dict[str, Any]) -> Dict[str, str]:
+    print("---NODE: Generating Final Report---")
+
+    if (early := _report_precheck(state)) is not None:
+        return early
+    company_name = state.get("company_name", "the company")
+
     try:
         print("Sending strict HTML-formatted request to Gemini API...")
-        response = MODEL.generate_content(prompt)
-        final_report = response.text
+        final_report = await llm.generate("generate_report", _report_prompt(state), model=llm.REPORT_MODEL, priority=llm.PRIORITY_REPORT)
         print("Successfully received report from Gemini.")
         
     except Exception as e:
         print(f"An error occurred while calling the Gemini API: {e}")
         final_report = f"Failed to generate the AI-powered analysis for {company_name}. An API error occurred."
 
-    return {"final_report": final_report}
\ No newline at end of file
+    return {"final_report": final_report}
+
+def _key_ratio_lines(key_ratios: Dict[str, Any]) -> list:
+    return [f"📈 <b>{name}:</b> {value}" for name, value in key_ratios.items()]
+
+def build_key_ratios_card(state: Dict[str, Any]) -> str:
+    """A short card of the Screener key ratios, sent as soon as they are fetched."""
+    company_name = state.get("company_name") or state.get("stock_ticker", "the company")
+    key_ratios = (state.get("screener_data") or {}).get("key_ratios") or {}
+    lines = [f"<b>📋 {company_name} ({state.get('stock_ticker', 'N/A')}) at a glance</b>", ""]
+    lines += _key_ratio_lines(key_ratios)
+    lines += ["", "<i>Full analysis on the way...</i>"]
+    return "\n".join(lines)
+
+def build_fallback_report(state: Dict[str, Any]) -> str:
+    """A plain report from the fetched data, sent when the AI write-up misses its deadline."""
+    company_name = state.get("company_name") or state.get("stock_ticker", "the company")
+    lines = [f"<b>📊 EquiSage Snapshot: {company_name}</b>", "--------------------------------------",
+             "<i>The full AI analysis took too long, so here are the key numbers.</i>", ""]
+    key_ratios = (state.get("screener_data") or {}).get("key_ratios") or {}
+    if key_ratios:
+        lines.append("<b>Key Ratios</b>")
+        lines += _key_ratio_lines(key_ratios)
+        lines.append("")
+    summary = (state.get("technical_analysis") or {}).get("summary") or {}
+    if summary:
+        lines.append("<b>Technical Outlook</b>")
+        lines += [f"📉 <b>{name}:</b> {value}" for name, value in summary.items()]
+        lines.append("")
+    headlines = state.get("news_articles") or []
+    if headlines:
+        lines.append("<b>Recent Headlines</b>")
+        lines += [f"📰 {article['title']}" for article in headlines[:5]]
+        lines.append("")
+    missing = list(state.get("missing_sections") or [])
+    if missing:
+        lines.append(f"<i>Unavailable (timed out): {', '.join(missing)}.</i>")
+    lines.append("<i>Disclaimer: AI-generated analysis. Not financial advice. DYOR.</i>")
+    return "\n".join(lines)
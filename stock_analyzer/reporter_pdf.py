@@ -1,43 +1,67 @@
 # In stock_analyzer/reporter_pdf.py
+#
+# Pulls in reportlab, so graph.py imports this module on first use rather than at startup.
+#
+# Everything in a report that does not depend on its content (style sheet, fixed
+# headings, table style) lives in one ReportTemplate built per process; a report only
+# adds its own paragraphs. The page header and footer are drawn once per document as
+# a form XObject and referenced from every page, with only the page number drawn per page.
 
+import io
 import os
+import copy
 import json
+import asyncio
+import tempfile
+import threading
 from datetime import datetime
-from typing import Dict, Any, List
-from dotenv import load_dotenv
-import google.generativeai as genai
+from typing import Dict, Any, List, Optional
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib.colors import HexColor, black, white
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
+from reportlab.platypus.flowables import Flowable
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
-import matplotlib
-matplotlib.use('Agg')
 
-load_dotenv()
+from stock_analyzer import llm, report_charts
+
 REPORTS_DIR = "reports"
-os.makedirs(REPORTS_DIR, exist_ok=True)
+CONTENT_WIDTH = letter[0] - 2 * inch
+HEADER_FORM = "EquiSagePageFrame"
 
-try:
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-    MODEL = genai.GenerativeModel('gemini-1.5-flash-latest')
-except Exception as e:
-    MODEL = None
-    print(f"Warning: Gemini API not configured for PDF reporter: {e}")
+COLORS = {
+    'primary': HexColor('#1f4e79'),
+    'secondary': HexColor('#2e75b6'),
+    'success': HexColor('#28a745'),
+    'danger': HexColor('#dc3545'),
+    'warning': HexColor('#ffc107'),
+    'light_grey': HexColor('#f8f9fa'),
+    'dark_grey': HexColor('#6c757d')
+}
+ANALYSIS_SECTIONS = [("Fundamental Analysis", "fundamental_analysis"), ("Technical Outlook", "technical_outlook"), ("Risk Factors", "risk_factors"), ("Growth Catalysts", "growth_catalysts"), ("Valuation Summary", "valuation_summary")]
+FIXED_HEADINGS = ["Executive Summary", "Key Financial Metrics", "Financial Trends", "Recent News Summary"] + [title for title, _ in ANALYSIS_SECTIONS]
+
+
+class ReportTemplate:
+    """
+    The content-independent parts of a report, built once: parsing styles and fixed
+    paragraphs is most of the per-report cost the content does not need to pay.
+    Flowables are handed out as shallow copies, because reportlab stores layout
+    results on the flowable while a document is being built.
+    """
 
-class ProfessionalReportGenerator:
     def __init__(self):
-        self.colors = {
-            'primary': HexColor('#1f4e79'),
-            'secondary': HexColor('#2e75b6'),
-            'success': HexColor('#28a745'),
-            'danger': HexColor('#dc3545'),
-            'warning': HexColor('#ffc107'),
-            'light_grey': HexColor('#f8f9fa'),
-            'dark_grey': HexColor('#6c757d')
-        }
+        self.colors = COLORS
         self.styles = self._create_styles()
+        self.recommendation_styles = {
+            name: ParagraphStyle(name=f'Recommendation_{name}', parent=self.styles['h3'], textColor=self.colors[name], alignment=TA_CENTER)
+            for name in ('success', 'danger', 'warning')
+        }
+        self.metrics_table_style = TableStyle([('VALIGN', (0,0), (-1,-1), 'MIDDLE'), ('GRID', (0,0), (-1,-1), 0.5, self.colors['dark_grey']), ('BACKGROUND', (0,0), (-1,-1), self.colors['light_grey']), ('LEFTPADDING', (0,0), (-1,-1), 10),('RIGHTPADDING', (0,0), (-1,-1), 10)])
+        self.chart_palette = [self.colors[name] for name in ('primary', 'secondary', 'success', 'warning', 'danger', 'dark_grey')]
+        self._title = Paragraph("Equity Research Report", self.styles['CustomTitle'])
+        self._headings = {title: Paragraph(title, self.styles['SectionHeader']) for title in FIXED_HEADINGS}
 
     def _create_styles(self):
         styles = getSampleStyleSheet()
@@ -50,7 +74,14 @@ class ProfessionalReportGenerator:
         styles.add(ParagraphStyle(name='NewsMeta', parent=styles['Normal'], fontSize=8, textColor=self.colors['dark_grey']))
         return styles
 
-    def _create_header_footer(self, canvas, doc):
+    def title(self) -> Flowable:
+        return copy.copy(self._title)
+
+    def heading(self, title: str) -> Flowable:
+        return copy.copy(self._headings[title])
+
+    def draw_page_frame(self, canvas):
+        """The parts of the header and footer that are the same on every page."""
         canvas.saveState()
         canvas.setFillColor(self.colors['primary'])
         canvas.rect(0, letter[1] - 40, letter[0], 40, fill=1, stroke=0)
@@ -61,17 +92,68 @@ class ProfessionalReportGenerator:
         canvas.drawRightString(letter[0] - inch, letter[1] - 25, f"Generated: {datetime.now().strftime('%B %d, %Y')}")
         canvas.setFillColor(self.colors['dark_grey'])
         canvas.setFont('Helvetica', 8)
-        canvas.drawRightString(letter[0] - inch, 0.5 * inch, f"Page {doc.page}")
         canvas.drawString(inch, 0.5*inch, "This report is generated by EquiSage AI. Not financial advice.")
         canvas.restoreState()
 
-    def _generate_enhanced_analysis(self, state: Dict[str, Any]) -> Dict[str, str]:
-        if not MODEL:
-            return self._fallback_analysis(state)
+    def draw_page_number(self, canvas, doc):
+        canvas.saveState()
+        canvas.setFillColor(self.colors['dark_grey'])
+        canvas.setFont('Helvetica', 8)
+        canvas.drawRightString(letter[0] - inch, 0.5 * inch, f"Page {doc.page}")
+        canvas.restoreState()
+
+
+class _PageDecorator:
+    """onPage callback for one document: defines the page frame form on the first page and reuses it after."""
+
+    def __init__(self, template: ReportTemplate, use_form: bool = True):
+        self.template = template
+        self.use_form = use_form
+        self._form_defined = False
+
+    def __call__(self, canvas, doc):
+        if not self.use_form:
+            self.template.draw_page_frame(canvas)
+        else:
+            if not self._form_defined:
+                canvas.beginForm(HEADER_FORM)
+                self.template.draw_page_frame(canvas)
+                canvas.endForm()
+                self._form_defined = True
+            canvas.doForm(HEADER_FORM)
+        self.template.draw_page_number(canvas, doc)
 
+
+_template: Optional[ReportTemplate] = None
+_template_lock = threading.Lock()
+
+def report_template() -> ReportTemplate:
+    """The process-wide template, built on first use."""
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                _template = ReportTemplate()
+    return _template
+
+
+class ProfessionalReportGenerator:
+    """
+    Builds reports from the shared template. Holds no per-report state, so one
+    instance serves every thread. `header_form=False` draws the page frame directly on
+    each page (only used to compare against the form in benchmarks).
+    """
+
+    def __init__(self, template: Optional[ReportTemplate] = None, header_form: bool = True):
+        self.template = template or report_template()
+        self.colors = self.template.colors
+        self.styles = self.template.styles
+        self.header_form = header_form
+
+    def _analysis_prompt(self, state: Dict[str, Any]) -> str:
         company_name = state.get("company_name", "the company")
         
-        prompt = f"""
+        return f"""
         You are a sharp, insightful senior equity research analyst. Your task is to draft a professional, one-page executive briefing on **{company_name}**.
         Your analysis MUST be based ONLY on the data provided below. Your response must be a single, clean JSON object.
 
@@ -94,14 +176,19 @@ class ProfessionalReportGenerator:
 
         Respond with ONLY the JSON object.
         """
-        
+
+    def _parse_analysis(self, response_text: str) -> Dict[str, str]:
+        analysis = json.loads(response_text.strip().replace('```json', '').replace('```', '').strip())
+        print("Successfully parsed enhanced analysis.")
+        return analysis
+
+    async def _agenerate_enhanced_analysis(self, state: Dict[str, Any]) -> Dict[str, str]:
+        if not llm.get_model(llm.REPORT_MODEL):
+            return self._fallback_analysis(state)
         try:
             print("Generating enhanced PDF analysis with new prompt...")
-            response = MODEL.generate_content(prompt)
-            response_text = response.text.strip().replace('```json', '').replace('```', '').strip()
-            analysis = json.loads(response_text)
-            print("Successfully parsed enhanced analysis.")
-            return analysis
+            text = await llm.generate("pdf_analysis", self._analysis_prompt(state), model=llm.REPORT_MODEL, priority=llm.PRIORITY_REPORT)
+            return self._parse_analysis(text)
         except Exception as e:
             print(f"Error in enhanced analysis, using fallback: {e}")
             return self._fallback_analysis(state)
@@ -117,40 +204,56 @@ class ProfessionalReportGenerator:
             "valuation_summary": "Current valuation appears reasonable."
         }
     
-    def generate_pdf_report(self, state: Dict[str, Any]) -> Dict[str, str]:
+    async def agenerate_pdf_report(self, state: Dict[str, Any]) -> Dict[str, str]:
+        """The Gemini call runs on the event loop, the CPU-bound PDF build in a thread."""
         print("---Generating Professional PDF Report---")
+        analysis = await self._agenerate_enhanced_analysis(state)
+        return await asyncio.to_thread(self.build_pdf, state, analysis)
+
+    def _technical_chart(self, state: Dict[str, Any]) -> Optional[Flowable]:
+        """The chart the technicals node already rendered, embedded at print size."""
+        chart = report_charts.technical_chart((state.get("technical_analysis") or {}).get("chart_path"))
+        if chart is None:
+            return None
+        png, width_px, height_px = chart
+        return Image(io.BytesIO(png), width=CONTENT_WIDTH, height=CONTENT_WIDTH * height_px / width_px)
+
+    def build_pdf(self, state: Dict[str, Any], analysis: Dict[str, Any], output_dir: str = REPORTS_DIR) -> Dict[str, str]:
+        pdf_path = None
         try:
+            template = self.template
             company_name = state.get("company_name", "Unknown Company")
             stock_ticker = state.get("stock_ticker", "N/A")
             
-            analysis = self._generate_enhanced_analysis(state)
-            
             safe_name = "".join(c for c in company_name if c.isalnum()).rstrip()
+            # The dated name is only what Telegram shows; on disk each run gets its own
+            # file, so concurrent reports on the same company never overwrite each other.
             pdf_filename = f"EquiSage_Report_{safe_name}_{datetime.now().strftime('%Y%m%d')}.pdf"
-            pdf_path = os.path.join(REPORTS_DIR, pdf_filename)
+            os.makedirs(output_dir, exist_ok=True)
+            fd, pdf_path = tempfile.mkstemp(prefix=f"EquiSage_Report_{safe_name}_", suffix=".pdf", dir=output_dir)
+            os.close(fd)
             
             doc = SimpleDocTemplate(pdf_path, pagesize=letter, rightMargin=inch, leftMargin=inch, topMargin=inch, bottomMargin=inch)
             
             story = []
             
-            story.append(Paragraph(f"Equity Research Report", self.styles['CustomTitle']))
+            story.append(template.title())
             story.append(Paragraph(company_name, self.styles['SubTitle']))
             story.append(Spacer(1, 6))
             story.append(Paragraph(f"Ticker: {stock_ticker}", self.styles['Normal']))
             story.append(Spacer(1, 24))
 
-            story.append(Paragraph("Executive Summary", self.styles['SectionHeader']))
+            story.append(template.heading("Executive Summary"))
             story.append(Paragraph(analysis.get('executive_summary', 'N/A'), self.styles['ExecutiveSummary']))
             
             rec_text = analysis.get('investment_recommendation', 'HOLD')
-            rec_color = self.colors['success'] if 'BUY' in rec_text.upper() else self.colors['danger'] if 'SELL' in rec_text.upper() else self.colors['warning']
-            rec_style = ParagraphStyle(name='Recommendation', parent=self.styles['h3'], textColor=rec_color, alignment=TA_CENTER)
+            rec_style = template.recommendation_styles['success' if 'BUY' in rec_text.upper() else 'danger' if 'SELL' in rec_text.upper() else 'warning']
             story.append(Paragraph(f"Investment Recommendation: {rec_text}", rec_style))
             story.append(Spacer(1, 20))
             
             key_ratios = state.get("screener_data", {}).get("key_ratios", {})
             if key_ratios:
-                story.append(Paragraph("Key Financial Metrics", self.styles['SectionHeader']))
+                story.append(template.heading("Key Financial Metrics"))
                 metrics_data = list(key_ratios.items())
                 table_data = []
                 for i in range(0, len(metrics_data), 2):
@@ -165,15 +268,20 @@ class ProfessionalReportGenerator:
                     table_data.append(row)
                 if table_data:
                     metrics_table = Table(table_data, colWidths=[1.7*inch, 1.3*inch, 1.7*inch, 1.3*inch])
-                    metrics_table.setStyle(TableStyle([('VALIGN', (0,0), (-1,-1), 'MIDDLE'), ('GRID', (0,0), (-1,-1), 0.5, self.colors['dark_grey']), ('BACKGROUND', (0,0), (-1,-1), self.colors['light_grey']), ('LEFTPADDING', (0,0), (-1,-1), 10),('RIGHTPADDING', (0,0), (-1,-1), 10)]))
+                    metrics_table.setStyle(template.metrics_table_style)
                     story.append(metrics_table)
                     story.append(Spacer(1, 12))
 
-            # --- THIS IS THE FIX FOR THE ATTRIBUTEERROR ---
-            sections = [("Fundamental Analysis", "fundamental_analysis"), ("Technical Outlook", "technical_outlook"), ("Risk Factors", "risk_factors"), ("Growth Catalysts", "growth_catalysts"), ("Valuation Summary", "valuation_summary")]
-            for title, key in sections:
+            trend_charts = report_charts.fundamentals_charts(stock_ticker, state.get("screener_data") or {}, template.chart_palette)
+            if trend_charts:
+                story.append(template.heading("Financial Trends"))
+                for drawing in trend_charts:
+                    story.append(drawing)
+                    story.append(Spacer(1, 12))
+
+            for title, key in ANALYSIS_SECTIONS:
                 content = analysis.get(key, "Analysis not available.")
-                story.append(Paragraph(title, self.styles['SectionHeader']))
+                story.append(template.heading(title))
 
                 formatted_content = ""
                 if isinstance(content, list):
@@ -189,29 +297,42 @@ class ProfessionalReportGenerator:
                     formatted_content = str(content)
                 
                 story.append(Paragraph(formatted_content, self.styles['NormalJustified']))
-            # --- END OF FIX ---
+                if key == "technical_outlook" and (chart := self._technical_chart(state)):
+                    story.append(Spacer(1, 8))
+                    story.append(chart)
 
             news_articles = state.get("news_articles", [])
             if news_articles:
                 story.append(PageBreak())
-                story.append(Paragraph("Recent News Summary", self.styles['SectionHeader']))
+                story.append(template.heading("Recent News Summary"))
                 for article in news_articles[:5]:
                     story.append(Paragraph(article.get('title', 'No Title'), self.styles['NewsTitle']))
                     story.append(Paragraph(f"<i>Source: {article.get('source', 'N/A')} | Date: {article.get('published_date', 'N/A')}</i>", self.styles['NewsMeta']))
                     story.append(Paragraph(article.get('summary', ''), self.styles['NormalJustified']))
                     story.append(Spacer(1, 6))
 
-            doc.build(story, onFirstPage=self._create_header_footer, onLaterPages=self._create_header_footer)
+            decorate_page = _PageDecorator(template, use_form=self.header_form)
+            doc.build(story, onFirstPage=decorate_page, onLaterPages=decorate_page)
             
             print(f"PDF report generated: {pdf_path}")
             return {"pdf_report_path": pdf_path, "pdf_filename": pdf_filename}
             
         except Exception as e:
             print(f"Error generating PDF report: {e}")
+            if pdf_path and os.path.exists(pdf_path):
+                os.remove(pdf_path)
             import traceback
             traceback.print_exc()
             return {"error": f"PDF generation failed: {str(e)}", "pdf_report_path": None}
 
-def generate_pdf_report(state: Dict[str, Any]) -> Dict[str, Any]:
-    generator = ProfessionalReportGenerator()
-    return generator.generate_pdf_report(state)
\ No newline at end of file
+_generator: Optional[ProfessionalReportGenerator] = None
+
+def report_generator() -> ProfessionalReportGenerator:
+    """The shared generator (stateless, so safe to use from every worker thread)."""
+    global _generator
+    if _generator is None:
+        _generator = ProfessionalReportGenerator()
+    return _generator
+
+async def agenerate_pdf_report(state: Dict[str, Any]) -> Dict[str, Any]:
+    return await report_generator().agenerate_pdf_report(state)
@@ -1,10 +1,21 @@
 # In stock_analyzer/screener.py
 
-import requests
-from bs4 import BeautifulSoup
-from typing import Dict, Any, List
+from __future__ import annotations
+
+import asyncio
+import httpx
+from typing import Dict, Any, List, TYPE_CHECKING
 import pprint
-import time
+
+from stock_analyzer.deadlines import SCREENER_TIMEOUT
+from stock_analyzer.http_client import get_http_client
+from stock_analyzer.lazy import lazy_module
+from stock_analyzer.metrics import track_call
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+bs4 = lazy_module("bs4")
 
 # --- Configuration ---
 BASE_URL = "https://www.screener.in/company/{symbol}/"
@@ -96,10 +107,59 @@ def _parse_shareholding_pattern(soup: BeautifulSoup) -> Dict[str, Any]:
         print(f"Error parsing shareholding pattern: {e}")
     return shareholding
 
-def fetch_screener_data(state: Dict[str, Any]) -> Dict[str, Any]:
+def _parse_classification(soup: BeautifulSoup) -> Dict[str, str]:
+    """Parses the sector/industry links shown above the peer comparison table."""
+    classification = {}
+    try:
+        section = soup.select_one("#peers")
+        if not section: return classification
+        
+        for key, title in (("sector", "Sector"), ("industry", "Industry")):
+            link = section.find("a", attrs={"title": title})
+            if link:
+                classification[key] = link.text.strip()
+    except Exception as e:
+        print(f"Error parsing sector/industry: {e}")
+    return classification
+
+def _parse_screener_page(html: str, url: str, stock_symbol: str) -> Dict[str, Any]:
+    """Turns a Screener.in company page into the node output. CPU-bound; async callers run it in a thread."""
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    
+    # Check if it's a valid page
+    if soup.find("h1", class_="text-center"):
+        print(f"Error: Company '{stock_symbol}' not found on Screener.in")
+        return {"screener_data": {"error": "Company not found"}}
+
+    # Run all our parsers
+    key_ratios = _parse_key_ratios(soup)
+    pros_cons = _parse_pros_and_cons(soup)
+    quarterly_results = _parse_quarterly_results(soup)
+    shareholding_pattern = _parse_shareholding_pattern(soup)
+    classification = _parse_classification(soup)
+    
+    # Combine everything into a single structured dictionary
+    screener_data = {
+        "key_ratios": key_ratios,
+        "analysis": pros_cons,
+        "quarterly_results": quarterly_results,
+        "shareholding_pattern": shareholding_pattern,
+        "source_url": url,
+        **classification
+    }
+    
+    # We also get the company name, a useful side-effect
+    company_name = soup.select_one("h1").text.strip()
+    
+    return {
+        "screener_data": screener_data,
+        "company_name": company_name # Update the state with the proper name
+    }
+
+async def afetch_screener_data(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Fetches comprehensive data for a stock from Screener.in.
-    This is a powerful, all-in-one data collector.
+    The request runs on the event loop, only the HTML parsing uses a thread.
     """
     print("---NODE: Fetching Data from Screener.in---")
     
@@ -113,40 +173,12 @@ def fetch_screener_data(state: Dict[str, Any]) -> Dict[str, Any]:
     print(f"Scraping URL: {url}")
 
     try:
-        response = requests.get(url, headers=HEADERS, timeout=15)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Check if it's a valid page
-        if soup.find("h1", class_="text-center"):
-            print(f"Error: Company '{stock_symbol}' not found on Screener.in")
-            return {"screener_data": {"error": "Company not found"}}
-
-        # Run all our parsers
-        key_ratios = _parse_key_ratios(soup)
-        pros_cons = _parse_pros_and_cons(soup)
-        quarterly_results = _parse_quarterly_results(soup)
-        shareholding_pattern = _parse_shareholding_pattern(soup)
-        
-        # Combine everything into a single structured dictionary
-        screener_data = {
-            "key_ratios": key_ratios,
-            "analysis": pros_cons,
-            "quarterly_results": quarterly_results,
-            "shareholding_pattern": shareholding_pattern,
-            "source_url": url
-        }
-        
-        # We also get the company name, a useful side-effect
-        company_name = soup.select_one("h1").text.strip()
-        
-        return {
-            "screener_data": screener_data,
-            "company_name": company_name # Update the state with the proper name
-        }
+        with track_call("screener"):
+            response = await get_http_client().get(url, headers=HEADERS, timeout=httpx.Timeout(SCREENER_TIMEOUT[1], connect=SCREENER_TIMEOUT[0]))
+            response.raise_for_status()
+        return await asyncio.to_thread(_parse_screener_page, response.text, url, stock_symbol)
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"A network error occurred while fetching from Screener.in: {e}")
         return {"screener_data": {"error": f"Network error: {e}"}}
     except Exception as e:
@@ -155,15 +187,21 @@ def fetch_screener_data(state: Dict[str, Any]) -> Dict[str, Any]:
 
 # --- Self-testing block ---
 if __name__ == '__main__':
-    print("---Testing Screener.in Scraper Module---")
-    
-    test_state_infy = {"stock_ticker": "INFY.NS"}
-    result_infy = fetch_screener_data(test_state_infy)
-    pprint.pprint(result_infy)
-    
-    print("\n" + "="*50 + "\n")
-    time.sleep(2)
+    from stock_analyzer.http_client import close_http_client
+
+    async def _self_test():
+        print("---Testing Screener.in Scraper Module---")
+
+        test_state_infy = {"stock_ticker": "INFY.NS"}
+        result_infy = await afetch_screener_data(test_state_infy)
+        pprint.pprint(result_infy)
+
+        print("\n" + "="*50 + "\n")
+        await asyncio.sleep(2)
+
+        test_state_reliance = {"stock_ticker": "RELIANCE.NS"}
+        result_reliance = await afetch_screener_data(test_state_reliance)
+        pprint.pprint(result_reliance)
+        await close_http_client()
 
-    test_state_reliance = {"stock_ticker": "RELIANCE.NS"}
-    result_reliance = fetch_screener_data(test_state_reliance)
-    pprint.pprint(result_reliance)
\ No newline at end of file
+    asyncio.run(_self_test())
@@ -0,0 +1,88 @@
+# In stock_analyzer/session_sections.py
+
+import json
+import re
+from typing import Any, Dict, List, Tuple
+
+# --- Configuration ---
+# Words that route a follow-up question to a section of the stored analysis.
+# Field names found in the data itself (ratio names, quarterly metrics, holder
+# categories) are added per session, so "what was the OPM %?" finds the quarterly table.
+SECTION_KEYWORDS = {
+    "ratios": ["pe", "p/e", "price", "market cap", "mcap", "valuation", "valued", "roce", "roe", "book value",
+               "dividend", "yield", "face value", "52 week", "high", "low", "ratio", "ratios", "expensive", "cheap"],
+    "pros_cons": ["pros", "cons", "strength", "strengths", "weakness", "weaknesses", "positive", "negative",
+                  "concern", "concerns", "risk", "risks", "red flag"],
+    "quarterly": ["quarter", "quarterly", "results", "sales", "revenue", "profit", "earnings", "eps", "margin",
+                  "margins", "opm", "expenses", "growth", "qoq", "yoy", "income", "tax", "interest", "depreciation"],
+    "shareholding": ["shareholding", "shareholder", "shareholders", "promoter", "promoters", "fii", "fiis", "dii",
+                     "diis", "institutional", "institutions", "public", "holding", "holdings", "stake", "pledge"],
+    "technicals": ["technical", "technicals", "chart", "rsi", "macd", "sma", "moving average", "trend", "support",
+                   "resistance", "overbought", "oversold", "momentum", "bullish", "bearish", "breakout", "crossover"],
+    "news": ["news", "headline", "headlines", "article", "articles", "announcement", "recent", "latest", "event",
+             "events", "update", "updates", "happened"],
+    "market": ["market", "macro", "economy", "economic", "rbi", "inflation", "cpi", "gdp", "sebi", "crude", "oil",
+               "opec", "rupee", "inr", "usd", "rate", "rates", "geopolitical", "war", "sentiment"],
+}
+
+
+def split_session(session_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Splits a stored analysis into addressable sections."""
+    screener_data = session_data.get("screener_data") or {}
+    technical_analysis = session_data.get("technical_analysis") or {}
+    return {
+        "profile": {
+            "company_name": session_data.get("company_name"),
+            "stock_ticker": session_data.get("stock_ticker"),
+            "sector": screener_data.get("sector"),
+            "industry": screener_data.get("industry"),
+        },
+        "ratios": screener_data.get("key_ratios"),
+        "pros_cons": screener_data.get("analysis"),
+        "quarterly": screener_data.get("quarterly_results"),
+        "shareholding": screener_data.get("shareholding_pattern"),
+        "technicals": technical_analysis.get("summary", technical_analysis),
+        "news": session_data.get("news_articles"),
+        "market": session_data.get("market_context_articles"),
+    }
+
+def _field_keywords(sections: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Names of the fields present in this session's tables, lowercased, per section."""
+    fields = {
+        "ratios": list((sections.get("ratios") or {}).keys()),
+        "quarterly": [row.get("metric", "") for row in (sections.get("quarterly") or {}).get("rows", [])],
+        "shareholding": [row.get("metric", "") for row in (sections.get("shareholding") or {}).get("rows", [])],
+        "technicals": list((sections.get("technicals") or {}).keys()),
+    }
+    return {name: [f.lower().strip(" +%") for f in values if f and f.strip(" +%")] for name, values in fields.items()}
+
+def _mentions(question: str, keyword: str) -> bool:
+    return re.search(rf"(?<!\w){re.escape(keyword)}(?!\w)", question) is not None
+
+def select_sections(question: str, sections: Dict[str, Any]) -> List[str]:
+    """
+    Picks the sections a question is about, ranked by keyword hits.
+    A question that matches nothing (e.g. "should I buy it?") gets every section.
+    """
+    question = question.lower()
+    field_keywords = _field_keywords(sections)
+    scores = {}
+    for name in SECTION_KEYWORDS:
+        keywords = SECTION_KEYWORDS[name] + field_keywords.get(name, [])
+        hits = sum(1 for keyword in set(keywords) if _mentions(question, keyword))
+        if hits and sections.get(name):
+            scores[name] = hits
+    if not scores:
+        return [name for name, content in sections.items() if content]
+    return ["profile"] + sorted(scores, key=scores.get, reverse=True)
+
+def build_follow_up_context(session_data: Dict[str, Any], question: str) -> Tuple[str, List[str], int]:
+    """
+    Returns (context, selected section names, size of the full session dump) for a follow-up prompt.
+    The context only contains the sections the question needs.
+    """
+    sections = split_session(session_data)
+    selected = select_sections(question, sections)
+    context = json.dumps({name: sections[name] for name in selected}, indent=2)
+    full_size = len(json.dumps(session_data, indent=2))
+    return context, selected, full_size
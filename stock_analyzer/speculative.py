@@ -0,0 +1,125 @@
+# In stock_analyzer/speculative.py
+#
+# Pipeline mode: the fetches that only need the ticker (price history, ticker news,
+# market news) start the moment the router resolves it, so they run while Screener
+# is still being scraped instead of after it.
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from stock_analyzer.technicals import afetch_technical_data
+from stock_analyzer.news import afetch_ticker_news
+from stock_analyzer.market_news import afetch_market_context_news
+
+# --- Configuration ---
+SPECULATIVE_FETCH = os.getenv("SPECULATIVE_FETCH", "true").lower() == "true"
+SPECULATION_MAX_AGE = 300   # Seconds before an abandoned run (e.g. a crashed graph) is dropped
+
+TECHNICALS, STOCK_NEWS, MARKET_NEWS = "technicals", "stock_news", "market_news"
+
+_runs: Dict[str, "SpeculativeRun"] = {}
+
+
+def _retrieve_exception(task: asyncio.Task):
+    """A fetch nobody collects may still fail; reading its exception keeps asyncio from logging it as never retrieved."""
+    if not task.cancelled():
+        task.exception()
+
+
+class SpeculativeRun:
+    """The in-flight fetches for one analysis, as tasks on the event loop."""
+
+    def __init__(self, stock_ticker: str, skip: Iterable[str] = ()):
+        self.stock_ticker = stock_ticker
+        self.started = time.monotonic()
+        fetches = {
+            TECHNICALS: lambda: afetch_technical_data(stock_ticker),
+            STOCK_NEWS: lambda: afetch_ticker_news(stock_ticker),
+            MARKET_NEWS: lambda: afetch_market_context_news({}),
+        }
+        self.tasks: Dict[str, asyncio.Task] = {
+            name: asyncio.create_task(fetch()) for name, fetch in fetches.items() if name not in skip
+        }
+        for task in self.tasks.values():
+            task.add_done_callback(_retrieve_exception)
+
+    def cancel(self):
+        for task in self.tasks.values():
+            task.cancel()
+
+
+def launch(stock_ticker: str, skip: Iterable[str] = ()) -> str:
+    """
+    Starts the ticker-only fetches (except those in `skip`, e.g. already cached) in the
+    background and returns the id the graph nodes collect them by.
+    """
+    now = time.monotonic()
+    for stale_id in [key for key, value in _runs.items() if now - value.started > SPECULATION_MAX_AGE]:
+        _runs.pop(stale_id).cancel()
+    run_id = uuid.uuid4().hex
+    run = SpeculativeRun(stock_ticker, skip)
+    if run.tasks:
+        _runs[run_id] = run
+    print(f"Speculative fetches started for {stock_ticker}: {', '.join(run.tasks) or 'none needed'}.")
+    return run_id
+
+async def collect(run_id: Optional[str], name: str) -> Optional[Any]:
+    """
+    Waits for one speculative fetch and returns its result, or None if there is no
+    such run or the fetch failed (the caller then fetches normally).
+    """
+    run = _runs.get(run_id) if run_id else None
+    task = run.tasks.pop(name, None) if run else None
+    if run and not run.tasks:
+        del _runs[run_id]
+    if task is None:
+        return None
+    waited = time.monotonic()
+    try:
+        result = await task
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            raise  # The caller itself was cancelled (e.g. its deadline passed), which also cancelled the fetch
+        print(f"Speculative {name} fetch was cancelled, fetching again.")
+        return None
+    except Exception as e:
+        print(f"Speculative {name} fetch failed, fetching again: {e}")
+        return None
+    print(f"Speculative {name} fetch ready (waited {time.monotonic() - waited:.2f}s, "
+          f"{time.monotonic() - run.started:.2f}s after launch).")
+    return result
+
+def cancel(run_id: Optional[str]):
+    """Abandons a run, e.g. when Screener reports the company does not exist."""
+    run = _runs.pop(run_id, None) if run_id else None
+    if run:
+        run.cancel()
+        print(f"Speculative fetches for {run.stock_ticker} cancelled.")
+
+def discard(run_id: Optional[str]):
+    """
+    Called when the analysis that launched a run ends. Fetches no node collected (the
+    node was served from the node cache, or routing skipped it) are cancelled.
+    """
+    run = _runs.pop(run_id, None) if run_id else None
+    if run:
+        run.cancel()
+        print(f"Uncollected speculative fetches for {run.stock_ticker} discarded: {', '.join(run.tasks)}.")
+
+def speculative_node(name: str, node: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                     finish: Callable[[Any, Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]:
+    """
+    Wraps an async fetch node so it uses the speculative result when one was launched.
+    `finish(result, state)` turns that result into the node's output, merging in
+    anything that needed Screener (such as the company name).
+    """
+    async def run_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        result = await collect(state.get("speculation_id"), name)
+        if result is None:
+            return await node(state)
+        return await finish(result, state)
+    run_node.__name__ = getattr(node, "__name__", name)
+    return run_node
@@ -1,27 +1,36 @@
-import matplotlib
-# Set the backend to a non-interactive one BEFORE importing plotting libraries
-matplotlib.use('Agg')
-
-import yfinance as yf
-import pandas as pd
-import pandas_ta as ta
-import mplfinance as mpf
-import numpy as np
+from __future__ import annotations   # Annotations below must not touch the lazy pandas module
+
+import io
 import os
+import asyncio
+import tempfile
 from typing import Dict, Any, List
 import pprint
-from scipy.signal import argrelextrema
+
+from stock_analyzer.deadlines import YFINANCE_TIMEOUT
+from stock_analyzer.http_client import get_http_client
+from stock_analyzer.lazy import lazy_module, use_agg_backend
+from stock_analyzer.metrics import track_call
+from stock_analyzer import report_charts
+
+# Imported on first use: these dominate the web process's import time.
+yf = lazy_module("yfinance")
+pd = lazy_module("pandas")
+ta = lazy_module("pandas_ta")
+np = lazy_module("numpy")
+signal = lazy_module("scipy.signal")
+mpf = lazy_module("mplfinance", setup=use_agg_backend)   # The backend must be set BEFORE plotting libraries load
+plt = lazy_module("matplotlib.pyplot", setup=use_agg_backend)
 
 DATA_PERIOD = "1y"
 DATA_INTERVAL = "1d"
 CHART_OUTPUT_DIR = "charts"
-os.makedirs(CHART_OUTPUT_DIR, exist_ok=True)
 
 def _find_support_resistance(prices: pd.Series, order: int = 5) -> (List[float], List[float]):
     """Find support and resistance levels using local extrema."""
     try:
-        local_min_indices = argrelextrema(prices.values, np.less_equal, order=order)[0]
-        local_max_indices = argrelextrema(prices.values, np.greater_equal, order=order)[0]
+        local_min_indices = signal.argrelextrema(prices.values, np.less_equal, order=order)[0]
+        local_max_indices = signal.argrelextrema(prices.values, np.greater_equal, order=order)[0]
         support_levels = prices.iloc[local_min_indices].tail(3).tolist()
         resistance_levels = prices.iloc[local_max_indices].tail(3).tolist()
         return sorted(support_levels, reverse=True), sorted(resistance_levels)
@@ -67,39 +76,51 @@ def _create_technical_summary(df: pd.DataFrame, support_levels: List, resistance
 
     return summary
 
-def fetch_technical_analysis(state: Dict[str, Any]) -> Dict[str, Any]:
-    print("---NODE: Performing Analyst-Grade Technical Analysis---")
-    try:
-        stock_ticker = state["stock_ticker"]
-        company_name = state.get("company_name", stock_ticker)
-    except KeyError as e:
-        print(f"Error: Missing 'stock_ticker' in state - {e}")
-        return {"technical_analysis": {"error": f"Missing ticker: {e}"}}
+def _compute_technicals(df_raw: pd.DataFrame) -> Dict[str, Any]:
+    """Indicators, support/resistance and the summary for a raw OHLCV frame. CPU-bound."""
+    if isinstance(df_raw.columns, pd.MultiIndex):
+        print("MultiIndex detected, flattening columns.")
+        df_raw.columns = df_raw.columns.get_level_values(0)
 
-    print(f"Fetching historical data for {stock_ticker}...")
+    df = df_raw[['Open', 'High', 'Low', 'Close', 'Volume']].copy()
 
+    ta.load()   # Registers the DataFrame.ta accessor
+    df.ta.rsi(append=True)
+    df.ta.macd(append=True)
+    df.ta.sma(length=50, append=True)
+    df.ta.sma(length=200, append=True)
+    df.ta.bbands(append=True)
+
+    support_levels, resistance_levels = _find_support_resistance(df['Close'].tail(120), order=5)
+    summary = _create_technical_summary(df, support_levels, resistance_levels)
+    return {"df": df, "summary": summary, "support_levels": support_levels, "resistance_levels": resistance_levels}
+
+def _download_technical_data(stock_ticker: str) -> Dict[str, Any]:
+    """Blocking yfinance download of the price history, for when the chart endpoint fails."""
+    print(f"Fetching historical data for {stock_ticker}...")
     try:
-        df_raw = yf.download(
-            stock_ticker, period=DATA_PERIOD, interval=DATA_INTERVAL,
-            progress=False, auto_adjust=True, actions=False
-        )
+        with track_call("yfinance"):
+            df_raw = yf.download(
+                stock_ticker, period=DATA_PERIOD, interval=DATA_INTERVAL,
+                progress=False, auto_adjust=True, actions=False, timeout=YFINANCE_TIMEOUT
+            )
         if df_raw.empty:
-            return {"technical_analysis": {"error": "No technical data found for this ticker."}}
-        
-        if isinstance(df_raw.columns, pd.MultiIndex):
-            print("MultiIndex detected, flattening columns.")
-            df_raw.columns = df_raw.columns.get_level_values(0)
+            return {"error": "No technical data found for this ticker."}
+        return _compute_technicals(df_raw)
 
-        df = df_raw[['Open', 'High', 'Low', 'Close', 'Volume']].copy()
-
-        df.ta.rsi(append=True)
-        df.ta.macd(append=True)
-        df.ta.sma(length=50, append=True)
-        df.ta.sma(length=200, append=True)
-        df.ta.bbands(append=True)
+    except Exception as e:
+        print(f"Technical analysis failed for {stock_ticker}: {e}")
+        import traceback
+        traceback.print_exc()
+        return {"error": f"Analysis failed: {e}"}
 
-        support_levels, resistance_levels = _find_support_resistance(df['Close'].tail(120), order=5)
-        summary = _create_technical_summary(df, support_levels, resistance_levels)
+def render_technical_analysis(data: Dict[str, Any], stock_ticker: str, company_name: str) -> Dict[str, Any]:
+    """Draws the chart for data from afetch_technical_data and builds the node output. CPU-bound."""
+    if data.get("error"):
+        return {"technical_analysis": {"error": data["error"]}}
+    try:
+        df, summary = data["df"], data["summary"]
+        support_levels, resistance_levels = data["support_levels"], data["resistance_levels"]
         plot_df = df.tail(120).copy()
         hlines = dict(hlines=support_levels + resistance_levels, 
                       colors=['g']*len(support_levels) + ['r']*len(resistance_levels), 
@@ -111,21 +132,108 @@ def fetch_technical_analysis(state: Dict[str, Any]) -> Dict[str, Any]:
             mpf.make_addplot(plot_df['RSI_14'], panel=2, color='purple', ylabel='RSI')
         ]
         
+        os.makedirs(CHART_OUTPUT_DIR, exist_ok=True)
         chart_path = os.path.join(CHART_OUTPUT_DIR, f"{stock_ticker.replace('.', '_')}_chart.png")
         title = f"Technical Analysis for {company_name}\nTrend: {summary.get('Trend Bias', 'N/A')}"
 
-        mpf.plot(
+        # Saved and closed here rather than via savefig=: pyplot keeps every figure alive until
+        # it is closed, so a figure left open (e.g. by a failed save) would leak for good.
+        fig, _ = mpf.plot(
             plot_df, type='candle', style='yahoo', title=title,
             ylabel='Price (INR)', volume=True, addplot=addplots,
             panel_ratios=(4, 1), figsize=(12, 7),
-            savefig=chart_path, hlines=hlines
+            hlines=hlines, returnfig=True, closefig=False
         )
+        try:
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format="png")
+        finally:
+            plt.close(fig)
+        png = buffer.getvalue()
+        # Sent to Telegram from the file; the PDF takes the in-memory copy. Written to a temp
+        # file and renamed into place, so a concurrent run for the same ticker never sends or
+        # embeds a half-written chart.
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{stock_ticker.replace('.', '_')}_", suffix=".png", dir=CHART_OUTPUT_DIR)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(png)
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns   # The rename keeps it
+            os.replace(tmp_path, chart_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        report_charts.remember_chart(chart_path, png, mtime_ns)
         print(f"Chart saved to: {chart_path}")
 
         return {"technical_analysis": {"summary": summary, "chart_path": chart_path}}
 
     except Exception as e:
-        print(f"Technical analysis failed for {stock_ticker}: {e}")
+        print(f"Technical chart failed for {stock_ticker}: {e}")
         import traceback
         traceback.print_exc()
-        return {"technical_analysis": {"error": f"Analysis failed: {e}"}}
\ No newline at end of file
+        return {"technical_analysis": {"error": f"Analysis failed: {e}"}}
+
+
+# --- Node ---
+# yfinance is blocking, so price history is read from Yahoo's chart endpoint (the one
+# yfinance uses for history) with the shared httpx client. Indicator maths and
+# chart drawing are CPU-bound and run in worker threads.
+
+YAHOO_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{ticker}"
+
+def _chart_json_to_frame(payload: Dict[str, Any]) -> pd.DataFrame:
+    """OHLCV frame from a chart response, adjusted for splits and dividends like auto_adjust=True."""
+    result = payload["chart"]["result"][0]
+    quote = result["indicators"]["quote"][0]
+    df = pd.DataFrame({
+        "Open": quote["open"], "High": quote["high"], "Low": quote["low"],
+        "Close": quote["close"], "Volume": quote["volume"],
+    }, index=pd.to_datetime(result["timestamp"], unit="s").normalize())
+    adjclose = (result["indicators"].get("adjclose") or [{}])[0].get("adjclose")
+    if adjclose:
+        ratio = pd.Series(adjclose, index=df.index) / df["Close"]
+        for column in ("Open", "High", "Low", "Close"):
+            df[column] = df[column] * ratio
+    return df.dropna(subset=["Close"])
+
+async def afetch_technical_data(stock_ticker: str) -> Dict[str, Any]:
+    """
+    Downloads price history and computes indicators and the summary. Only needs the
+    ticker, so it can run before the company name is known. Falls back to yfinance in a
+    thread if the chart endpoint fails.
+    """
+    print(f"Fetching historical data for {stock_ticker}...")
+    try:
+        with track_call("yahoo_chart"):
+            response = await get_http_client().get(
+                YAHOO_CHART_URL.format(ticker=stock_ticker),
+                params={"range": DATA_PERIOD, "interval": DATA_INTERVAL, "events": "div,splits"},
+                timeout=YFINANCE_TIMEOUT,
+            )
+            response.raise_for_status()
+        df_raw = _chart_json_to_frame(response.json())
+    except Exception as e:
+        print(f"Yahoo chart endpoint failed for {stock_ticker} ({e}); using yfinance.")
+        return await asyncio.to_thread(_download_technical_data, stock_ticker)
+
+    if df_raw.empty:
+        return {"error": "No technical data found for this ticker."}
+    try:
+        return await asyncio.to_thread(_compute_technicals, df_raw)
+    except Exception as e:
+        print(f"Technical analysis failed for {stock_ticker}: {e}")
+        return {"error": f"Analysis failed: {e}"}
+
+async def arender_technical_analysis(data: Dict[str, Any], stock_ticker: str, company_name: str) -> Dict[str, Any]:
+    return await asyncio.to_thread(render_technical_analysis, data, stock_ticker, company_name)
+
+async def afetch_technical_analysis(state: Dict[str, Any]) -> Dict[str, Any]:
+    print("---NODE: Performing Analyst-Grade Technical Analysis---")
+    try:
+        stock_ticker = state["stock_ticker"]
+        company_name = state.get("company_name", stock_ticker)
+    except KeyError as e:
+        print(f"Error: Missing 'stock_ticker' in state - {e}")
+        return {"technical_analysis": {"error": f"Missing ticker: {e}"}}
+
+    return await arender_technical_analysis(await afetch_technical_data(stock_ticker), stock_ticker, company_name)
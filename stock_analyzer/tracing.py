@@ -0,0 +1,138 @@
+# In stock_analyzer/tracing.py
+#
+# Per-request tracing without an external collector. process_analysis_and_reply starts
+# a trace; graph nodes and outbound calls open spans under it. The current span lives
+# in a contextvar, so it follows the request into LangGraph's node tasks, speculative
+# fetch tasks and asyncio.to_thread workers. Finished spans are appended as JSON lines
+# to traces/spans-YYYYMMDD.jsonl by a background writer thread.
+
+import asyncio
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# --- Configuration ---
+TRACING_ENABLED = os.getenv("TRACING", "true").lower() == "true"
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "started", "_perf_started", "status")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.started = time.time()
+        self._perf_started = time.perf_counter()
+        self.status = "ok"
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "start": round(self.started, 6),
+            "duration_ms": round((time.perf_counter() - self._perf_started) * 1000, 3),
+            "status": self.status, "attributes": self.attributes,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+# --- Exporter ---
+
+class _JsonLinesExporter:
+    """Appends span records to a daily file from a background thread, so recording never blocks the event loop."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._queue: "queue.SimpleQueue[Dict[str, Any]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, record: Dict[str, Any]):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                    self._thread.start()
+        self._queue.put(record)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"spans-{datetime.now().strftime('%Y%m%d')}.jsonl")
+                with open(path, "a", encoding="utf-8") as spans_file:
+                    spans_file.writelines(json.dumps(record, default=str) + "\n" for record in batch)
+            except OSError as e:
+                print(f"Could not write {len(batch)} span(s): {e}")
+
+
+_exporter = _JsonLinesExporter(TRACE_DIR)
+_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+
+# --- API ---
+
+def add_span_listener(listener: Callable[[Dict[str, Any]], None]):
+    """Also hands every finished span record to `listener` (called inline, so it must be cheap)."""
+    _listeners.append(listener)
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+@contextmanager
+def _open_span(name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> Iterator[Span]:
+    span = Span(name, trace_id, parent_id, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        span.set("error", repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        record = span.to_record()
+        _exporter.export(record)
+        for listener in _listeners:
+            listener(record)
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Opens the root span of a new trace (one per chat request)."""
+    if not TRACING_ENABLED:
+        yield None
+        return
+    with _open_span(name, uuid.uuid4().hex, None, attributes) as span:
+        yield span
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Opens a child of the current span; a no-op outside a trace, so library code can always call it."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with _open_span(name, parent.trace_id, parent.span_id, attributes) as child:
+        yield child
@@ -0,0 +1,114 @@
+import asyncio
+import sqlite3
+import time
+from collections import deque
+from typing import Optional
+
+from db_manager import get_db_connection, run_db
+from stock_analyzer.metrics import DUPLICATE_UPDATES
+
+# --- Configuration ---
+DEDUP_WINDOW_SIZE = 5000                 # Recent update_ids remembered in memory
+PERSIST_INTERVAL_SECONDS = 1.0           # How often the high-water mark is written to disk
+SUMMARY_INTERVAL_SECONDS = 300           # How often suppressed duplicates are logged, as one line
+HIGH_WATER_MARK_KEY = "telegram_update_id_hwm"
+
+
+class UpdateDeduplicator:
+    """
+    Suppresses Telegram webhook redeliveries.
+
+    An update is a duplicate if its update_id is still in the in-memory window, or if it is
+    not newer than the floor: the oldest id evicted from the window, or the high-water mark
+    persisted by a previous process.
+    """
+
+    def __init__(self, window_size: int = DEDUP_WINDOW_SIZE):
+        self.window_size = window_size
+        self.high_water_mark: Optional[int] = None
+        self.duplicates_suppressed = 0
+        self._summarized = 0
+        self._floor: Optional[int] = None
+        self._seen: set[int] = set()
+        self._order: deque[int] = deque()
+        self._persisted: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def is_duplicate(self, update_id: int) -> bool:
+        """Records the update_id and reports whether it was already processed."""
+        if update_id in self._seen or (self._floor is not None and update_id <= self._floor):
+            # Logged in the periodic summary: a redelivery burst would otherwise print a line each
+            self.duplicates_suppressed += 1
+            DUPLICATE_UPDATES.inc()
+            return True
+
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        if len(self._order) > self.window_size:
+            evicted = self._order.popleft()
+            self._seen.discard(evicted)
+            self._floor = evicted if self._floor is None else max(self._floor, evicted)
+        if self.high_water_mark is None or update_id > self.high_water_mark:
+            self.high_water_mark = update_id
+        return False
+
+    # --- Persistence ---
+
+    def load(self):
+        """Reads the high-water mark left by the previous process."""
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            row = conn.execute("SELECT value FROM webhook_state WHERE key = ?", (HIGH_WATER_MARK_KEY,)).fetchone()
+            if row:
+                self.high_water_mark = self._persisted = self._floor = int(row["value"])
+                print(f"Loaded Telegram update high-water mark: {self.high_water_mark}")
+        except sqlite3.Error as e:
+            print(f"Error loading update high-water mark: {e}")
+
+    def persist(self):
+        """Writes the high-water mark if it moved since the last write."""
+        hwm = self.high_water_mark
+        if hwm is None or hwm == self._persisted:
+            return
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            with conn:
+                conn.execute("""
+                    INSERT INTO webhook_state (key, value) VALUES (?, ?)
+                    ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value);
+                """, (HIGH_WATER_MARK_KEY, hwm))
+            self._persisted = hwm
+        except sqlite3.Error as e:
+            print(f"Error persisting update high-water mark: {e}")
+
+    async def start(self):
+        await run_db(self.load)
+        self._task = asyncio.create_task(self._persist_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await run_db(self.persist)
+        self.log_summary()
+
+    def log_summary(self):
+        """Prints how many duplicates were suppressed since the last summary, if any."""
+        suppressed = self.duplicates_suppressed - self._summarized
+        if suppressed:
+            self._summarized = self.duplicates_suppressed
+            print(f"Suppressed {suppressed} duplicate Telegram updates (total: {self.duplicates_suppressed}).")
+
+    async def _persist_loop(self):
+        last_summary = time.monotonic()
+        while True:
+            await asyncio.sleep(PERSIST_INTERVAL_SECONDS)
+            await run_db(self.persist)
+            if time.monotonic() - last_summary >= SUMMARY_INTERVAL_SECONDS:
+                self.log_summary()
+                last_summary = time.monotonic()
@@ -0,0 +1,114 @@
+import asyncio
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from db_manager import get_db_connection, run_db, REGISTER_USER_SQL, LOAD_USERS_SQL
+
+# --- Configuration ---
+FLUSH_INTERVAL_SECONDS = 0.025           # Registrations arriving within this window share one commit
+
+
+class KnownUserIndex:
+    """
+    In-memory set of registered chat_ids, loaded once at startup.
+
+    Known users are answered from memory. A chat_id that is not in the set is buffered and
+    written with REGISTER_USER_SQL on the next flush; the statement's rowcount decides whether
+    the user is new, so the answer stays correct when several uvicorn workers share sessions.db
+    and each worker's set only knows about its own registrations.
+    """
+
+    def __init__(self):
+        self._known: set[int] = set()
+        self._pending: Dict[int, List[asyncio.Future]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._known
+
+    def __len__(self) -> int:
+        return len(self._known)
+
+    async def start(self):
+        self._known = await run_db(_load_user_ids)
+        print(f"Known-user index loaded with {len(self._known)} user(s).")
+        self._stopping = False
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Drains the buffer: the flush loop finishes its batch and exits, then anything left is written."""
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._flush()
+
+    async def register(self, chat_id: int) -> bool:
+        """Returns True exactly once per user, the first time they are seen by any worker."""
+        if chat_id in self._known:
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(chat_id, []).append(future)
+        self._wakeup.set()
+        if self._task is None:
+            await self._flush()  # Not started or already stopped: nothing else will write it
+        return await future
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            await self._wakeup.wait()
+            if not self._stopping:
+                # Let other /start messages in the same burst join this batch.
+                await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+            self._wakeup.clear()
+            await self._flush()
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        inserted: Optional[set[int]] = None
+        try:
+            inserted = await run_db(_insert_users, list(batch))
+        except Exception as e:
+            print(f"Error registering {len(batch)} user(s): {e}")
+        finally:
+            # Every waiter is answered, even if the write failed or this flush was cancelled;
+            # a user whose registration is uncertain just gets no welcome message.
+            for chat_id, futures in batch.items():
+                if inserted is not None:
+                    self._known.add(chat_id)
+                # Only the first /start from a brand-new user gets the welcome message.
+                is_new = inserted is not None and chat_id in inserted
+                for future in futures:
+                    if not future.done():
+                        future.set_result(is_new)
+                    is_new = False
+
+
+def _load_user_ids() -> set[int]:
+    conn = get_db_connection()
+    if not conn:
+        return set()
+    try:
+        return {row["chat_id"] for row in conn.execute(LOAD_USERS_SQL)}
+    except sqlite3.Error as e:
+        print(f"Error loading known users: {e}")
+        return set()
+
+def _insert_users(chat_ids: List[int]) -> set[int]:
+    """Registers a batch in one transaction and returns the chat_ids that were actually new."""
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Known-user index could not open the database.")
+    now = datetime.now()
+    inserted = set()
+    with conn:
+        for chat_id in chat_ids:
+            if conn.execute(REGISTER_USER_SQL, (chat_id, now)).rowcount == 1:
+                inserted.add(chat_id)
+    return inserted